@@ -0,0 +1,129 @@
+# Long-range report math: NumPy over the cached columnar history vs. the same numbers computed in SQL.
+# Run from the telegram_bot directory: python -m benchmarks.analytics [years] [expenses_per_day]
+import asyncio
+import datetime as dt
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+YEARS = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+PER_DAY = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+RUNS = 20
+USER_ID = 1
+CATEGORIES = ("Їжа", "Паливо", "Розваги", "Інше")
+
+SQL_MONTHLY = (
+    "SELECT substr(date, 1, 7), category_id, SUM(amount) FROM expenses "
+    "WHERE user_id = ? AND date >= ? GROUP BY 1, 2"
+)
+SQL_ROLLING = """
+WITH days AS (
+    SELECT date, SUM(amount) AS total FROM expenses WHERE user_id = ? AND date BETWEEN ? AND ? GROUP BY date
+)
+SELECT date, AVG(total) OVER (ORDER BY date ROWS 29 PRECEDING) FROM days
+"""
+SQL_CORRELATION = """
+WITH pairs AS (
+    SELECT m.value AS x, COALESCE(SUM(e.amount), 0) AS y
+    FROM mood m LEFT JOIN expenses e ON e.user_id = m.user_id AND e.date = m.date
+    WHERE m.user_id = ? AND m.date BETWEEN ? AND ?
+    GROUP BY m.date
+)
+SELECT COUNT(*), SUM(x), SUM(y), SUM(x * x), SUM(y * y), SUM(x * y) FROM pairs
+"""
+SQL_FUEL = """
+SELECT
+    (SELECT TOTAL(amount) FROM expenses WHERE user_id = ? AND category_id = ? AND date BETWEEN ? AND ?),
+    (SELECT TOTAL(value) FROM mileage WHERE user_id = ? AND date BETWEEN ? AND ?)
+"""
+
+
+async def fill(db, today: dt.date):
+    start = today - dt.timedelta(days=365 * YEARS)
+    rows = {"expenses": [], "salary": [], "mood": [], "mileage": []}
+    for offset in range(365 * YEARS + 1):
+        day = (start + dt.timedelta(days=offset)).isoformat()
+        for _ in range(random.randint(0, PER_DAY * 2)):
+            rows["expenses"].append((USER_ID, day, random.choice(CATEGORIES), round(random.uniform(1, 80), 2)))
+        rows["mood"].append((USER_ID, day, random.randint(0, 1)))
+        rows["mileage"].append((USER_ID, day, round(random.uniform(0, 120), 1)))
+        if offset % 30 == 0:
+            rows["salary"].append((USER_ID, day, 2500.0))
+    await db.bulk_insert(rows)
+    return len(rows["expenses"])
+
+
+async def with_numpy(today: dt.date):
+    import numpy as np
+    from utils import analytics
+
+    history = await analytics.get_history(USER_ID)
+    day = np.datetime64(today, "D")
+    first_month = day.astype("datetime64[M]") - (12 * YEARS - 1)
+    analytics.monthly_by_category(history, first_month, 12 * YEARS)
+    analytics.rolling_mean(analytics.daily_series(history.expense_days, history.expense_amounts, day - 364, day), 30)
+    analytics.mood_spending_correlation(history, day - 364, day)
+    analytics.fuel_cost_per_km(history, day - 364, day)
+
+
+async def with_sql(db, today: dt.date):
+    year_ago = (today - dt.timedelta(days=364)).isoformat()
+    first_month = dt.date(today.year - YEARS + (today.month == 12), today.month % 12 + 1, 1).isoformat()
+    end = today.isoformat()
+    fuel_id = (await db.get_category(USER_ID, "Паливо"))[0]
+    async with db._read() as conn:
+        async with conn.execute(SQL_MONTHLY, (USER_ID, first_month)) as cursor:
+            await cursor.fetchall()
+        async with conn.execute(SQL_ROLLING, (USER_ID, year_ago, end)) as cursor:
+            await cursor.fetchall()
+        async with conn.execute(SQL_CORRELATION, (USER_ID, year_ago, end)) as cursor:
+            n, sx, sy, sxx, syy, sxy = await cursor.fetchone()
+        math.sqrt(max((n * sxx - sx * sx) * (n * syy - sy * sy), 0))
+        async with conn.execute(SQL_FUEL, (USER_ID, fuel_id, year_ago, end, USER_ID, year_ago, end)) as cursor:
+            await cursor.fetchone()
+
+
+async def measure(name, call, before=None):
+    samples = []
+    for _ in range(RUNS):
+        if before:
+            await before()
+        started = time.perf_counter()
+        await call()
+        samples.append((time.perf_counter() - started) * 1000)
+    print(f"{name:<36} mean {statistics.mean(samples):8.2f} ms   min {min(samples):8.2f} ms")
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DB_PATH"] = os.path.join(tmp, "bench.db")
+        from db.manager import db
+        from utils import analytics
+
+        today = dt.date.today()
+        await db.create_tables()
+        try:
+            count = await fill(db, today)
+            print(f"{YEARS} years, {count} expenses")
+
+            async def forget():
+                analytics._histories.clear()
+
+            async def add_today():
+                await db.add_expense(USER_ID, today.isoformat(), "Їжа", 9.99)
+                await db.add_mood(USER_ID, today.isoformat(), 1)
+
+            await measure("SQL (4 queries)", lambda: with_sql(db, today))
+            await measure("NumPy, cold (load + compute)", lambda: with_numpy(today), forget)
+            await measure("NumPy, warm (cached arrays)", lambda: with_numpy(today))
+            await measure("NumPy, after new rows (append)", lambda: with_numpy(today), add_today)
+        finally:
+            await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+# Budget check after each expense: the month's spending summed from the expenses table on every entry vs. the
+# running totals DatabaseManager keeps in memory, both cold (the month's first check, or the first one after a
+# restart, which reads the totals from the table) and warm. Run from the telegram_bot directory:
+#   python -m benchmarks.budgets [entries] [expenses_per_month]
+import asyncio
+import datetime as dt
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ENTRIES = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+PER_MONTH = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+MONTHS = 24
+USER_ID = 1
+CATEGORIES = ("Їжа", "Паливо", "Розваги", "Інше")
+
+SQL_MONTH_SPENT = (
+    "SELECT TOTAL(amount) FROM expenses WHERE user_id = ? AND category_id = ? AND date BETWEEN ? AND ?"
+)
+
+
+async def fill(db, today: dt.date):
+    rows = []
+    for month in range(MONTHS):
+        first = dt.date(today.year, today.month, 1) - dt.timedelta(days=31 * month)
+        for _ in range(PER_MONTH):
+            day = first.replace(day=random.randint(1, 28)).isoformat()
+            rows.append((USER_ID, day, random.choice(CATEGORIES), round(random.uniform(1, 80), 2)))
+    await db.bulk_insert({"expenses": rows})
+    return len(rows)
+
+
+async def measure(name, entry):
+    samples = []
+    for i in range(ENTRIES):
+        started = time.perf_counter()
+        await entry(i)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{name:<28} mean {statistics.mean(samples):7.3f} ms   p50 {samples[len(samples) // 2]:7.3f} ms   p95 {p95:7.3f} ms")
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DB_PATH"] = os.path.join(tmp, "bench.db")
+        from db.manager import db
+
+        today = dt.date.today().isoformat()
+        month = today[:7]
+        await db.create_tables()
+        try:
+            print(f"{await fill(db, dt.date.today())} expenses over {MONTHS} months")
+            ids = await db.category_ids(USER_ID, CATEGORIES)
+
+            async def with_sql(i):
+                category = CATEGORIES[i % len(CATEGORIES)]
+                await db.add_expense(USER_ID, today, category, 1.0)
+                async with db._read() as conn:
+                    async with conn.execute(
+                        SQL_MONTH_SPENT, (USER_ID, ids[category], f"{month}-01", f"{month}-31")
+                    ) as cursor:
+                        await cursor.fetchone()
+
+            async def with_running_totals(i):
+                category = CATEGORIES[i % len(CATEGORIES)]
+                await db.add_expense(USER_ID, today, category, 1.0)
+                (await db.get_month_spending(USER_ID, month)).get(ids[category], 0)
+
+            async def with_cold_totals(i):
+                db._month_spending.pop(USER_ID, None)
+                await with_running_totals(i)
+
+            await measure("SQL sum per entry", with_sql)
+            await measure("running totals, cold", with_cold_totals)
+            await measure("running totals, warm", with_running_totals)
+        finally:
+            await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
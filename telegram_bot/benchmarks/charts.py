@@ -0,0 +1,91 @@
+# Chart render times, event-loop stalls (inline vs. process pool) and cache hit rates under a report-heavy mix.
+# Run from the telegram_bot directory: python -m benchmarks.charts [users] [requests]
+import asyncio
+import datetime as dt
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+REQUESTS = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+KINDS = ("week", "categories", "mood", "mileage")
+
+
+async def loop_lag(stop: asyncio.Event, samples: list):
+    # How late a 5 ms sleep wakes up: what every other chat waits while a chart renders
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.005)
+        samples.append((time.perf_counter() - started - 0.005) * 1000)
+
+
+async def with_lag(call):
+    stop, samples = asyncio.Event(), []
+    probe = asyncio.create_task(loop_lag(stop, samples))
+    await asyncio.sleep(0.001)  # let the probe start sleeping
+    started = time.perf_counter()
+    await call()
+    elapsed = (time.perf_counter() - started) * 1000
+    stop.set()
+    await probe
+    return elapsed, max(samples, default=0.0)
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DB_PATH"] = os.path.join(tmp, "bench.db")
+        from db.manager import db
+        from utils import analytics, charts
+        from benchmarks import analytics as data
+
+        today = dt.date.today()
+        await db.create_tables()
+        try:
+            for user_id in range(1, USERS + 1):
+                data.USER_ID = user_id
+                data.YEARS = 1
+                await data.fill(db, today)
+
+            started = time.perf_counter()
+            charts.warm_up()
+            await charts.chart(1, "week", today)
+            print(f"pool start + first chart      {(time.perf_counter() - started) * 1000:8.0f} ms")
+
+            # Same work done inline on the event loop, for comparison
+            charts._warm_up()
+            history = await analytics.get_history(1)
+            day = charts.np.datetime64(today, "D")
+            for kind in KINDS:
+                render, args = charts.CHARTS[kind](history, day)
+                inline, inline_lag = await with_lag(lambda: asyncio.sleep(0, render(*args)))
+                charts._cache.clear()
+                pooled, pooled_lag = await with_lag(lambda: charts.chart(1, kind, today))
+                print(f"{kind:<10} inline {inline:6.1f} ms (loop stalled {inline_lag:6.1f} ms)   "
+                      f"pool {pooled:6.1f} ms (loop stalled {pooled_lag:5.1f} ms)")
+
+            # Report traffic: users reopen reports, and now and then log something that invalidates their charts
+            charts._cache.clear()
+            charts.stats.update(hits=0, misses=0, renders=0)
+            latencies = []
+            for _ in range(REQUESTS):
+                user_id = random.randint(1, USERS)
+                if random.random() < 0.1:
+                    await db.add_expense(user_id, today.isoformat(), "Їжа", 5.0)
+                started = time.perf_counter()
+                await charts.chart(user_id, random.choice(KINDS), today)
+                latencies.append((time.perf_counter() - started) * 1000)
+            stats = charts.stats
+            latencies.sort()
+            print(f"{REQUESTS} requests, {USERS} users: hit rate {stats['hits'] / REQUESTS:.0%}, "
+                  f"{stats['renders']} renders, p50 {statistics.median(latencies):.2f} ms, "
+                  f"p95 {latencies[int(len(latencies) * 0.95)]:.2f} ms")
+        finally:
+            charts.close()
+            await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+# Per-call latency of DatabaseManager: a fresh aiosqlite.connect() per call vs. the pooled, write-behind manager.
+# Run from the telegram_bot directory: python -m benchmarks.db_latency [calls]
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+import aiosqlite
+from db.manager import DatabaseManager
+from utils.categories import DEFAULT_CATEGORIES, category_key
+
+CALLS = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+USER_ID = 1
+
+
+class PerCallManager(DatabaseManager):
+    # The pre-pool behaviour: open, execute, commit and close on every call
+    async def create_tables(self):
+        with open("db/schema.sql", "r") as f:
+            schema = f.read()
+
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.executescript(schema)
+            await db.executemany(
+                "INSERT INTO categories (user_id, name, key) VALUES (?, ?, ?)",
+                [(USER_ID, name, category_key(name)) for name in DEFAULT_CATEGORIES]
+            )
+            await db.commit()
+
+    async def add_expense(self, user_id: int, date: str, category: str, amount: float):
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute(
+                "INSERT INTO expenses (user_id, date, category_id, amount) "
+                "SELECT ?, ?, id, ? FROM categories WHERE user_id = ? AND key = ?",
+                (user_id, date, amount, user_id, category_key(category))
+            )
+            await db.commit()
+
+    async def get_weekly_stats(self, user_id: int, start_date: str, end_date: str):
+        async with aiosqlite.connect(self.db_path) as db:
+            async with db.execute(
+                "SELECT SUM(amount) FROM expenses WHERE user_id = ? AND date BETWEEN ? AND ?",
+                (user_id, start_date, end_date)
+            ) as cursor:
+                return (await cursor.fetchone())[0]
+
+
+async def measure(name, call):
+    samples = []
+    for i in range(CALLS):
+        started = time.perf_counter()
+        await call(i)
+        samples.append((time.perf_counter() - started) * 1000)
+
+    samples.sort()
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{name:<28} mean {statistics.mean(samples):7.3f} ms   p50 {samples[len(samples) // 2]:7.3f} ms   p95 {p95:7.3f} ms")
+
+
+async def concurrent_writes(manager, label):
+    # Many handlers writing at once, until everything is committed
+    started = time.perf_counter()
+    await asyncio.gather(*(manager.add_expense(USER_ID, "2024-01-02", "Паливо", i) for i in range(CALLS)))
+    await manager.get_weekly_stats(USER_ID, "2024-01-01", "2024-01-07")
+    elapsed = time.perf_counter() - started
+    print(f"{label + ' concurrent writes':<28} {CALLS / elapsed:9.0f} rows/s")
+
+
+async def run(manager, label):
+    await manager.create_tables()
+    await measure(f"{label} add_expense", lambda i: manager.add_expense(USER_ID, "2024-01-01", "Їжа", i))
+    await measure(f"{label} get_weekly_stats", lambda i: manager.get_weekly_stats(USER_ID, "2024-01-01", "2024-01-07"))
+    await concurrent_writes(manager, label)
+    await manager.close()
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        await run(PerCallManager(os.path.join(tmp, "per_call.db")), "per-call")
+        pooled = DatabaseManager(os.path.join(tmp, "pooled.db"))
+        await run(pooled, "pooled")
+        stats = pooled.write_stats
+        print(
+            f"write-behind: {stats['flushes']} flushes, max batch {stats['max_batch_size']}, "
+            f"mean flush {stats['total_flush_ms'] / max(stats['flushes'], 1):.3f} ms"
+        )
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,169 @@
+# Fault injection for the upstream client (utils/http.py) against local stub servers: flaky, slow, hanging and
+# failing upstreams. Each scenario checks what the retries, hedging, timeouts and circuit breaker should achieve
+# and the script exits with 1 if any check fails. The checks on shares and percentiles make their calls one at a
+# time, against seeded failures and evenly spread slow responses, so they give the same answer on every run. Run
+# from the telegram_bot directory:
+#   python -m benchmarks.faults [calls]
+import asyncio
+import logging
+import sys
+import time
+from benchmarks.stubs import UpstreamStubs
+from utils import http, weather
+from utils.http import CircuitOpenError, close_client, get_json, upstream
+
+CALLS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+# Shares and percentiles need enough samples: at 20 calls a 5% slow tail may not show up at all, and one call
+# left slow after hedging is already the p99
+SAMPLE_CALLS = max(CALLS, 200)
+SEED = 1
+PARAMS = {"latitude": "50.45", "longitude": "30.52", "current": "temperature_2m"}
+failed = []
+
+
+def check(name: str, ok: bool, detail: str):
+    print(f"  {'ok  ' if ok else 'FAIL'} {name}: {detail}")
+    if not ok:
+        failed.append(name)
+
+
+def policy(stubs: UpstreamStubs, **attrs):
+    # A fresh policy for the stub's host: defaults from config, overridden by attrs ("failures"/"reset" go to
+    # the breaker)
+    target = upstream(stubs.base_url.split("/")[2])
+    target.timeout, target.retries, target.hedge_after = 2, 0, 0
+    target.breaker.failures, target.breaker.reset = 1000, 30
+    target.breaker.success()
+    for key, value in attrs.items():
+        setattr(target.breaker if key in ("failures", "reset") else target, key, value)
+    return target
+
+
+def p(samples: list, share: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * share))]
+
+
+async def run(url: str, calls: int = CALLS, concurrency: int = 20):
+    # (latencies in ms of the calls that succeeded, number of failed calls)
+    latencies, errors = [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await get_json(url, PARAMS)
+            except Exception:
+                errors += 1
+                return
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(one() for _ in range(calls)))
+    return latencies, errors
+
+
+async def healthy(stubs: UpstreamStubs, url: str):
+    print("healthy upstream")
+    policy(stubs, retries=2)
+    latencies, errors = await run(url)
+    check("every call answered", errors == 0, f"{errors} errors, p50 {p(latencies, 0.5):.1f} ms")
+
+
+async def seeded(stubs: UpstreamStubs, url: str, **attrs):
+    # Sequential calls from a fresh seed: every request gets the same failure or delay on every run
+    policy(stubs, **attrs)
+    stubs.random.seed(SEED)
+    return await run(url, SAMPLE_CALLS, concurrency=1)
+
+
+async def flaky(stubs: UpstreamStubs, url: str):
+    print("30% of responses are 503")
+    stubs.flaky["open_meteo"] = 0.3
+    backoff, http.HTTP_BACKOFF = http.HTTP_BACKOFF, 0.005  # The waits are not what is being checked
+    _, without = await seeded(stubs, url, retries=0)
+    _, errors = await seeded(stubs, url, retries=3)
+    http.HTTP_BACKOFF = backoff
+    stubs.flaky.clear()
+    check(
+        "retries recover", errors <= SAMPLE_CALLS * 0.02,
+        f"{without} of {SAMPLE_CALLS} calls failed without retries, {errors} with 3"
+    )
+
+
+async def slow_tail(stubs: UpstreamStubs, url: str):
+    print("5% of responses take 500 ms more")
+    stubs.slow["open_meteo"] = (0.05, 0.5)
+    plain, _ = await seeded(stubs, url)
+    hedged, _ = await seeded(stubs, url, hedge_after=0.05)
+    stubs.slow.clear()
+    check(
+        "hedging cuts p99", p(hedged, 0.99) < p(plain, 0.99) / 2,
+        f"p99 {p(plain, 0.99):.0f} ms -> {p(hedged, 0.99):.0f} ms hedged after 50 ms"
+    )
+
+
+async def hang(stubs: UpstreamStubs, url: str):
+    print("upstream accepts the request and never answers")
+    stubs.delays["open_meteo"] = 3
+    policy(stubs, timeout=0.2, retries=1)
+    started = time.perf_counter()
+    _, errors = await run(url, calls=5)
+    elapsed = time.perf_counter() - started
+    stubs.delays.clear()
+    check("timeouts bound the wait", errors == 5 and elapsed < 1.5, f"{errors} of 5 failed after {elapsed:.2f} s")
+
+
+async def outage(stubs: UpstreamStubs, url: str):
+    print("upstream down for a while, then back")
+    target = policy(stubs, retries=1, failures=3, reset=0.5)
+    weather.weather_cache.clear()
+    weather.weather_cache.ttl = 0.01
+    good = await weather.get_weather()
+    stubs.fail.add("open_meteo")
+    await asyncio.sleep(0.02)
+
+    requests = stubs.requests
+    answers = []
+    for _ in range(20):
+        started = time.perf_counter()
+        text = await weather.get_weather()
+        answers.append((text, (time.perf_counter() - started) * 1000))
+        await asyncio.sleep(0.02)
+    check("stale value served", all(text == good for text, _ in answers), good)
+    check("circuit opened", target.breaker.state == "open", f"{stubs.requests - requests} upstream requests for 20 calls")
+    slowest = max(ms for _, ms in answers[-5:])
+    check("calls fail fast", slowest < 20, f"last 5 took {slowest:.2f} ms at most")
+    try:
+        await get_json(url, PARAMS)
+        short = False
+    except CircuitOpenError:
+        short = True
+    check("open circuit raises", short, "CircuitOpenError without calling the host")
+
+    stubs.fail.clear()
+    await asyncio.sleep(target.breaker.reset)
+    requests = stubs.requests
+    await weather.get_weather()
+    check(
+        "half-open probe closes it", target.breaker.state == "closed" and stubs.requests == requests + 1,
+        f"state {target.breaker.state} after {stubs.requests - requests} probe request"
+    )
+
+
+async def main():
+    logging.basicConfig(level=logging.ERROR)
+    stubs = await UpstreamStubs(delay=0.005, seed=SEED).start()
+    url = weather.URL = f"{stubs.base_url}/forecast"
+    try:
+        for scenario in (healthy, flaky, slow_tail, hang, outage):
+            await scenario(stubs, url)
+    finally:
+        await close_client()
+        await stubs.stop()
+    print(f"\n{len(failed)} checks failed: {', '.join(failed)}" if failed else "\nall checks passed")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+# Per-update FSM latency: MemoryStorage vs. SQLiteStorage with a warm LRU and with every read missing it.
+# One "update" is what a step of the expense flow does: get_state, update_data, set_state.
+# Run from the telegram_bot directory: python -m benchmarks.fsm_latency [updates]
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from db.manager import DatabaseManager
+from db.storage import SQLiteStorage
+from utils.states import ExpenseState
+
+UPDATES = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+CHATS = 500
+
+
+def key(i: int) -> StorageKey:
+    chat = i % CHATS
+    return StorageKey(bot_id=1, chat_id=chat, user_id=chat)
+
+
+async def update(storage, i: int):
+    k = key(i)
+    await storage.get_state(k)
+    await storage.update_data(k, {"category": "Паливо", "step": i})
+    await storage.set_state(k, ExpenseState.amount)
+
+
+async def measure(name, storage, before=None):
+    samples = []
+    for i in range(UPDATES):
+        if before:
+            before()
+        started = time.perf_counter()
+        await update(storage, i)
+        samples.append((time.perf_counter() - started) * 1000)
+
+    samples.sort()
+    p99 = samples[int(len(samples) * 0.99) - 1]
+    print(f"{name:<24} mean {statistics.mean(samples):7.3f} ms   p50 {samples[len(samples) // 2]:7.3f} ms   p99 {p99:7.3f} ms")
+
+
+async def main():
+    print(f"{UPDATES} updates across {CHATS} chats")
+    await measure("MemoryStorage", MemoryStorage())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = DatabaseManager(os.path.join(tmp, "bench.db"))
+        await manager.create_tables()
+        try:
+            storage = SQLiteStorage(manager)
+            await measure("SQLiteStorage (warm)", storage)
+
+            # Every update starts with a cache miss, i.e. the first message after a restart
+            cold = SQLiteStorage(manager)
+            await manager.flush()
+            await measure("SQLiteStorage (cold)", cold, cold._cache.clear)
+            print(f"write-behind: {manager.write_stats}")
+        finally:
+            await manager.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+# Impatient users against the real dispatcher: every chat taps the mood button several times and sends its
+# expense amount several times, all delivered at once as polling does (one task per update). Compares aiogram's
+# default handling with the per-chat ChatInbox: handler calls, rows written, replies sent. Run from the
+# telegram_bot directory:
+#   python -m benchmarks.inbox [chats] [repeats]
+import asyncio
+import sys
+import tempfile
+import time
+from aiogram import BaseMiddleware
+from benchmarks.stubs import FakeBotAPI
+from benchmarks.suite import configure
+from benchmarks.webhook_load import callback, message
+
+CHATS = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+REPEATS = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+
+class HandlerCalls(BaseMiddleware):
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self, handler, event, data):
+        self.calls += 1
+        return await handler(event, data)
+
+
+def taps(chat_id: int) -> list:
+    # The same button on the same mood prompt, REPEATS times
+    first = callback(chat_id, "mood_1")
+    updates = []
+    for i in range(REPEATS):
+        update = {**first, "update_id": first["update_id"] * 100 + i}
+        update["callback_query"] = {**first["callback_query"], "id": f"{chat_id}-{i}"}
+        updates.append(update)
+    return updates
+
+
+async def deliver(dp, bot, batches: list):
+    # Each batch is delivered like one getUpdates response: a task per update, none awaited before the next
+    for batch in batches:
+        await asyncio.gather(*(dp.feed_raw_update(bot, update) for update in batch))
+
+
+async def run(name: str, dp, bot, api: FakeBotAPI, db, calls: HandlerCalls, first_chat: int):
+    chats = range(first_chat, first_chat + CHATS)
+    await deliver(dp, bot, [[message(chat, "/start") for chat in chats]])
+    await deliver(dp, bot, [[message(chat, "Додати витрату 🛒") for chat in chats]])
+    await deliver(dp, bot, [[message(chat, "Їжа") for chat in chats]])
+
+    sent = api.sent
+    calls.calls = 0
+    started = time.perf_counter()
+    await deliver(dp, bot, [
+        [update for chat in chats for update in [message(chat, "12,50") for _ in range(REPEATS)] + taps(chat)],
+    ])
+    elapsed = time.perf_counter() - started
+    await db.flush()
+    async with db._read() as conn:
+        counts = []
+        for table in ("expenses", "mood"):
+            async with conn.execute(
+                f"SELECT COUNT(*) FROM {table} WHERE user_id BETWEEN ? AND ?", (chats[0], chats[-1])
+            ) as cursor:
+                counts.append((await cursor.fetchone())[0])
+    print(
+        f"{name:<16} {calls.calls:6d} handler calls   {counts[0]:5d} expenses   {counts[1]:5d} moods   "
+        f"{api.sent - sent:6d} replies   {elapsed * 1000:7.0f} ms"
+    )
+
+
+async def main():
+    api = await FakeBotAPI().start()
+    with tempfile.TemporaryDirectory() as tmp:
+        configure(api, tmp)
+        from bot import create_bot, create_dispatcher
+        from db.manager import db
+        from utils.middlewares import ChatInbox
+
+        bot = create_bot()
+        await db.create_tables()
+        print(f"{CHATS} chats, each amount and mood tap sent {REPEATS} times at once")
+        try:
+            # Routers attach to one dispatcher only, so the inbox is taken out for the first run
+            dp = create_dispatcher()
+            calls = HandlerCalls()
+            dp.message.middleware(calls)
+            dp.callback_query.middleware(calls)
+            inbox = next(m for m in dp.update.outer_middleware if isinstance(m, ChatInbox))
+            dp.update.outer_middleware.unregister(inbox)
+            await run("aiogram default", dp, bot, api, db, calls, 10_000)
+
+            dp.update.outer_middleware.unregister(dp.fsm)
+            dp.update.outer_middleware(inbox)
+            dp.update.outer_middleware(dp.fsm)
+            await run("ChatInbox", dp, bot, api, db, calls, 20_000)
+            print(f"inbox counters: {inbox.stats}")
+        finally:
+            await bot.session.close()
+            await db.close()
+            await api.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
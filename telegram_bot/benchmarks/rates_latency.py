@@ -0,0 +1,61 @@
+# End-to-end latency of the exchange-rate message against local stub upstreams: the old serial
+# NBU-then-CoinGecko fetch vs. the concurrent sources. Run from the telegram_bot directory:
+# python -m benchmarks.rates_latency [upstream_delay_seconds]
+import asyncio
+import statistics
+import sys
+import time
+from benchmarks.stubs import UpstreamStubs
+from utils.finance import SOURCES, fetch_rates, get_exchange_rates, rates_cache
+from utils.http import close_client, get_client
+
+DELAY = float(sys.argv[1]) if len(sys.argv) > 1 else 0.05
+RUNS = 30
+
+
+async def serial(base_url):
+    # What get_exchange_rates did before: one request after the other, two linear scans
+    client = get_client()
+    fiat_data = (await client.get(f"{base_url}/nbu")).json()
+    usd_uah = next((item['rate'] for item in fiat_data if item['cc'] == 'USD'), 0.0)
+    eur_uah = next((item['rate'] for item in fiat_data if item['cc'] == 'EUR'), 0.0)
+    crypto = (await client.get(f"{base_url}/coingecko", params={"ids": "bitcoin,ethereum", "vs_currencies": "usd"})).json()
+    return usd_uah, eur_uah, crypto
+
+
+async def concurrent(base_url):
+    rates_cache.clear()
+    return await get_exchange_rates()
+
+
+async def measure(name, call, base_url):
+    samples = []
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        await call(base_url)
+        samples.append((time.perf_counter() - started) * 1000)
+    print(f"{name:<36} mean {statistics.mean(samples):8.2f} ms   max {max(samples):8.2f} ms")
+
+
+async def main():
+    stubs = await UpstreamStubs(delay=DELAY).start()
+    SOURCES[0].url = f"{stubs.base_url}/nbu"
+    SOURCES[1].url = f"{stubs.base_url}/coingecko"
+    print(f"upstream delay {DELAY * 1000:.0f} ms per request")
+
+    await measure("serial (before)", serial, stubs.base_url)
+    await measure("concurrent sources", concurrent, stubs.base_url)
+
+    # One upstream hanging: the message still goes out once the per-source timeout expires
+    stubs.delays["coingecko"] = 5
+    SOURCES[1].timeout = 0.2
+    rates_cache.clear()
+    started = time.perf_counter()
+    partial = await fetch_rates()
+    print(f"{'one source failing':<36} {(time.perf_counter() - started) * 1000:8.2f} ms, answered: {sorted(partial)}")
+
+    await close_client()
+    await stubs.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
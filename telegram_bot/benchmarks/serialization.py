@@ -0,0 +1,75 @@
+# Per-message serialization cost of a sendMessage with a keyboard, from building the markup to the form data the
+# session posts: keyboards rebuilt on every call (the old keyboards.py), cached keyboards, cached keyboards
+# pre-serialized by PreparedSession, and a SharedMessage reused across broadcast recipients.
+# Run from the telegram_bot directory:
+#   python -m benchmarks.serialization [--messages N]
+import argparse
+import os
+import time
+
+os.environ.setdefault("BOT_TOKEN", "123456:serialization")
+
+TEXT = "Як твій настрій сьогодні? 😊 / 😞"
+
+
+def per_message_us(send, messages: int) -> float:
+    send(0)  # First call encodes the cached payloads
+    started = time.perf_counter()
+    for chat_id in range(messages):
+        send(chat_id)
+    return (time.perf_counter() - started) / messages * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=20000)
+    args = parser.parse_args()
+
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.methods import SendMessage
+    from utils import keyboards
+    from utils.payloads import PreparedSession, SharedMessage
+
+    stock = Bot(os.environ["BOT_TOKEN"], session=AiohttpSession())
+    prepared = Bot(os.environ["BOT_TOKEN"], session=PreparedSession())
+    uncached = keyboards.main_menu.__wrapped__  # The builder without lru_cache, as every call used to run it
+
+    def rebuilt(chat_id):
+        method = SendMessage(chat_id=chat_id, text=TEXT, reply_markup=uncached())
+        stock.session.build_form_data(stock, method)
+
+    def cached(bot):
+        def send(chat_id):
+            method = SendMessage(chat_id=chat_id, text=TEXT, reply_markup=keyboards.main_menu())
+            bot.session.build_form_data(bot, method)
+        return send
+
+    shared = SharedMessage(TEXT, reply_markup=keyboards.main_menu())
+    fields = prepared.session.fields(prepared, shared.method, exclude={"chat_id"})
+
+    def reused(chat_id):
+        # What SharedMessage.send does around the request
+        method = shared.method.model_copy(update={"chat_id": chat_id})
+        prepared.session.shared[id(method)] = fields
+        prepared.session.build_form_data(prepared, method)
+        prepared.session.shared.pop(id(method))
+
+    def text_only(chat_id):
+        stock.session.build_form_data(stock, SendMessage(chat_id=chat_id, text=TEXT))
+
+    cases = (
+        ("text only, no keyboard", text_only),
+        ("keyboard rebuilt per message", rebuilt),
+        ("cached keyboard", cached(stock)),
+        ("cached + pre-serialized", cached(prepared)),
+        ("SharedMessage (broadcast)", reused),
+    )
+    print(f"{args.messages} sendMessage calls with the main menu keyboard\n")
+    print(f"{'':<32}{'us/message':>12}")
+    for name, send in cases:
+        print(f"{name:<32}{per_message_us(send, args.messages):>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
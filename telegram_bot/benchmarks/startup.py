@@ -0,0 +1,92 @@
+# Cold start of `python bot.py` (polling mode) against a fake Bot API: time from spawning the process to its first
+# Bot API call, to the first getUpdates (polling started) and to the reply to a /start that is already waiting,
+# then how long SIGTERM takes to stop it. The first run creates the database, the next ones find it current.
+# Run from the telegram_bot directory, or in the image built from the Dockerfile:
+#   python -m benchmarks.startup [--runs N] [--api-delay SECONDS]
+#   docker compose run --rm bot python -m benchmarks.startup
+import argparse
+import asyncio
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.stubs import FakeBotAPI
+from benchmarks.webhook_load import message
+
+ADMIN_ID = 1
+CHAT_ID = 4242
+PHASES = ("first_call", "polling", "first_reply", "stop")
+
+
+async def run_once(args, tmp: str, log) -> dict:
+    api = await FakeBotAPI(delay=args.api_delay).start()
+    api.updates.append(message(CHAT_ID, "/start"))
+    env = {
+        **os.environ,
+        "BOT_MODE": "polling",
+        "BOT_TOKEN": "123456:startup",
+        "ADMIN_ID": str(ADMIN_ID),
+        "DB_PATH": os.path.join(tmp, "startup.db"),
+        "TELEGRAM_API_URL": api.base_url,
+        "METRICS_PORT": "0",
+    }
+
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "bot.py"], env=env, stdout=log, stderr=log)
+    try:
+        deadline = started + args.timeout
+        while CHAT_ID not in api.first_sent:
+            if process.poll() is not None or time.perf_counter() > deadline:
+                raise RuntimeError("The bot did not answer /start; see the log above")
+            await asyncio.sleep(0.01)
+
+        stopping = time.perf_counter()
+        process.send_signal(signal.SIGTERM)
+        while process.poll() is None:
+            await asyncio.sleep(0.01)
+        stopped = time.perf_counter()
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        await api.stop()
+
+    return {
+        "first_call": min(api.first_calls.values()) - started,
+        "polling": api.first_calls["getUpdates"] - started,
+        "first_reply": api.first_sent[CHAT_ID] - started,
+        "stop": stopped - stopping,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=3, help="runs against the existing database after the first")
+    parser.add_argument("--api-delay", type=float, default=0.1, help="seconds the fake Bot API takes per call")
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log = open(os.path.join(tmp, "bot.log"), "w+")
+        try:
+            results = [await run_once(args, tmp, log) for _ in range(1 + args.runs)]
+        except RuntimeError:
+            log.seek(0)
+            print(log.read()[-3000:])
+            raise
+        finally:
+            log.close()
+
+    print(f"Seconds from spawning bot.py (Bot API round trip {args.api_delay * 1000:.0f} ms):\n")
+    print(f"{'':<22}" + "".join(f"{phase:>13}" for phase in PHASES))
+    print(f"{'cold (new database)':<22}" + "".join(f"{results[0][phase]:>13.3f}" for phase in PHASES))
+    if args.runs:
+        warm = {phase: statistics.median(result[phase] for result in results[1:]) for phase in PHASES}
+        print(f"{'warm (median)':<22}" + "".join(f"{warm[phase]:>13.3f}" for phase in PHASES))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
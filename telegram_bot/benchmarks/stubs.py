@@ -0,0 +1,137 @@
+# Local stand-ins for Open-Meteo, NBU, CoinGecko and the Telegram Bot API, served by aiohttp on 127.0.0.1.
+import asyncio
+import itertools
+import random
+import time
+from aiohttp import web
+
+NBU_CURRENCIES = (
+    "AUD", "CAD", "CNY", "CZK", "DKK", "HUF", "INR", "JPY", "KZT", "MDL", "NOK", "SGD", "SEK", "CHF",
+    "EGP", "GBP", "USD", "BYN", "AZN", "RON", "TRY", "XDR", "BGN", "EUR", "PLN", "DZD", "BDT", "AMD",
+    "KRW", "IDR", "ILS", "MXN", "NZD", "SAR", "THB", "AED", "GEL", "HKD", "VND", "MYR", "ZAR",
+)
+
+
+class UpstreamStubs:
+    # delay: seconds added to every response (per endpoint in delays); fail: endpoints that answer 503;
+    # flaky: endpoint -> share of requests answered 503, drawn at random (seed makes the draws repeat from run to
+    # run); slow: endpoint -> (share of requests, extra seconds), spread evenly: 0.05 slows every 20th request, so
+    # a hedged retry of a slow request is never slow itself
+    def __init__(self, delay: float = 0.0, seed: int = None):
+        self.delay = delay
+        self.random = random.Random(seed)
+        self.delays = {}
+        self.fail = set()
+        self.flaky = {}
+        self.slow = {}
+        self.requests = 0
+        self._served = {}  # endpoint -> requests so far
+        self._runner = None
+        self.base_url = None
+
+    async def _respond(self, name: str, payload):
+        self.requests += 1
+        delay = self.delays.get(name, self.delay)
+        share, extra = self.slow.get(name, (0, 0))
+        served = self._served[name] = self._served.get(name, 0) + 1
+        if int(served * share) > int((served - 1) * share):
+            delay += extra
+        await asyncio.sleep(delay)
+        if name in self.fail or self.random.random() < self.flaky.get(name, 0):
+            return web.json_response({"error": "unavailable"}, status=503)
+        return web.json_response(payload)
+
+    async def nbu(self, request):
+        payload = [
+            {"r030": i, "txt": cc, "rate": round(random.uniform(0.5, 50), 4), "cc": cc, "exchangedate": "01.01.2025"}
+            for i, cc in enumerate(NBU_CURRENCIES)
+        ]
+        return await self._respond("nbu", payload)
+
+    async def coingecko(self, request):
+        ids = request.query.get("ids", "").split(",")
+        return await self._respond("coingecko", {coin: {"usd": round(random.uniform(1, 90000), 2)} for coin in ids if coin})
+
+    async def open_meteo(self, request):
+        latitudes = request.query.get("latitude", "0").split(",")
+        def location():
+            return {
+                "current": {"temperature_2m": 11.5, "weather_code": 3, "wind_speed_10m": 14.0},
+                "daily": {"weather_code": [3, 61], "temperature_2m_max": [13.0, 12.1], "temperature_2m_min": [6.0, 5.4]},
+            }
+        payload = [location() for _ in latitudes] if len(latitudes) > 1 else location()
+        return await self._respond("open_meteo", payload)
+
+    async def start(self, port: int = 0):
+        app = web.Application()
+        app.router.add_get("/nbu", self.nbu)
+        app.router.add_get("/coingecko", self.coingecko)
+        app.router.add_get("/forecast", self.open_meteo)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        return self
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+class FakeBotAPI:
+    # Answers every Bot API method with a plausible result and counts the calls; point a bot at it
+    # with TELEGRAM_API_URL=base_url. delay: seconds added to every call; updates: served by getUpdates
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = {}
+        self.first_calls = {}  # method -> perf_counter() of its first call
+        self.first_sent = {}  # chat_id -> perf_counter() of the first message sent there
+        self.updates = []
+        self._message_ids = itertools.count(1)
+        self._runner = None
+        self.base_url = None
+
+    @property
+    def sent(self) -> int:
+        return self.calls.get("sendMessage", 0) + self.calls.get("sendPhoto", 0)
+
+    async def method(self, request):
+        name = request.match_info["method"]
+        params = dict(await request.post())
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.first_calls.setdefault(name, time.perf_counter())
+        await asyncio.sleep(self.delay)
+
+        if name == "getUpdates":
+            if not self.updates:
+                await asyncio.sleep(0.05)
+            result, self.updates = self.updates, []
+        elif name == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif name.startswith("send"):
+            chat_id = int(params.get("chat_id", 0))
+            self.first_sent.setdefault(chat_id, time.perf_counter())
+            result = {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", ""),
+            }
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self, port: int = 0):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.method)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        return self
+
+    async def stop(self):
+        await self._runner.cleanup()
@@ -0,0 +1,267 @@
+# End-to-end benchmark suite: the real dispatcher, handlers and jobs against a fake Bot API, stub Open-Meteo/NBU/
+# CoinGecko servers and a scratch database. Scripted users go through the expense, salary and mood/mileage flows and
+# open their reports at a chosen concurrency, then every job in jobs/tasks.py runs for all of them. Reports p50/p95/p99
+# latency per flow, throughput, per-DB-method times and memory; --json saves the numbers, --compare checks them
+# against a saved run and exits with 1 on a regression.
+# Run from the telegram_bot directory:
+#   python -m benchmarks.suite [--users N] [--concurrency N] [--days N] [--seed N] [--json out.json] [--compare base.json]
+import argparse
+import asyncio
+import datetime as dt
+import itertools
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from benchmarks.stubs import FakeBotAPI, UpstreamStubs
+from benchmarks.webhook_load import message, callback
+
+# Latency and memory that grow by more than TOLERANCE against --compare count as regressions, unless the
+# difference is below NOISE (ms or MB) — sub-millisecond jobs jitter by far more than 15%
+TOLERANCE = 0.15
+NOISE = 5
+_ids = itertools.count(10 ** 6)
+
+
+def location(chat_id: int, rng: random.Random) -> dict:
+    user = {"id": chat_id, "is_bot": False, "first_name": f"User {chat_id}"}
+    return {"update_id": next(_ids), "message": {
+        "message_id": next(_ids), "date": int(time.time()), "chat": {"id": chat_id, "type": "private"}, "from": user,
+        "location": {"latitude": rng.uniform(51.5, 55.5), "longitude": rng.uniform(-10.5, -6.0)},
+    }}
+
+
+def session(chat_id: int, days: int, rng: random.Random) -> list:
+    # (flow, update) pairs in the order one user sends them
+    steps = [("start", message(chat_id, "/start")), ("start", location(chat_id, rng))]
+    steps.append(("alerts", message(chat_id, rng.choice(("/alert USD 5%", "/alert BTC > 45000", "/alert EUR < 20")))))
+    for day in range(days):
+        for _ in range(rng.randint(1, 3)):
+            steps += [
+                ("expense", message(chat_id, "Додати витрату 🛒")),
+                ("expense", message(chat_id, rng.choice(("Їжа", "Паливо", "Розваги", "Інше")))),
+                ("expense", message(chat_id, f"{rng.uniform(1, 80):.2f}".replace(".", ","))),
+            ]
+        steps += [
+            ("mood_mileage", callback(chat_id, rng.choice(("mood_0", "mood_1")))),
+            ("mood_mileage", message(chat_id, str(rng.randint(0, 120)))),
+        ]
+        if day % 7 == 4:
+            steps += [("salary", callback(chat_id, "add_salary")), ("salary", message(chat_id, "2500"))]
+        steps.append(("reports", message(chat_id, rng.choice(("Останні дані", "Показати статистику за тиждень")))))
+    steps.append(("reports", message(chat_id, "Звіт за місяць 📊")))
+    return steps
+
+
+def percentiles(samples: list) -> dict:
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(len(samples) * q))]
+    return {"count": len(samples), "p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99)}
+
+
+def rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def configure(api: FakeBotAPI, tmp: str):
+    # Must run before any project module reads config
+    os.environ.update({
+        "BOT_TOKEN": "123456:benchmark",
+        "ADMIN_ID": "1",
+        "DB_PATH": os.path.join(tmp, "suite.db"),
+        "TELEGRAM_API_URL": api.base_url,
+        # Measure the bot, not Telegram's flood limits
+        "TELEGRAM_GLOBAL_RATE": "1000000",
+        "TELEGRAM_CHAT_RATE": "1000000",
+        "TELEGRAM_CHAT_BURST": "1000000",
+        "METRICS_PORT": "0",
+        # Jobs are timed back to back; spreading a broadcast over minutes would only add idle time
+        "BROADCAST_SPREAD": "0",
+    })
+
+
+async def run_sessions(dp, bot, sessions, concurrency: int) -> dict:
+    from aiogram.methods import TelegramMethod
+
+    latencies = {}
+    slots = asyncio.Semaphore(concurrency)
+
+    async def run(steps):
+        # One user at a time per slot, each update handled fully before the next, as Telegram delivers them
+        async with slots:
+            for flow, update in steps:
+                started = time.perf_counter()
+                result = await dp.feed_raw_update(bot, update)
+                if isinstance(result, TelegramMethod):
+                    await dp.silent_call_request(bot, result)
+                latencies.setdefault(flow, []).append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(run(steps) for steps in sessions))
+    return latencies
+
+
+async def run_jobs(bot, api: FakeBotAPI, stubs: UpstreamStubs) -> dict:
+    from jobs import tasks
+    from db.storage import storage
+    from utils.finance import rates_cache
+
+    # Salary reminders only go out on Wednesdays and Fridays
+    today = tasks.local_today("UTC")
+    wednesday = today + dt.timedelta(days=(2 - today.weekday()) % 7)
+    # The first poll only loads the alerts and arms them at the current quotes; the timed one sees new
+    # (random) quotes from the stubs and fires
+    await tasks.check_rate_alerts(bot)
+    rates_cache.clear()
+    jobs = {
+        "morning_checkin": lambda: tasks.send_morning_checkin(bot),
+        "salary_reminder": lambda: tasks.check_salary_reminder(bot),
+        "weekly_report": lambda: tasks.send_weekly_report(bot),
+        "evening_forecast": lambda: tasks.send_evening_forecast(bot),
+        "rate_alerts": lambda: tasks.check_rate_alerts(bot),
+        "rate_history_cleanup": lambda: tasks.purge_rate_history(bot),
+        "fsm_cleanup": storage.purge_expired,
+    }
+    results = {}
+    for name, job in jobs.items():
+        sent, upstream = api.sent, stubs.requests
+        original = tasks.local_today
+        if name == "salary_reminder":
+            tasks.local_today = lambda timezone: wednesday
+        started = time.perf_counter()
+        try:
+            await job()
+        finally:
+            tasks.local_today = original
+        results[name] = {
+            "ms": (time.perf_counter() - started) * 1000,
+            "sent": api.sent - sent,
+            "upstream_requests": stubs.requests - upstream,
+        }
+    return results
+
+
+async def warm_chart_pool():
+    from utils import charts
+
+    pool = charts._get_pool()
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(pool, charts._warm_up) for _ in range(charts.CHART_WORKERS)))
+
+
+async def benchmark(args) -> dict:
+    rng = random.Random(args.seed)
+    api = await FakeBotAPI().start()
+    stubs = await UpstreamStubs(delay=args.upstream_delay).start()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configure(api, tmp)
+        from bot import create_bot, create_dispatcher
+        from db.manager import db
+        from utils import charts, metrics, weather
+        from utils.finance import SOURCES
+        from utils.http import close_client
+
+        weather.URL = f"{stubs.base_url}/forecast"
+        SOURCES[0].url = f"{stubs.base_url}/nbu"
+        SOURCES[1].url = f"{stubs.base_url}/coingecko"
+
+        bot = create_bot()
+        dp = create_dispatcher()
+        await db.create_tables()
+        await warm_chart_pool()
+        sessions = [session(10_000 + i, args.days, rng) for i in range(args.users)]
+        updates = sum(len(steps) for steps in sessions)
+        rss_before = rss_mb()
+
+        try:
+            started = time.perf_counter()
+            latencies = await run_sessions(dp, bot, sessions, args.concurrency)
+            elapsed = time.perf_counter() - started
+            await db.flush()
+            jobs = await run_jobs(bot, api, stubs)
+        finally:
+            charts.close()
+            await bot.session.close()
+            await close_client()
+            await db.close()
+            await api.stop()
+            await stubs.stop()
+
+    db_methods = {
+        labels[0]: {"calls": sum(counts), "mean_ms": total / sum(counts) * 1000}
+        for labels, (counts, total) in metrics.DB_SECONDS._series.items() if sum(counts)
+    }
+    return {
+        "config": vars(args),
+        "updates": updates,
+        "seconds": elapsed,
+        "updates_per_s": updates / elapsed,
+        "flows": {flow: percentiles(samples) for flow, samples in latencies.items()},
+        "all": percentiles([ms for samples in latencies.values() for ms in samples]),
+        "jobs": jobs,
+        "db": db_methods,
+        "rss_mb": {"before": rss_before, "peak": rss_mb()},
+        "replies": api.sent,
+    }
+
+
+def report(result: dict):
+    print(f"{result['config']['users']} users x {result['config']['days']} days, concurrency "
+          f"{result['config']['concurrency']}: {result['updates']} updates in {result['seconds']:.2f} s "
+          f"({result['updates_per_s']:.0f} updates/s), {result['replies']} replies")
+    print(f"\n{'flow':<14}{'updates':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for flow, stats in (*result["flows"].items(), ("all", result["all"])):
+        print(f"{flow:<14}{stats['count']:>9}{stats['p50']:>10.2f}{stats['p95']:>10.2f}{stats['p99']:>10.2f}")
+    print(f"\n{'job':<22}{'ms':>10}{'sent':>8}{'upstream':>10}")
+    for name, stats in result["jobs"].items():
+        print(f"{name:<22}{stats['ms']:>10.1f}{stats['sent']:>8}{stats['upstream_requests']:>10}")
+    print(f"\n{'db method':<26}{'calls':>8}{'mean ms':>10}")
+    for name, stats in sorted(result["db"].items(), key=lambda item: -item[1]["calls"] * item[1]["mean_ms"]):
+        print(f"{name:<26}{stats['calls']:>8}{stats['mean_ms']:>10.3f}")
+    print(f"\nRSS: {result['rss_mb']['before']:.0f} MB before the sessions, peak {result['rss_mb']['peak']:.0f} MB")
+
+
+def compare(result: dict, baseline: dict) -> list:
+    # (name, baseline, current) for every number that got worse by more than TOLERANCE
+    checks = [("ms per update", 1000 / baseline["updates_per_s"], 1000 / result["updates_per_s"])]
+    checks += [(f"{flow} p95", stats["p95"], result["flows"][flow]["p95"])
+               for flow, stats in baseline["flows"].items() if flow in result["flows"]]
+    checks += [(f"job {name}", stats["ms"], result["jobs"][name]["ms"])
+               for name, stats in baseline["jobs"].items() if name in result["jobs"]]
+    checks.append(("peak RSS", baseline["rss_mb"]["peak"], result["rss_mb"]["peak"]))
+    return [(name, old, new) for name, old, new in checks if new > old * (1 + TOLERANCE) and new - old > NOISE]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--days", type=int, default=7, help="simulated days of use per user")
+    parser.add_argument("--concurrency", type=int, default=20, help="users active at the same time")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--upstream-delay", type=float, default=0.05, help="seconds added by every stub upstream")
+    parser.add_argument("--json", help="write the results here")
+    parser.add_argument("--compare", help="results of an earlier run to check against")
+    args = parser.parse_args()
+
+    result = asyncio.run(benchmark(args))
+    report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(result, json.load(f))
+        for name, old, new in regressions:
+            print(f"REGRESSION {name}: {old:.3f} -> {new:.3f} ({(new / old - 1) * 100:+.0f}%)")
+        if regressions:
+            sys.exit(1)
+        print(f"\nNo regressions beyond {TOLERANCE:.0%} against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# Import/export throughput on a large bank statement, with peak memory, against a scratch database.
+# Run from the telegram_bot directory: python -m benchmarks.transfer_throughput [rows]
+import asyncio
+import csv
+import datetime as dt
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+USER_ID = 1
+MERCHANTS = ("Tesco", "Circle K", "Netflix", "Lidl", "Apple Pay: Costa", "Transfer to savings", "Salary")
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def write_statement(path: str, rows: int):
+    # Streamed to disk so the generator itself does not skew the memory numbers
+    start = dt.date(2015, 1, 1)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(("Completed Date", "Description", "Amount", "Currency", "Balance"))
+        for i in range(rows):
+            day = start + dt.timedelta(days=i * 3650 // rows)
+            merchant = random.choice(MERCHANTS)
+            amount = round(random.uniform(1500, 3000), 2) if merchant == "Salary" else -round(random.uniform(1, 120), 2)
+            writer.writerow((f"{day.isoformat()} 12:{i % 60:02d}:00", merchant, f"{amount:.2f}", "EUR", "0"))
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DB_PATH"] = os.path.join(tmp, "bench.db")
+        from db.manager import db
+        from utils.transfer import import_file, export_file
+
+        statement = os.path.join(tmp, "statement.csv")
+        write_statement(statement, ROWS)
+        print(f"{ROWS} statement rows ({os.path.getsize(statement) / 2 ** 20:.1f} MB), baseline RSS {peak_rss_mb():.0f} MB")
+
+        await db.create_tables()
+        try:
+            started = time.perf_counter()
+            stats = await import_file(USER_ID, statement)
+            elapsed = time.perf_counter() - started
+            print(f"import    {elapsed:7.2f} s  {ROWS / elapsed:9.0f} rows/s  {stats}  peak RSS {peak_rss_mb():.0f} MB")
+
+            for fmt in ("csv", "parquet"):
+                path = os.path.join(tmp, f"export.{fmt}")
+                started = time.perf_counter()
+                try:
+                    count = await export_file(USER_ID, path)
+                except ValueError as e:
+                    print(f"export {fmt:<8} skipped: {e}")
+                    continue
+                elapsed = time.perf_counter() - started
+                print(f"export {fmt:<8} {elapsed:5.2f} s  {count / elapsed:9.0f} rows/s  "
+                      f"{os.path.getsize(path) / 2 ** 20:6.1f} MB  peak RSS {peak_rss_mb():.0f} MB")
+
+            problems = await db.check_rollups()
+            print("rollups consistent" if not problems else f"{len(problems)} rollup problems")
+        finally:
+            await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,187 @@
+# Load test for webhook mode: starts `bot.py` with BOT_MODE=webhook (or sharded, with a webhook ingress) against
+# a fake Bot API and a scratch database, replays updates and reports ack latency and end-to-end throughput.
+# Run from the telegram_bot directory:
+#   python -m benchmarks.webhook_load [--mode webhook|sharded] [--workers N] [--chats N] [--updates recorded.jsonl]
+# recorded.jsonl holds one Telegram Update object per line; without it a scripted session per chat is used.
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import aiohttp
+from benchmarks.stubs import FakeBotAPI
+
+BASE_PORT = 18080
+SECRET = "load-test"
+_update_ids = itertools.count(1)
+
+
+def message(chat_id: int, text: str) -> dict:
+    user = {"id": chat_id, "is_bot": False, "first_name": f"User {chat_id}"}
+    body = {"message_id": next(_update_ids), "date": int(time.time()), "chat": {"id": chat_id, "type": "private"},
+            "from": user, "text": text}
+    if text.startswith("/"):
+        body["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": next(_update_ids), "message": body}
+
+
+def callback(chat_id: int, data: str) -> dict:
+    user = {"id": chat_id, "is_bot": False, "first_name": f"User {chat_id}"}
+    prompt = {"message_id": next(_update_ids), "date": int(time.time()), "chat": {"id": chat_id, "type": "private"},
+              "text": "Як твій настрій сьогодні? 😊 / 😞"}
+    return {"update_id": next(_update_ids), "callback_query": {
+        "id": str(next(_update_ids)), "from": user, "chat_instance": str(chat_id), "message": prompt, "data": data}}
+
+
+def scripted_session(chat_id: int) -> list:
+    # A day of use: sign-up, an expense, the morning check-in, reports
+    return [
+        message(chat_id, "/start"),
+        message(chat_id, "Додати витрату 🛒"),
+        message(chat_id, "Їжа"),
+        message(chat_id, "12,50"),
+        callback(chat_id, "mood_1"),
+        message(chat_id, "42"),
+        message(chat_id, "Останні дані"),
+        message(chat_id, "Показати статистику за тиждень"),
+    ]
+
+
+def load_sessions(args) -> list:
+    if args.updates:
+        # Recorded updates keep their order within a chat; chats are replayed side by side
+        sessions = {}
+        with open(args.updates, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    update = json.loads(line)
+                    event = update.get("message") or update.get("callback_query", {}).get("message", {})
+                    sessions.setdefault(event.get("chat", {}).get("id"), []).append(update)
+        return list(sessions.values())
+    return [scripted_session(1000 + i) for i in range(args.chats)]
+
+
+def start_workers(args, api_url: str, tmp: str, log):
+    env = {
+        **os.environ,
+        "BOT_MODE": args.mode,
+        "BOT_TOKEN": "123456:load-test",
+        "ADMIN_ID": "1",
+        "DB_PATH": os.path.join(tmp, "load.db"),
+        "TELEGRAM_API_URL": api_url,
+        "WEBHOOK_BASE_URL": "",
+        "WEBHOOK_SECRET": SECRET,
+        "WEBHOOK_WORKERS": str(args.workers),
+        "SHARD_WORKERS": str(args.workers),
+        "SHARD_INGRESS": "webhook",
+        "SHARD_SOCKET_DIR": os.path.join(tmp, "shards"),
+        "WEBAPP_PORT": str(BASE_PORT),
+        # Measure the bot, not Telegram's flood limits
+        "TELEGRAM_GLOBAL_RATE": "1000000",
+        "TELEGRAM_CHAT_RATE": "1000000",
+        "TELEGRAM_CHAT_BURST": "1000000",
+    }
+    return subprocess.Popen([sys.executable, "bot.py"], env=env, stdout=log, stderr=log)
+
+
+async def wait_ready(session, ports, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    for port in ports:
+        while True:
+            try:
+                async with session.get(f"http://127.0.0.1:{port}/healthz") as response:
+                    if response.status == 200:
+                        break
+            except aiohttp.ClientError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Worker on port {port} did not start")
+            await asyncio.sleep(0.1)
+
+
+async def pending(session, ports) -> int:
+    total = 0
+    for port in ports:
+        async with session.get(f"http://127.0.0.1:{port}/healthz") as response:
+            total += (await response.json())["pending"]
+    return total
+
+
+async def replay(session, ports, sessions, latencies, rejected):
+    # Requests are spread round-robin like a proxy would; each chat waits for its previous ack, like Telegram does
+    targets = itertools.cycle(ports)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+
+    async def run_chat(updates):
+        for update in updates:
+            while True:
+                url = f"http://127.0.0.1:{next(targets)}/webhook"
+                started = time.perf_counter()
+                async with session.post(url, json=update, headers=headers) as response:
+                    await response.read()
+                latencies.append((time.perf_counter() - started) * 1000)
+                if response.status == 200:
+                    break
+                # Telegram keeps redelivering until it gets a 200
+                rejected.append(response.status)
+                await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+
+    await asyncio.gather(*(run_chat(updates) for updates in sessions))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mode", choices=("webhook", "sharded"), default="webhook")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--updates", help="JSON-lines file of recorded updates")
+    args = parser.parse_args()
+
+    api = await FakeBotAPI().start()
+    sessions = load_sessions(args)
+    total = sum(len(updates) for updates in sessions)
+    # Sharded mode has a single ingress port in front of its workers
+    ports = [BASE_PORT + i for i in range(args.workers if args.mode == "webhook" else 1)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log = open(os.path.join(tmp, "bot.log"), "w+")
+        process = start_workers(args, api.base_url, tmp, log)
+        try:
+            async with aiohttp.ClientSession() as session:
+                await wait_ready(session, ports)
+                sent_before = api.sent
+
+                latencies, rejected = [], []
+                started = time.perf_counter()
+                await replay(session, ports, sessions, latencies, rejected)
+                acked = time.perf_counter() - started
+                while await pending(session, ports):
+                    await asyncio.sleep(0.01)
+                finished = time.perf_counter() - started
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+            await api.stop()
+            log.seek(0)
+            errors = [line for line in log if "ERROR" in line or "Traceback" in line]
+            log.close()
+
+    if errors:
+        print(f"{len(errors)} errors in the bot log, first: {errors[0].strip()}")
+
+    latencies.sort()
+    pick = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))]
+    print(f"{args.mode}, {args.workers} worker(s), {len(sessions)} chats, {total} updates, {len(rejected)} deliveries rejected")
+    print(f"ack latency   p50 {pick(0.5):7.2f} ms   p95 {pick(0.95):7.2f} ms   p99 {pick(0.99):7.2f} ms   "
+          f"mean {statistics.mean(latencies):7.2f} ms")
+    print(f"all acked in  {acked:6.2f} s  ({total / acked:7.1f} updates/s)")
+    print(f"all handled in {finished:5.2f} s  ({total / finished:7.1f} updates/s), {api.sent - sent_before} replies sent")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
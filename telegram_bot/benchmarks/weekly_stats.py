@@ -0,0 +1,114 @@
+# Range reports over a synthetic multi-year history: four separate full scans, the single indexed
+# query and the rollup tables. Run from the telegram_bot directory: python -m benchmarks.weekly_stats [years] [expenses_per_day]
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from db.manager import REBUILD_ROLLUPS_SQL, ROLLUP_STATS_SQL, rollup_params
+from utils.categories import DEFAULT_CATEGORIES as CATEGORIES, category_key
+
+YEARS = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+EXPENSES_PER_DAY = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+RUNS = 200
+
+USER_ID = 1
+
+FOUR_QUERIES = (
+    "SELECT SUM(amount) FROM expenses WHERE user_id = :user_id AND date BETWEEN :start AND :end",
+    "SELECT SUM(amount) FROM salary WHERE user_id = :user_id AND date BETWEEN :start AND :end",
+    "SELECT AVG(value) FROM mood WHERE user_id = :user_id AND date BETWEEN :start AND :end",
+    "SELECT SUM(value) FROM mileage WHERE user_id = :user_id AND date BETWEEN :start AND :end",
+)
+
+SINGLE_QUERY = """
+SELECT
+    (SELECT SUM(amount) FROM expenses WHERE user_id = :user_id AND date BETWEEN :start AND :end),
+    (SELECT SUM(amount) FROM salary WHERE user_id = :user_id AND date BETWEEN :start AND :end),
+    (SELECT AVG(value) FROM mood WHERE user_id = :user_id AND date BETWEEN :start AND :end),
+    (SELECT SUM(value) FROM mileage WHERE user_id = :user_id AND date BETWEEN :start AND :end)
+"""
+
+# The raw tables without any secondary index
+BASE_SCHEMA = """
+CREATE TABLE mood (user_id INTEGER NOT NULL, date TEXT NOT NULL, value INTEGER CHECK(value IN (0, 1)), PRIMARY KEY (user_id, date));
+CREATE TABLE mileage (user_id INTEGER NOT NULL, date TEXT NOT NULL, value REAL CHECK(value >= 0), PRIMARY KEY (user_id, date));
+CREATE TABLE categories (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, name TEXT NOT NULL, key TEXT NOT NULL, budget REAL CHECK(budget > 0), active INTEGER NOT NULL DEFAULT 1, UNIQUE (user_id, key));
+CREATE TABLE expenses (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, date TEXT NOT NULL, category_id INTEGER NOT NULL REFERENCES categories (id), amount REAL CHECK(amount >= 0));
+CREATE TABLE salary (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, date TEXT NOT NULL, amount REAL CHECK(amount >= 0));
+"""
+
+
+def populate(conn, days):
+    rng = random.Random(42)
+    start = date.today() - timedelta(days=days)
+    dates = [(start + timedelta(days=i)).isoformat() for i in range(days)]
+
+    conn.executemany(
+        "INSERT INTO categories (user_id, name, key) VALUES (?, ?, ?)",
+        ((USER_ID, name, category_key(name)) for name in CATEGORIES)
+    )
+    category_ids = [row[0] for row in conn.execute("SELECT id FROM categories WHERE user_id = ?", (USER_ID,))]
+    conn.executemany(
+        "INSERT INTO expenses (user_id, date, category_id, amount) VALUES (?, ?, ?, ?)",
+        ((USER_ID, d, rng.choice(category_ids), round(rng.uniform(1, 80), 2)) for d in dates for _ in range(EXPENSES_PER_DAY))
+    )
+    conn.executemany("INSERT INTO salary (user_id, date, amount) VALUES (?, ?, ?)", ((USER_ID, d, 2500.0) for d in dates[::7]))
+    conn.executemany("INSERT INTO mood (user_id, date, value) VALUES (?, ?, ?)", ((USER_ID, d, rng.randint(0, 1)) for d in dates))
+    conn.executemany("INSERT INTO mileage (user_id, date, value) VALUES (?, ?, ?)", ((USER_ID, d, rng.uniform(0, 150)) for d in dates))
+    conn.commit()
+
+
+def measure(name, conn, run):
+    for label, days in (("7 days", 6), ("1 year", 364)):
+        params = {
+            "user_id": USER_ID,
+            "start": (date.today() - timedelta(days=days)).isoformat(),
+            "end": date.today().isoformat(),
+        }
+        started = time.perf_counter()
+        for _ in range(RUNS):
+            run(conn, params)
+        per_call = (time.perf_counter() - started) / RUNS * 1000
+        print(f"{name + ', ' + label:<40} {per_call:8.3f} ms/report")
+
+
+def four_queries(conn, params):
+    return [conn.execute(sql, params).fetchone()[0] for sql in FOUR_QUERIES]
+
+
+def single_query(conn, params):
+    return conn.execute(SINGLE_QUERY, params).fetchone()
+
+
+def rollups(conn, params):
+    return conn.execute(ROLLUP_STATS_SQL, rollup_params(USER_ID, params["start"], params["end"])).fetchone()
+
+
+def main():
+    days = YEARS * 365
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "history.db"))
+        conn.executescript(BASE_SCHEMA)
+        populate(conn, days)
+        print(f"{days} days, {days * EXPENSES_PER_DAY} expenses")
+
+        measure("4 queries, no indexes", conn, four_queries)
+        measure("single query, no indexes", conn, single_query)
+
+        with open("db/schema.sql", "r") as f:
+            conn.executescript(f.read())
+        for sql in REBUILD_ROLLUPS_SQL:
+            conn.execute(sql)
+        conn.commit()
+        conn.execute("ANALYZE")
+
+        measure("4 queries, covering indexes", conn, four_queries)
+        measure("single query, covering indexes", conn, single_query)
+        measure("rollup tables", conn, rollups)
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,367 @@
 import asyncio
 import logging
-from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
-from config import BOT_TOKEN, ADMIN_ID
-from db.manager import db
-from handlers import common, expenses, daily
-from jobs.scheduler import setup_scheduler
+import multiprocessing
+import os
+import signal
+from typing import TYPE_CHECKING
+from config import (
+    BOT_TOKEN, ADMIN_ID, DB_PATH, BOT_MODE, TELEGRAM_API_URL, TELEGRAM_GLOBAL_RATE,
+    WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT, WEBHOOK_WORKERS,
+    SHARD_WORKERS, SHARD_INGRESS, SHARD_SOCKET_DIR, SHARD_MAX_PENDING, SHARD_MIN_UPTIME,
+    METRICS_HOST, METRICS_PORT,
+)
 
-async def main():
+# Only the standard library and config at module level: processes started with the spawn context (chart workers,
+# webhook and shard workers) re-import this file as __mp_main__, and aiogram alone takes seconds to import.
+# Everything else is imported by the functions that need it
+if TYPE_CHECKING:
+    from aiogram import Bot, Dispatcher
+
+# Background startup work (the admin notice) that must not be garbage-collected mid-flight
+_background = set()
+
+def setup_logging():
     logging.basicConfig(
         level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
+        format="%(asctime)s - %(levelname)s - %(name)s - %(process)d - %(message)s",
     )
 
-    # Initialize DB
-    await db.create_tables()
+def create_bot() -> "Bot":
+    from aiogram import Bot
+    from utils.payloads import PreparedSession
+    from utils.sender import outbound
 
-    # Initialize Bot and Dispatcher
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
+    server = {}
+    if TELEGRAM_API_URL:
+        from aiogram.client.telegram import TelegramAPIServer
+        server["api"] = TelegramAPIServer.from_base(TELEGRAM_API_URL)
+    # Sends cached keyboards and shared broadcast messages without re-serializing them
+    session = PreparedSession(**server)
 
-    # Send Startup Message
-    await bot.send_message(ADMIN_ID, "Бот запущено дороу! 🚀")
+    bot = Bot(token=BOT_TOKEN, session=session)
+    bot.session.middleware(outbound)  # Rate limits and prioritizes everything we send
+    return bot
+
+def create_dispatcher() -> "Dispatcher":
+    from aiogram import Dispatcher
+    from db.storage import storage
+    from handlers import common, categories, expenses, daily, transfer, rates
+    from utils.middlewares import setup_middlewares
+
+    # FSM flows survive restarts. The FSM middleware is added by setup_middlewares, behind the per-chat inbox
+    dp = Dispatcher(storage=storage, disable_fsm=True)
 
     # Register Routers
     dp.include_router(common.router)
+    dp.include_router(categories.router)
     dp.include_router(expenses.router)
     dp.include_router(daily.router)
+    dp.include_router(transfer.router)
+    dp.include_router(rates.router)
+    setup_middlewares(dp)
+    return dp
+
+async def notify_admin(bot: "Bot"):
+    try:
+        await bot.send_message(ADMIN_ID, "Бот запущено дороу! 🚀")
+    except Exception as e:
+        logging.warning("Startup message to the admin failed: %s", e)
+
+async def startup(bot: "Bot", leader: bool = True):
+    from db.manager import db
+    from utils import charts
+
+    # Initialize DB (opens the connection pool; the schema script only runs when the file is behind)
+    await db.create_tables()
+    # Chart workers import matplotlib in the background so the first report does not wait for it
+    charts.warm_up()
+
+    if not leader:
+        return
+    # The scheduler (and APScheduler, httpx and the job modules with it) is only loaded where it runs
+    from jobs.scheduler import setup_scheduler
+
+    # The admin is always a recipient of the scheduled jobs
+    if ADMIN_ID:
+        await db.register_user(int(ADMIN_ID), int(ADMIN_ID))
+
+    # Send Startup Message while updates start flowing, instead of one Bot API round trip before them
+    task = asyncio.create_task(notify_admin(bot))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
 
     # Setup Scheduler
-    setup_scheduler(bot)
+    await setup_scheduler(bot)
+
+async def shutdown(bot: "Bot"):
+    from db.manager import db
+    from utils import charts
+    from utils.http import close_client
+
+    charts.close()
+    await bot.session.close()
+    await close_client()
+    await db.close()
+
+async def wait_for_signal():
+    # SIGTERM (docker stop, the parent process) shuts down cleanly, flushing pending writes
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        asyncio.get_running_loop().add_signal_handler(signum, stop.set)
+    await stop.wait()
+
+async def start_metrics(port: int):
+    # Returns a cleanup coroutine function
+    if not METRICS_PORT:
+        return lambda: asyncio.sleep(0)
+    from utils.metrics import start_server
+
+    runner = await start_server(METRICS_HOST, port)
+    logging.info("Metrics on http://%s:%d/metrics", METRICS_HOST, port)
+    return runner.cleanup
+
+async def set_webhook(bot: "Bot", dp: "Dispatcher"):
+    if WEBHOOK_BASE_URL:
+        await bot.set_webhook(
+            f"{WEBHOOK_BASE_URL}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+            drop_pending_updates=False,
+        )
+
+def prepare_database():
+    # Create or migrate the schema once, before worker processes race for the write lock on a fresh file
+    # (with its own manager: the shared one must not be bound to this short-lived event loop)
+    from db.manager import DatabaseManager
+
+    async def prepare():
+        manager = DatabaseManager(DB_PATH)
+        await manager.create_tables()
+        await manager.close()
+    asyncio.run(prepare())
+
+def start_process(target, index: int, count: int, name: str, *args):
+    process = multiprocessing.get_context("spawn").Process(
+        target=target, args=(index, count, *args), name=f"{name}-{index}"
+    )
+    process.start()
+    return process
+
+def spawn(target, count: int, name: str, *args):
+    return [start_process(target, i, count, name, *args) for i in range(count)]
+
+async def main():
+    bot = create_bot()
+    dp = create_dispatcher()
+    # getUpdates is refused while a webhook from an earlier webhook-mode run is still registered;
+    # that round trip overlaps with opening the database
+    await asyncio.gather(startup(bot), bot.delete_webhook())
+    stop_metrics = await start_metrics(METRICS_PORT)
 
     # Start Polling
     try:
         await dp.start_polling(bot)
     finally:
-        await bot.session.close()
+        await stop_metrics()
+        await shutdown(bot)
+
+async def run_webhook(worker: int = 0, workers: int = 1):
+    from aiohttp import web
+    from db.manager import db
+    from db.storage import storage
+    from utils.ratelimit import TokenBucket
+    from utils.sender import outbound
+    from utils.webhook import create_app
+
+    # Worker 0 is the leader: it owns the webhook registration and the scheduler
+    leader = worker == 0
+    bot = create_bot()
+    dp = create_dispatcher()
+    if workers > 1:
+        # The proxy spreads a chat over all workers, so FSM state has to be read from and written to the
+        # file on every step, cached month totals can miss another worker's expenses, and the Bot API budget is
+        # shared between them
+        storage.shared = db.shared = True
+        outbound.global_bucket = TokenBucket(TELEGRAM_GLOBAL_RATE / workers)
+
+    await startup(bot, leader)
+    if leader:
+        await set_webhook(bot, dp)
+
+    runner = web.AppRunner(create_app(dp, bot), access_log=None)  # One line per update is just noise
+    await runner.setup()
+    await web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT + worker).start()
+    logging.info("Webhook worker %d listening on %s:%d", worker, WEBAPP_HOST, WEBAPP_PORT + worker)
+
+    try:
+        await wait_for_signal()
+    finally:
+        await runner.cleanup()
+        await shutdown(bot)
+
+def webhook_worker(worker: int, workers: int):
+    setup_logging()
+    asyncio.run(run_webhook(worker, workers))
+
+def serve_webhook(workers: int = WEBHOOK_WORKERS):
+    if workers == 1:
+        webhook_worker(0, 1)
+        return
+
+    prepare_database()
+
+    # One process per port; see nginx.conf for the proxy in front of them
+    processes = spawn(webhook_worker, workers, "webhook")
+
+    def stop(signum, frame):
+        for process in processes:
+            process.terminate()
+
+    # Ctrl+C reaches the whole process group; SIGTERM only reaches us and is passed on
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, stop)
+    for process in processes:
+        process.join()
+
+async def run_shard(index: int, shards: int):
+    from utils.ratelimit import TokenBucket
+    from utils.sender import outbound
+    from utils.shards import serve_shard, socket_path
+    from utils.updates import UpdateRunner
+
+    bot = create_bot()
+    dp = create_dispatcher()
+    # A shard is the only process that sees its chats, so the FSM cache stays on;
+    # the Bot API budget is split between the shards and the ingress
+    outbound.global_bucket = TokenBucket(TELEGRAM_GLOBAL_RATE / (shards + 1))
+    await startup(bot, leader=False)
+
+    runner = UpdateRunner(dp, bot)
+    server = await serve_shard(socket_path(SHARD_SOCKET_DIR, index), runner)
+    stop_metrics = await start_metrics(METRICS_PORT + 1 + index)
+    logging.info("Shard %d of %d ready.", index, shards)
+    try:
+        await wait_for_signal()
+    finally:
+        await stop_metrics()
+        server.close()
+        await runner.drain()
+        await shutdown(bot)
+
+def shard_worker(index: int, shards: int):
+    setup_logging()
+    asyncio.run(run_shard(index, shards))
+
+async def poll_updates(bot: "Bot", dp: "Dispatcher", router):
+    # getUpdates without the dispatcher: updates are only forwarded, waiting while their shard is full
+    offset = None
+    allowed = dp.resolve_used_update_types()
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=allowed)
+        except Exception as e:
+            logging.warning("getUpdates failed: %s", e)
+            await asyncio.sleep(1)
+            continue
+        for update in updates:
+            data = update.model_dump(mode="json", exclude_none=True, by_alias=True)
+            # A failed send (the shard's socket broke, the shard is restarting) is retried rather than ending the
+            # poller; the offset only moves past updates that reached a shard
+            while True:
+                try:
+                    await router.route(data)
+                    break
+                except Exception as e:
+                    logging.warning("Routing update %d failed: %s", update.update_id, e)
+                    await asyncio.sleep(1)
+            offset = update.update_id + 1
+
+async def supervise_shards(processes: list, router):
+    # A shard that exits is started again and its link reconnected (updates it had in flight are lost). One that
+    # exits within SHARD_MIN_UPTIME seconds of starting would only crash again: the ingress then stops with an
+    # error, so the whole bot exits and its own supervisor (docker's restart policy) starts it afresh
+    loop = asyncio.get_running_loop()
+    started = [loop.time()] * len(processes)
+    while True:
+        await asyncio.sleep(1)
+        for index, process in enumerate(processes):
+            if process.is_alive():
+                continue
+            if loop.time() - started[index] < SHARD_MIN_UPTIME:
+                raise RuntimeError(f"Shard {index} exited with code {process.exitcode} right after starting")
+            logging.error("Shard %d exited with code %s, restarting it.", index, process.exitcode)
+            processes[index] = start_process(shard_worker, index, len(processes), "shard")
+            started[index] = loop.time()
+            await router.links[index].connect()
+
+async def run_ingress(shards: int, processes: list):
+    from utils.ratelimit import TokenBucket
+    from utils.sender import outbound
+    from utils.shards import ShardRouter
+
+    # The ingress is the leader: it receives every update and runs the scheduler, but handles nothing itself
+    bot = create_bot()
+    dp = create_dispatcher()
+    outbound.global_bucket = TokenBucket(TELEGRAM_GLOBAL_RATE / (shards + 1))
+    router = ShardRouter(SHARD_SOCKET_DIR, shards, SHARD_MAX_PENDING)
+    await router.connect()
+    await startup(bot)
+    watched = [asyncio.create_task(wait_for_signal()), asyncio.create_task(supervise_shards(processes, router))]
+
+    if SHARD_INGRESS == "webhook":
+        from aiohttp import web
+        from utils.webhook import create_ingress_app
+
+        receiver = web.AppRunner(create_ingress_app(router), access_log=None)
+        await receiver.setup()
+        await web.TCPSite(receiver, WEBAPP_HOST, WEBAPP_PORT).start()
+        await set_webhook(bot, dp)
+        logging.info("Ingress listening on %s:%d for %d shards", WEBAPP_HOST, WEBAPP_PORT, shards)
+        cleanup = receiver.cleanup
+    else:
+        await bot.delete_webhook()
+        poller = asyncio.create_task(poll_updates(bot, dp, router))
+        watched.append(poller)
+        stop_metrics = await start_metrics(METRICS_PORT)
+        logging.info("Ingress polling for %d shards", shards)
+
+        async def cleanup():
+            poller.cancel()
+            await stop_metrics()
+
+    try:
+        # Until a signal, or until the supervisor or the poller fails: their error ends the process
+        done, _ = await asyncio.wait(watched, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    finally:
+        for task in watched:
+            task.cancel()
+        await cleanup()
+        await router.close()
+        await shutdown(bot)
+
+def serve_sharded(shards: int = SHARD_WORKERS):
+    prepare_database()
+    os.makedirs(SHARD_SOCKET_DIR, exist_ok=True)
+    processes = spawn(shard_worker, shards, "shard")
+
+    setup_logging()
+    try:
+        asyncio.run(run_ingress(shards, processes))
+    finally:
+        # Shards (restarted ones included: the list is updated in place) stop after the ingress, so nothing is
+        # forwarded to a closed socket
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if BOT_MODE == "webhook":
+        serve_webhook()
+    elif BOT_MODE == "sharded":
+        serve_sharded()
+    else:
+        setup_logging()
+        asyncio.run(main())
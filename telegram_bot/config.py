@@ -7,7 +7,135 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 ADMIN_ID = os.getenv("ADMIN_ID")  # Optional: for admin-specific notifications if needed
 DB_PATH = os.getenv("DB_PATH", "bot.db")
 
-# Weather Configuration (Longford, Ireland)
+# Database connection pool
+DB_READERS = int(os.getenv("DB_READERS", "4"))  # Read-only connections next to the single writer
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))  # Page cache per connection
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(64 * 1024 * 1024)))
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", "128"))  # Prepared statements kept per connection
+
+# Write-behind queue: pending inserts are committed together once either limit is reached
+DB_BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", "200"))
+DB_FLUSH_INTERVAL = float(os.getenv("DB_FLUSH_INTERVAL", "0.1"))  # Seconds
+
+# Export/import: rows per cursor fetch, file write and import transaction
+TRANSFER_CHUNK_SIZE = int(os.getenv("TRANSFER_CHUNK_SIZE", "10000"))
+
+# Analytics: columnar histories kept in memory for the most recently active users
+ANALYTICS_CACHE_USERS = int(os.getenv("ANALYTICS_CACHE_USERS", "256"))
+FUEL_CATEGORY = os.getenv("FUEL_CATEGORY", "Паливо")  # Expense category used for fuel cost per km
+
+# Expense categories: a user's list is cached in each process and re-read after CATEGORY_CACHE_TTL seconds, so
+# changes made through another worker show up. Month-to-date spending is kept for the whole month, and re-read
+# after CATEGORY_CACHE_TTL only in multi-worker webhook mode, where another worker may add a user's expenses
+CATEGORIES_PER_USER = int(os.getenv("CATEGORIES_PER_USER", "20"))
+CATEGORY_CACHE_TTL = float(os.getenv("CATEGORY_CACHE_TTL", "60"))
+BUDGET_WARN_AT = [float(x) for x in os.getenv("BUDGET_WARN_AT", "0.8,1").split(",")]  # Shares of a budget that get a warning
+
+# Charts: rendered in a process pool, rendered PNGs cached per (user, chart, day, data version)
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "2"))
+CHART_CACHE_SIZE = int(os.getenv("CHART_CACHE_SIZE", "512"))
+
+# FSM storage: flows persist in SQLite behind an in-process LRU cache
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "10000"))  # Chats kept in memory
+FSM_TTL = float(os.getenv("FSM_TTL", str(24 * 3600)))  # Abandoned flows are forgotten after this many seconds
+
+# Update delivery: "polling" (getUpdates) or "webhook" (aiohttp server behind a reverse proxy)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")  # Optional Bot API server, e.g. a local one or a load-test fake
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL")  # Public https:// address of the proxy; setWebhook is skipped without it
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # Checked against X-Telegram-Bot-Api-Secret-Token
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "127.0.0.1")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))  # Worker i listens on WEBAPP_PORT + i
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))
+WEBHOOK_MAX_PENDING = int(os.getenv("WEBHOOK_MAX_PENDING", "1000"))  # Beyond this Telegram gets a 503 and retries later
+
+# Incoming updates, every mode (utils/middlewares.ChatInbox): at most UPDATE_CONCURRENCY run handlers at once per
+# process and a chat's updates run one after another. Once CHAT_INBOX_SIZE updates of one chat are queued new ones
+# are dropped, and the same button or command sent again within CHAT_DEBOUNCE seconds is ignored
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", os.getenv("WEBHOOK_CONCURRENCY", "64")))
+CHAT_INBOX_SIZE = int(os.getenv("CHAT_INBOX_SIZE", "20"))
+CHAT_DEBOUNCE = float(os.getenv("CHAT_DEBOUNCE", "2"))
+
+# BOT_MODE=sharded: one ingress process (polling or webhook, also runs the scheduler) routes every chat
+# to one of SHARD_WORKERS handler processes over Unix sockets
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "4"))
+SHARD_INGRESS = os.getenv("SHARD_INGRESS", "polling")
+SHARD_SOCKET_DIR = os.getenv("SHARD_SOCKET_DIR", "/tmp/telegram_bot_shards")
+SHARD_MAX_PENDING = int(os.getenv("SHARD_MAX_PENDING", "500"))  # Updates in flight per worker before the ingress holds back
+# A worker that exits is restarted, unless it lived less than this many seconds: then the whole bot exits with an error
+SHARD_MIN_UPTIME = float(os.getenv("SHARD_MIN_UPTIME", "60"))
+
+# Prometheus metrics at /metrics. Webhook apps serve it on their own port; polling and the sharded
+# ingress listen on METRICS_PORT, shard i on METRICS_PORT + 1 + i. 0 turns the extra listeners off
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+# Outbound messages: Telegram allows ~30 messages/s overall and ~1 message/s per chat
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_CHAT_BURST = float(os.getenv("TELEGRAM_CHAT_BURST", "3"))  # Short bursts per chat, e.g. a reply plus a prompt
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))  # Retries after a flood-control (429) error
+BROADCAST_QUEUE_LIMIT = int(os.getenv("BROADCAST_QUEUE_LIMIT", "5000"))  # Broadcast sends are dropped beyond this depth
+# Scheduled broadcasts reach each user at a fixed offset within this many seconds instead of all at once;
+# kept under WEATHER_CACHE_TTL so the morning check-in still reads the prefetched weather
+BROADCAST_SPREAD = float(os.getenv("BROADCAST_SPREAD", "300"))
+
+# Scheduler: jobs are stored in the database; a run missed by up to SCHEDULER_MISFIRE_GRACE seconds (a restart,
+# a stalled loop) still happens, and several missed runs of one job are coalesced into one
+SCHEDULER_MISFIRE_GRACE = int(os.getenv("SCHEDULER_MISFIRE_GRACE", "1800"))
+SCHEDULER_COALESCE = os.getenv("SCHEDULER_COALESCE", "1") == "1"
+# /timezone only stores the zone (it may run in any process); the leader's scheduler picks up new zones this often
+TIMEZONE_SYNC_INTERVAL = float(os.getenv("TIMEZONE_SYNC_INTERVAL", "60"))
+
+# Upstream HTTP (Open-Meteo, NBU, CoinGecko): one shared keep-alive client
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+
+# Upstream resilience (utils/http.py), per host. Timeouts are per attempt; HTTP_TIMEOUT covers unlisted hosts
+HTTP_HOST_TIMEOUTS = {
+    host: float(seconds) for host, seconds in (
+        item.split("=") for item in
+        os.getenv("HTTP_HOST_TIMEOUTS", "api.open-meteo.com=4,bank.gov.ua=3,api.coingecko.com=3").split(",") if item
+    )
+}
+# Timeouts, connection errors, 429 and 5xx are retried HTTP_RETRIES times, a random 0..HTTP_BACKOFF * 2^attempt
+# seconds apart (at most HTTP_BACKOFF_MAX)
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.25"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "2"))
+# A second copy of a request that has not answered after this many seconds; the first answer wins. 0 turns it off
+HTTP_HEDGE_AFTER = float(os.getenv("HTTP_HEDGE_AFTER", "0"))
+# After BREAKER_FAILURES failed calls in a row a host is not called for BREAKER_RESET seconds (the caches serve
+# their last good value meanwhile), then one probe call decides whether it is back
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", "30"))
+
+# Upstream response caches (seconds); stale values are served this much longer if a refresh fails
+WEATHER_CACHE_TTL = float(os.getenv("WEATHER_CACHE_TTL", "600"))
+FORECAST_CACHE_TTL = float(os.getenv("FORECAST_CACHE_TTL", "3600"))
+RATES_CACHE_TTL = float(os.getenv("RATES_CACHE_TTL", "300"))
+CACHE_STALE_TTL = float(os.getenv("CACHE_STALE_TTL", "21600"))
+
+# Exchange rates: every source is fetched concurrently and gets its own timeout
+RATE_SOURCE_TIMEOUT = float(os.getenv("RATE_SOURCE_TIMEOUT", "5"))
+RATE_FIAT_ASSETS = os.getenv("RATE_FIAT_ASSETS", "USD,EUR,GBP,PLN").split(",")  # Quoted in UAH by the NBU
+RATE_CRYPTO_ASSETS = os.getenv("RATE_CRYPTO_ASSETS", "BTC,ETH,SOL,TON").split(",")  # Quoted in USD by CoinGecko
+
+# Rate alerts: sources are polled every RATE_POLL_INTERVAL seconds (quotes are no fresher than RATES_CACHE_TTL),
+# the last RATE_HISTORY_SIZE changed quotes per asset stay in memory and RATE_HISTORY_DAYS of them in the database
+RATE_POLL_INTERVAL = float(os.getenv("RATE_POLL_INTERVAL", "300"))
+RATE_HISTORY_SIZE = int(os.getenv("RATE_HISTORY_SIZE", "288"))
+RATE_HISTORY_DAYS = int(os.getenv("RATE_HISTORY_DAYS", "90"))
+RATE_ALERTS_PER_USER = int(os.getenv("RATE_ALERTS_PER_USER", "10"))
+RATE_ALERT_REARM = float(os.getenv("RATE_ALERT_REARM", "0.005"))  # A fired threshold re-arms 0.5% back on the other side
+
+# Weather Configuration (Longford, Ireland) for users who have not shared a location
 LATITUDE = 53.727
 LONGITUDE = -7.798
-TIMEZONE = "Europe/Dublin"
+WEATHER_GRID_STEP = float(os.getenv("WEATHER_GRID_STEP", "0.1"))  # Degrees; users in one cell share a forecast
+WEATHER_BATCH_SIZE = int(os.getenv("WEATHER_BATCH_SIZE", "50"))  # Locations per Open-Meteo request
+TIMEZONE = "Europe/Dublin"  # Default for users who have not picked their own
+TIMEZONE_CACHE_TTL = float(os.getenv("TIMEZONE_CACHE_TTL", "60"))  # Per process; re-read for changes made in another one
@@ -1,104 +1,814 @@
+import asyncio
 import aiosqlite
+import datetime as dt
 import logging
-from config import DB_PATH
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+from itertools import groupby
+from config import (
+    DB_PATH, DB_READERS, DB_CACHE_SIZE_KB, DB_MMAP_SIZE, DB_STATEMENT_CACHE,
+    DB_BATCH_SIZE, DB_FLUSH_INTERVAL, TRANSFER_CHUNK_SIZE, TIMEZONE, TIMEZONE_CACHE_TTL, CATEGORY_CACHE_TTL,
+    CATEGORIES_PER_USER,
+)
+from db.migrations import migrate
+from utils.categories import DEFAULT_CATEGORIES, FALLBACK_CATEGORY, category_key, clean_name
+from utils.metrics import DB_SECONDS, QUEUES, expose, instrument
 
 logger = logging.getLogger(__name__)
 
+# Applied to every pooled connection right after it is opened
+PRAGMAS = (
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA synchronous = NORMAL",  # Safe with WAL, skips the fsync on every commit
+    f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}",
+    f"PRAGMA mmap_size = {DB_MMAP_SIZE}",
+    "PRAGMA temp_store = MEMORY",
+)
+
+# Any date range is answered from whole ISO weeks plus the leftover days at either end
+ROLLUP_STATS_SQL = """
+SELECT SUM(expenses), SUM(salary), SUM(mood_sum), SUM(mood_count), SUM(mileage) FROM (
+    SELECT expenses, salary, mood_sum, mood_count, mileage FROM daily_rollup
+    WHERE user_id = :user_id AND (day BETWEEN :head_start AND :head_end OR day BETWEEN :tail_start AND :tail_end)
+    UNION ALL
+    SELECT expenses, salary, mood_sum, mood_count, mileage FROM weekly_rollup
+    WHERE user_id = :user_id AND week BETWEEN :week_start AND :week_end
+)
+"""
+
+ROLLUP_CATEGORY_SQL = """
+SELECT category_id, SUM(amount) AS total FROM (
+    SELECT category_id, amount FROM daily_category_rollup
+    WHERE user_id = :user_id AND (day BETWEEN :head_start AND :head_end OR day BETWEEN :tail_start AND :tail_end)
+    UNION ALL
+    SELECT category_id, amount FROM weekly_category_rollup
+    WHERE user_id = :user_id AND week BETWEEN :week_start AND :week_end
+)
+GROUP BY category_id
+HAVING total > 0.005
+ORDER BY total DESC
+"""
+
+# One user's spending per category in one month, from the daily rollups (at most a row per day and category)
+MONTH_SPENDING_SQL = """
+SELECT category_id, SUM(amount) FROM daily_category_rollup
+WHERE user_id = ? AND day BETWEEN ? AND ?
+GROUP BY category_id
+"""
+
+# Per-day aggregates straight from the raw tables: the source of truth for rebuilds and checks
+RAW_DAILY_SQL = """
+SELECT user_id, day, SUM(expenses), SUM(salary), SUM(mood_sum), SUM(mood_count), SUM(mileage) FROM (
+    SELECT user_id, date AS day, COALESCE(amount, 0) AS expenses, 0 AS salary, 0 AS mood_sum, 0 AS mood_count, 0 AS mileage FROM expenses
+    UNION ALL
+    SELECT user_id, date, 0, COALESCE(amount, 0), 0, 0, 0 FROM salary
+    UNION ALL
+    SELECT user_id, date, 0, 0, COALESCE(value, 0), value IS NOT NULL, 0 FROM mood
+    UNION ALL
+    SELECT user_id, date, 0, 0, 0, 0, COALESCE(value, 0) FROM mileage
+)
+GROUP BY user_id, day
+"""
+
+RAW_DAILY_CATEGORY_SQL = (
+    "SELECT user_id, date, category_id, SUM(COALESCE(amount, 0)) FROM expenses GROUP BY user_id, date, category_id"
+)
+
+# Weekly rollups are refilled by the daily_rollup triggers while the daily rows are inserted
+REBUILD_ROLLUPS_SQL = (
+    "DELETE FROM weekly_category_rollup",
+    "DELETE FROM daily_category_rollup",
+    "DELETE FROM weekly_rollup",
+    "DELETE FROM daily_rollup",
+    f"INSERT INTO daily_rollup (user_id, day, expenses, salary, mood_sum, mood_count, mileage) {RAW_DAILY_SQL}",
+    f"INSERT INTO daily_category_rollup (user_id, day, category_id, amount) {RAW_DAILY_CATEGORY_SQL}",
+)
+
+# Mood and mileage keep one value per day; a second entry replaces the first
+INSERT_SQL = {
+    "mood": "INSERT INTO mood (user_id, date, value) VALUES (?, ?, ?) "
+            "ON CONFLICT (user_id, date) DO UPDATE SET value = excluded.value",
+    "mileage": "INSERT INTO mileage (user_id, date, value) VALUES (?, ?, ?) "
+               "ON CONFLICT (user_id, date) DO UPDATE SET value = excluded.value",
+    "expenses": "INSERT INTO expenses (user_id, date, category_id, amount) VALUES (?, ?, ?, ?)",
+    "salary": "INSERT INTO salary (user_id, date, amount) VALUES (?, ?, ?)",
+}
+
+# A user's raw rows after a given rowid, for the analytics cache to append incrementally
+HISTORY_SQL = {
+    "expenses": "SELECT id, date, amount, category_id FROM expenses WHERE user_id = ? AND id > ? ORDER BY id",
+    "salary": "SELECT id, date, amount FROM salary WHERE user_id = ? AND id > ? ORDER BY id",
+    "mood": "SELECT rowid, date, value FROM mood WHERE user_id = ? AND rowid > ? ORDER BY rowid",
+    "mileage": "SELECT rowid, date, value FROM mileage WHERE user_id = ? AND rowid > ? ORDER BY rowid",
+}
+
+# Mood and mileage are upserted in place, so appended rowids alone do not reveal changes;
+# weighting each value by its rowid also catches two days swapping values
+HISTORY_FINGERPRINT_SQL = """
+SELECT
+    (SELECT COUNT(*) FROM mood WHERE user_id = :user_id),
+    (SELECT TOTAL(value * rowid) FROM mood WHERE user_id = :user_id),
+    (SELECT COUNT(*) FROM mileage WHERE user_id = :user_id),
+    (SELECT TOTAL(value * rowid) FROM mileage WHERE user_id = :user_id)
+"""
+
+# Rate alerts are handed around as dicts with these keys
+RATE_ALERT_FIELDS = ("id", "user_id", "chat_id", "asset", "kind", "value", "reference", "active")
+RATE_ALERT_COLUMNS = ", ".join(RATE_ALERT_FIELDS)
+
+# Consistency checks as (name, expected, actual, key columns)
+ROLLUP_CHECKS = (
+    ("daily_rollup", RAW_DAILY_SQL,
+     "SELECT user_id, day, expenses, salary, mood_sum, mood_count, mileage FROM daily_rollup", 2),
+    ("daily_category_rollup", RAW_DAILY_CATEGORY_SQL,
+     "SELECT user_id, day, category_id, amount FROM daily_category_rollup", 3),
+    ("weekly_rollup",
+     "SELECT user_id, date(day, 'weekday 0', '-6 days') AS week, "
+     "SUM(expenses), SUM(salary), SUM(mood_sum), SUM(mood_count), SUM(mileage) "
+     "FROM daily_rollup GROUP BY user_id, week",
+     "SELECT user_id, week, expenses, salary, mood_sum, mood_count, mileage FROM weekly_rollup", 2),
+    ("weekly_category_rollup",
+     "SELECT user_id, date(day, 'weekday 0', '-6 days') AS week, category_id, SUM(amount) "
+     "FROM daily_category_rollup GROUP BY user_id, week, category_id",
+     "SELECT user_id, week, category_id, amount FROM weekly_category_rollup", 3),
+)
+
+
+def rollup_params(user_id: int, start_date: str, end_date: str) -> dict:
+    start = dt.date.fromisoformat(start_date)
+    end = dt.date.fromisoformat(end_date)
+    # Unused bounds stay NULL, which makes their BETWEEN match nothing
+    params = dict.fromkeys(("head_start", "head_end", "tail_start", "tail_end", "week_start", "week_end"))
+    params["user_id"] = user_id
+
+    first_monday = start + dt.timedelta(days=-start.weekday() % 7)
+    last_sunday = end - dt.timedelta(days=(end.weekday() + 1) % 7)
+    if first_monday > last_sunday:
+        # No whole week inside the range
+        params["head_start"], params["head_end"] = start_date, end_date
+        return params
+
+    if start < first_monday:
+        params["head_start"], params["head_end"] = start_date, (first_monday - dt.timedelta(days=1)).isoformat()
+    if last_sunday < end:
+        params["tail_start"], params["tail_end"] = (last_sunday + dt.timedelta(days=1)).isoformat(), end_date
+    params["week_start"] = first_monday.isoformat()
+    params["week_end"] = (last_sunday - dt.timedelta(days=6)).isoformat()
+    return params
+
+
+def _diff_rows(name: str, expected: list, actual: list, key_size: int) -> list:
+    expected = {tuple(row[:key_size]): row[key_size:] for row in expected}
+    actual = {tuple(row[:key_size]): row[key_size:] for row in actual}
+    problems = []
+    for key in sorted(expected.keys() | actual.keys()):
+        want = expected.get(key)
+        got = actual.get(key)
+        width = len(want or got)
+        want = want or (0,) * width
+        got = got or (0,) * width
+        # Rollups only ever add deltas, so allow for float drift
+        if any(abs((w or 0) - (g or 0)) > 1e-6 for w, g in zip(want, got)):
+            problems.append(f"{name} {key}: expected {tuple(want)}, got {tuple(got)}")
+    return problems
+
 class DatabaseManager:
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, readers: int = DB_READERS):
         self.db_path = db_path
+        self.readers = max(1, readers)
+        self._writer = None
+        self._readers = None  # Queue of the reader connections not checked out
+        self._reader_conns = []  # All of them, so close() also reaches the checked-out ones
+        self._write_lock = asyncio.Lock()
+        self._open_lock = asyncio.Lock()
+        self.shared = False  # Set when other processes write the same users' rows (multi-worker webhook)
+
+        # Write-behind queue of (sql, params) waiting for the next flush
+        self._pending = []
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._flusher = None
+        self._closing = False
+
+        # user_id -> (timezone, loaded_at); re-read after TIMEZONE_CACHE_TTL, /timezone may run in another process
+        self._timezones = {}
+        # user_id -> (loaded_at, {key: (id, name, budget, active)}), and category id -> name
+        self._categories = {}
+        self._category_names = {}
+        # user_id -> (month, loaded_at, {category_id: spent}): running totals for budgets, kept current by add_expense
+        self._month_spending = {}
+        self.write_stats = {
+            "flushes": 0,
+            "rows": 0,
+            "failed_rows": 0,
+            "last_batch_size": 0,
+            "max_batch_size": 0,
+            "last_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+
+    async def _open_connection(self, read_only: bool = False):
+        # cached_statements is the size of sqlite3's prepared-statement LRU for this connection
+        conn = await aiosqlite.connect(self.db_path, cached_statements=DB_STATEMENT_CACHE)
+        pragmas = PRAGMAS + ("PRAGMA query_only = ON",) if read_only else PRAGMAS
+        for pragma in pragmas:
+            # Drain each cursor so no statement keeps a read lock open
+            async with conn.execute(pragma) as cursor:
+                await cursor.fetchall()
+        return conn
+
+    async def connect(self):
+        async with self._open_lock:
+            if self._writer is not None:
+                return
+
+            writer = await self._open_connection()
+            # WAL lets the readers run while the writer commits; the mode is persisted in the file
+            async with writer.execute("PRAGMA journal_mode = WAL") as cursor:
+                await cursor.fetchall()
+
+            readers = asyncio.Queue()
+            conns = [await self._open_connection(read_only=True) for _ in range(self.readers)]
+            for conn in conns:
+                readers.put_nowait(conn)
+
+            self._writer = writer
+            self._readers = readers
+            self._reader_conns = conns
+            self._closing = False
+            self._flusher = asyncio.create_task(self._flush_loop())
+            logger.info("Database pool opened: 1 writer, %d readers.", self.readers)
+
+    async def close(self):
+        async with self._open_lock:
+            if self._writer is None:
+                return
+
+            # Stop the background flusher, then commit whatever is still queued
+            self._closing = True
+            self._wakeup.set()
+            self._batch_full.set()
+            await self._flusher
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Final flush failed.")
+            if self._pending:
+                logger.error("%d queued writes lost on close.", len(self._pending))
+                self._pending = []
+
+            async with self._write_lock:
+                await self._writer.close()
+            for conn in self._reader_conns:
+                await conn.close()
+
+            self._writer = None
+            self._readers = None
+            self._reader_conns = []
+            logger.info("Database pool closed.")
+
+    @asynccontextmanager
+    async def _read(self):
+        if self._writer is None:
+            await self.connect()
+
+        # Read-your-writes: queued or in-flight inserts land before we query. Shielded, so a handler cancelled
+        # here leaves the batch to be committed or rolled back instead of cutting its transaction short
+        if self._pending or self._flush_lock.locked():
+            await asyncio.shield(self.flush())
+
+        # Returned to the queue it came from, which close() may have retired meanwhile
+        readers = self._readers
+        conn = await readers.get()
+        try:
+            yield conn
+        finally:
+            readers.put_nowait(conn)
+
+    @asynccontextmanager
+    async def _write(self):
+        if self._writer is None:
+            await self.connect()
+
+        async with self._write_lock:
+            try:
+                yield self._writer
+                await self._writer.commit()
+            except BaseException:
+                # Cancellation too: the statement still finishes in aiosqlite's thread, and a transaction left
+                # open would be committed along with the next write
+                await self._writer.rollback()
+                raise
+
+    def _enqueue(self, sql: str, params: tuple):
+        self._pending.append((sql, params))
+        self._wakeup.set()
+        if len(self._pending) >= DB_BATCH_SIZE:
+            self._batch_full.set()
+
+    async def _flush_loop(self):
+        while not self._closing:
+            await self._wakeup.wait()
+            try:
+                # Wait out the flush window unless the batch fills up first
+                await asyncio.wait_for(self._batch_full.wait(), DB_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            self._batch_full.clear()
+
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Background flush failed.")
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+
+            batch, self._pending = self._pending, []
+            started = time.perf_counter()
+            failed = 0
+
+            done = 0  # Rows of the batch already committed one by one
+            try:
+                try:
+                    # One transaction for the whole window; consecutive rows of the same statement go through executemany
+                    async with self._write() as db:
+                        for sql, rows in groupby(batch, key=lambda item: item[0]):
+                            await db.executemany(sql, [params for _, params in rows])
+                except sqlite3.Error as e:
+                    logger.warning("Batch of %d writes failed (%s), retrying row by row.", len(batch), e)
+                    for sql, params in batch:
+                        try:
+                            async with self._write() as db:
+                                await db.execute(sql, params)
+                        except sqlite3.Error as e:
+                            failed += 1
+                            logger.error("Dropped write %s %r: %s", sql, params, e)
+                        done += 1
+            except BaseException as e:
+                # Not a bad row but the write itself (closed connection, cancellation). The rows not yet committed
+                # go back to the front of the queue only once a rollback confirms none of them stayed in an open
+                # transaction, or the next commit would write them twice
+                try:
+                    await asyncio.shield(self._writer.rollback())
+                except BaseException:
+                    logger.error("Flush interrupted (%r) and not rolled back, %d writes lost.", e, len(batch) - done)
+                else:
+                    self._pending[:0] = batch[done:]
+                    logger.error("Flush interrupted (%r), %d writes requeued.", e, len(batch) - done)
+                raise
+
+            elapsed = (time.perf_counter() - started) * 1000
+            stats = self.write_stats
+            stats["flushes"] += 1
+            stats["rows"] += len(batch) - failed
+            stats["failed_rows"] += failed
+            stats["last_batch_size"] = len(batch)
+            stats["max_batch_size"] = max(stats["max_batch_size"], len(batch))
+            stats["last_flush_ms"] = elapsed
+            stats["total_flush_ms"] += elapsed
+            logger.debug("Flushed %d writes in %.2f ms.", len(batch), elapsed)
 
     async def create_tables(self):
-        with open("db/schema.sql", "r") as f:
-            schema = f.read()
+        await self.connect()
+        async with self._write_lock:
+            changed = await migrate(self._writer)
+        if not changed:
+            return
+        logger.info("Database tables created/migrated.")
 
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.executescript(schema)
-            await db.commit()
-            logger.info("Database tables created/verified.")
+        # Databases created before the rollups existed get them backfilled once
+        async with self._read() as db:
+            async with db.execute(
+                "SELECT NOT EXISTS (SELECT 1 FROM daily_rollup) AND ("
+                "EXISTS (SELECT 1 FROM expenses) OR EXISTS (SELECT 1 FROM salary) OR "
+                "EXISTS (SELECT 1 FROM mood) OR EXISTS (SELECT 1 FROM mileage))"
+            ) as cursor:
+                needs_backfill = (await cursor.fetchone())[0]
+        if needs_backfill:
+            await self.rebuild_rollups()
 
-    async def add_mood(self, date: str, value: int):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                "INSERT OR REPLACE INTO mood (date, value) VALUES (?, ?)",
-                (date, value)
-            )
-            await db.commit()
+    async def rebuild_rollups(self):
+        await self.flush()
+        async with self._write() as db:
+            for sql in REBUILD_ROLLUPS_SQL:
+                await db.execute(sql)
+        logger.info("Rollup tables rebuilt from raw data.")
 
-    async def add_mileage(self, date: str, value: float):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                "INSERT OR REPLACE INTO mileage (date, value) VALUES (?, ?)",
-                (date, value)
+    async def check_rollups(self) -> list:
+        problems = []
+        async with self._read() as db:
+            for name, expected_sql, actual_sql, key_size in ROLLUP_CHECKS:
+                async with db.execute(expected_sql) as cursor:
+                    expected = await cursor.fetchall()
+                async with db.execute(actual_sql) as cursor:
+                    actual = await cursor.fetchall()
+                problems.extend(_diff_rows(name, expected, actual, key_size))
+        return problems
+
+    async def register_user(self, user_id: int, chat_id: int):
+        # Re-running /start reactivates the user but keeps their timezone
+        self._enqueue(
+            "INSERT INTO users (user_id, chat_id, timezone) VALUES (?, ?, ?) "
+            "ON CONFLICT (user_id) DO UPDATE SET chat_id = excluded.chat_id, active = 1",
+            (user_id, chat_id, TIMEZONE)
+        )
+
+    async def deactivate_user(self, user_id: int):
+        self._enqueue("UPDATE users SET active = 0 WHERE user_id = ?", (user_id,))
+
+    async def set_timezone(self, user_id: int, timezone: str):
+        self._enqueue("UPDATE users SET timezone = ? WHERE user_id = ?", (timezone, user_id))
+        self._timezones[user_id] = (timezone, time.monotonic())
+
+    async def set_location(self, user_id: int, latitude: float, longitude: float):
+        self._enqueue(
+            "UPDATE users SET latitude = ?, longitude = ? WHERE user_id = ?",
+            (latitude, longitude, user_id)
+        )
+
+    async def get_locations(self, timezone: str = None) -> dict:
+        # user_id -> (latitude, longitude) for active users who shared a location
+        sql = "SELECT user_id, latitude, longitude FROM users WHERE active = 1 AND latitude IS NOT NULL"
+        params = ()
+        if timezone is not None:
+            sql += " AND timezone = ?"
+            params = (timezone,)
+        async with self._read() as db:
+            async with db.execute(sql, params) as cursor:
+                return {user_id: (lat, lon) for user_id, lat, lon in await cursor.fetchall()}
+
+    async def get_timezone(self, user_id: int) -> str:
+        entry = self._timezones.get(user_id)
+        if entry is not None and time.monotonic() - entry[1] < TIMEZONE_CACHE_TTL:
+            return entry[0]
+        async with self._read() as db:
+            async with db.execute("SELECT timezone FROM users WHERE user_id = ?", (user_id,)) as cursor:
+                row = await cursor.fetchone()
+        timezone = row[0] if row else TIMEZONE
+        self._timezones[user_id] = (timezone, time.monotonic())
+        return timezone
+
+    async def get_timezones(self):
+        async with self._read() as db:
+            async with db.execute("SELECT DISTINCT timezone FROM users WHERE active = 1") as cursor:
+                return [row[0] for row in await cursor.fetchall()]
+
+    async def get_recipients(self, timezone: str = None):
+        # (user_id, chat_id) of every active user, optionally only those in one timezone
+        async with self._read() as db:
+            if timezone is None:
+                cursor = await db.execute("SELECT user_id, chat_id FROM users WHERE active = 1")
+            else:
+                cursor = await db.execute(
+                    "SELECT user_id, chat_id FROM users WHERE timezone = ? AND active = 1",
+                    (timezone,)
+                )
+            async with cursor:
+                return await cursor.fetchall()
+
+    async def save_fsm(self, key: str, state: str, data: str, updated_at: float):
+        self._enqueue(
+            "INSERT INTO fsm_state (key, state, data, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET state = excluded.state, data = excluded.data, updated_at = excluded.updated_at",
+            (key, state, data, updated_at)
+        )
+
+    async def delete_fsm(self, key: str):
+        self._enqueue("DELETE FROM fsm_state WHERE key = ?", (key,))
+
+    async def load_fsm(self, key: str):
+        # (state, data, updated_at) or None
+        async with self._read() as db:
+            async with db.execute("SELECT state, data, updated_at FROM fsm_state WHERE key = ?", (key,)) as cursor:
+                return await cursor.fetchone()
+
+    async def purge_fsm(self, older_than: float):
+        async with self._write() as db:
+            cursor = await db.execute("DELETE FROM fsm_state WHERE updated_at < ?", (older_than,))
+            return cursor.rowcount
+
+    async def record_job_run(self, job_id: str, scheduled_at: float, started_at: float, finished_at: float, status: str):
+        self._enqueue(
+            "INSERT INTO job_runs (job_id, scheduled_at, started_at, finished_at, status) VALUES (?, ?, ?, ?, ?)",
+            (job_id, scheduled_at, started_at, finished_at, status)
+        )
+
+    async def get_job_runs(self, since: float):
+        async with self._read() as db:
+            async with db.execute(
+                "SELECT job_id, scheduled_at, started_at, finished_at, status FROM job_runs "
+                "WHERE scheduled_at >= ? ORDER BY scheduled_at", (since,)
+            ) as cursor:
+                return await cursor.fetchall()
+
+    async def add_rate_quotes(self, quotes: list):
+        for asset, ts, rate in quotes:
+            self._enqueue("INSERT OR REPLACE INTO rate_quotes (asset, ts, rate) VALUES (?, ?, ?)", (asset, ts, rate))
+
+    async def get_rate_quotes(self, per_asset: int):
+        # (asset, ts, rate) of the last `per_asset` quotes of every asset, oldest first
+        async with self._read() as db:
+            async with db.execute(
+                "SELECT asset, ts, rate FROM ("
+                "SELECT asset, ts, rate, ROW_NUMBER() OVER (PARTITION BY asset ORDER BY ts DESC) AS n FROM rate_quotes"
+                ") WHERE n <= ? ORDER BY asset, ts", (per_asset,)
+            ) as cursor:
+                return await cursor.fetchall()
+
+    async def get_rates_at(self, ts: float) -> dict:
+        # {asset: the quote in effect at ts}, one primary key lookup per asset
+        async with self._read() as db:
+            async with db.execute(
+                "SELECT asset, (SELECT rate FROM rate_quotes q WHERE q.asset = a.asset AND q.ts <= ? ORDER BY ts DESC LIMIT 1) "
+                "FROM (SELECT DISTINCT asset FROM rate_quotes) a", (ts,)
+            ) as cursor:
+                return {asset: rate for asset, rate in await cursor.fetchall() if rate is not None}
+
+    async def purge_rate_quotes(self, older_than: float):
+        # Keeps the last quote of every asset however old it is, so the change since then can still be shown
+        async with self._write() as db:
+            cursor = await db.execute(
+                "DELETE FROM rate_quotes WHERE ts < ? AND ts < (SELECT MAX(ts) FROM rate_quotes q WHERE q.asset = rate_quotes.asset)",
+                (older_than,)
             )
-            await db.commit()
+            return cursor.rowcount
 
-    async def add_expense(self, date: str, category: str, amount: float):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                "INSERT INTO expenses (date, category, amount) VALUES (?, ?, ?)",
-                (date, category, amount)
+    async def add_rate_alert(self, user_id: int, chat_id: int, asset: str, kind: str, value: float) -> int:
+        async with self._write() as db:
+            cursor = await db.execute(
+                "INSERT INTO rate_alerts (user_id, chat_id, asset, kind, value, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, chat_id, asset, kind, value, time.time())
             )
-            await db.commit()
+            return cursor.lastrowid
 
-    async def add_salary(self, date: str, amount: float):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                "INSERT INTO salary (date, amount) VALUES (?, ?)",
-                (date, amount)
+    async def delete_rate_alert(self, user_id: int, alert_id: int) -> bool:
+        # Only deactivated, so the process that evaluates alerts sees the change and drops it
+        async with self._write() as db:
+            cursor = await db.execute(
+                "UPDATE rate_alerts SET active = 0, updated_at = ? WHERE id = ? AND user_id = ? AND active = 1",
+                (time.time(), alert_id, user_id)
             )
-            await db.commit()
+            return cursor.rowcount > 0
 
-    async def get_weekly_stats(self, start_date: str, end_date: str):
-        async with aiosqlite.connect(self.db_path) as db:
-            # Expenses
+    async def get_rate_alerts(self, user_id: int):
+        async with self._read() as db:
             async with db.execute(
-                "SELECT SUM(amount) FROM expenses WHERE date BETWEEN ? AND ?",
-                (start_date, end_date)
+                f"SELECT {RATE_ALERT_COLUMNS} FROM rate_alerts WHERE user_id = ? AND active = 1 ORDER BY id", (user_id,)
             ) as cursor:
-                expenses = (await cursor.fetchone())[0] or 0.0
+                return [dict(zip(RATE_ALERT_FIELDS, row)) for row in await cursor.fetchall()]
 
-            # Salary
+    async def get_changed_rate_alerts(self, since: float):
+        async with self._read() as db:
             async with db.execute(
-                "SELECT SUM(amount) FROM salary WHERE date BETWEEN ? AND ?",
-                (start_date, end_date)
+                f"SELECT {RATE_ALERT_COLUMNS} FROM rate_alerts WHERE updated_at >= ? ORDER BY updated_at", (since,)
             ) as cursor:
-                salary = (await cursor.fetchone())[0] or 0.0
+                return [dict(zip(RATE_ALERT_FIELDS, row)) for row in await cursor.fetchall()]
 
-            # Mood
-            async with db.execute(
-                "SELECT AVG(value) FROM mood WHERE date BETWEEN ? AND ?",
-                (start_date, end_date)
-            ) as cursor:
-                avg_mood = (await cursor.fetchone())[0]
+    async def set_rate_alert_reference(self, alert_id: int, reference: float):
+        # Leaves updated_at alone: the evaluating process already has the new reference
+        self._enqueue("UPDATE rate_alerts SET reference = ? WHERE id = ?", (reference, alert_id))
+
+    async def _user_categories(self, user_id: int, reload: bool = False) -> dict:
+        # key -> (id, name, budget, active) of one user's categories, in keyboard order
+        entry = self._categories.get(user_id)
+        if entry is not None and not reload and time.monotonic() - entry[0] < CATEGORY_CACHE_TTL:
+            return entry[1]
 
-            # Mileage
+        async with self._read() as db:
             async with db.execute(
-                "SELECT SUM(value) FROM mileage WHERE date BETWEEN ? AND ?",
-                (start_date, end_date)
+                "SELECT key, id, name, budget, active FROM categories WHERE user_id = ? ORDER BY id", (user_id,)
             ) as cursor:
-                mileage = (await cursor.fetchone())[0] or 0.0
+                rows = await cursor.fetchall()
+        if not rows:
+            # A new user starts with the default set
+            await self._insert_categories(user_id, DEFAULT_CATEGORIES)
+            return await self._user_categories(user_id, reload=True)
+
+        categories = {key: (category_id, name, budget, active) for key, category_id, name, budget, active in rows}
+        self._categories[user_id] = (time.monotonic(), categories)
+        self._category_names.update((category_id, name) for category_id, name, _, _ in categories.values())
+        return categories
+
+    async def _insert_categories(self, user_id: int, names):
+        async with self._write() as db:
+            await db.executemany(
+                "INSERT INTO categories (user_id, name, key) VALUES (?, ?, ?) ON CONFLICT (user_id, key) DO NOTHING",
+                [(user_id, clean_name(name), category_key(name)) for name in names]
+            )
+
+    async def get_categories(self, user_id: int) -> list:
+        # (id, name, budget) of the user's active categories
+        categories = await self._user_categories(user_id)
+        return [(category_id, name, budget) for category_id, name, budget, active in categories.values() if active]
+
+    async def get_category(self, user_id: int, name: str):
+        # (id, name, budget, active) for any spelling of the name, or None
+        key = category_key(name)
+        category = (await self._user_categories(user_id)).get(key)
+        if category is None:
+            # Maybe added through another process since the cache was filled
+            category = (await self._user_categories(user_id, reload=True)).get(key)
+        return category
+
+    async def category_ids(self, user_id: int, names, create: bool = True) -> dict:
+        # name -> category id. Unknown names become new categories, in order, while the user has fewer than
+        # CATEGORIES_PER_USER active ones; past that (or with create=False) they go to FALLBACK_CATEGORY
+        fallback = category_key(FALLBACK_CATEGORY)
+        keys = {name: category_key(name) or fallback for name in names}
+        categories = await self._user_categories(user_id)
+        missing = list(dict.fromkeys(key for key in keys.values() if key not in categories))
+        if missing:
+            room = CATEGORIES_PER_USER - sum(active for _, _, _, active in categories.values()) if create else 0
+            names_by_key = {key: clean_name(name) for name, key in keys.items()}
+            new = [names_by_key[key] for key in missing[:max(room, 0)]]
+            if fallback not in categories and fallback not in missing[:max(room, 0)]:
+                new.append(FALLBACK_CATEGORY)
+            if new:
+                await self._insert_categories(user_id, new)
+                categories = await self._user_categories(user_id, reload=True)
+        # The fallback is only looked up for names that need it: a user may have no FALLBACK_CATEGORY at all
+        return {name: (categories[key] if key in categories else categories[fallback])[0] for name, key in keys.items()}
+
+    async def _with_category_ids(self, rows: list, create: bool) -> list:
+        # Expense rows (user_id, date, category name, amount) with the name replaced by its id
+        names = {}
+        for user_id, _, category, _ in rows:
+            names.setdefault(user_id, {})[category] = None
+        ids = {}
+        for user_id, user_names in names.items():
+            for name, category_id in (await self.category_ids(user_id, user_names, create)).items():
+                ids[user_id, name] = category_id
+        return [(user_id, date, ids[user_id, category], amount) for user_id, date, category, amount in rows]
+
+    async def get_category_names(self, category_ids) -> dict:
+        # id -> name; a category keeps its name for good, so each id is looked up once per process
+        category_ids = set(category_ids)
+        missing = [category_id for category_id in category_ids if category_id not in self._category_names]
+        if missing:
+            async with self._read() as db:
+                async with db.execute(
+                    f"SELECT id, name FROM categories WHERE id IN ({', '.join('?' * len(missing))})", missing
+                ) as cursor:
+                    self._category_names.update(await cursor.fetchall())
+        return {category_id: self._category_names[category_id] for category_id in category_ids}
+
+    async def get_month_spending(self, user_id: int, month: str) -> dict:
+        # {category_id: spent} in a month ("YYYY-MM"). Read once and then only added to by add_expense, so
+        # a budget check costs a dict lookup for the rest of the month. Only when other processes write the
+        # same users' expenses (shared) is it re-read after CATEGORY_CACHE_TTL
+        entry = self._month_spending.get(user_id)
+        if entry is not None and entry[0] == month and (
+            not self.shared or time.monotonic() - entry[1] < CATEGORY_CACHE_TTL
+        ):
+            return entry[2]
+
+        if self._writer is None:
+            await self.connect()
+        async with self._flush_lock:
+            # No batch commits while this runs, so the queued expenses are exactly the ones the query cannot see
+            readers = self._readers
+            conn = await readers.get()
+            try:
+                async with conn.execute(MONTH_SPENDING_SQL, (user_id, f"{month}-01", f"{month}-31")) as cursor:
+                    spending = dict(await cursor.fetchall())
+            finally:
+                readers.put_nowait(conn)
+            for sql, params in self._pending:
+                if sql == INSERT_SQL["expenses"] and params[0] == user_id and params[1].startswith(month):
+                    spending[params[2]] = spending.get(params[2], 0) + (params[3] or 0)
+            self._month_spending[user_id] = (month, time.monotonic(), spending)
+        return spending
+
+    async def add_category(self, user_id: int, name: str) -> bool:
+        # Adds the category or brings back a removed one; False if it is already active
+        category = await self.get_category(user_id, name)
+        if category is not None and category[3]:
+            return False
+        async with self._write() as db:
+            await db.execute(
+                "INSERT INTO categories (user_id, name, key) VALUES (?, ?, ?) "
+                "ON CONFLICT (user_id, key) DO UPDATE SET active = 1",
+                (user_id, clean_name(name), category_key(name))
+            )
+        await self._user_categories(user_id, reload=True)
+        return True
+
+    async def remove_category(self, user_id: int, name: str) -> bool:
+        # Only deactivated: its expenses stay in the reports
+        await self._user_categories(user_id)
+        async with self._write() as db:
+            cursor = await db.execute(
+                "UPDATE categories SET active = 0 WHERE user_id = ? AND key = ? AND active = 1",
+                (user_id, category_key(name))
+            )
+        await self._user_categories(user_id, reload=True)
+        return cursor.rowcount > 0
+
+    async def set_category_budget(self, user_id: int, name: str, budget: float = None) -> bool:
+        await self._user_categories(user_id)  # A new user's defaults are created on first use
+        async with self._write() as db:
+            cursor = await db.execute(
+                "UPDATE categories SET budget = ? WHERE user_id = ? AND key = ? AND active = 1",
+                (budget, user_id, category_key(name))
+            )
+        await self._user_categories(user_id, reload=True)
+        return cursor.rowcount > 0
+
+    async def add_mood(self, user_id: int, date: str, value: int):
+        self._enqueue(INSERT_SQL["mood"], (user_id, date, value))
+
+    async def add_mileage(self, user_id: int, date: str, value: float):
+        self._enqueue(INSERT_SQL["mileage"], (user_id, date, value))
+
+    async def add_expense(self, user_id: int, date: str, category: str, amount: float):
+        # category is a name in any spelling; an unknown one is created
+        category_id = (await self.category_ids(user_id, (category,)))[category]
+        self._enqueue(INSERT_SQL["expenses"], (user_id, date, category_id, amount))
+        entry = self._month_spending.get(user_id)
+        if entry is not None and entry[0] == date[:7]:
+            entry[2][category_id] = entry[2].get(category_id, 0) + amount
+
+    async def add_salary(self, user_id: int, date: str, amount: float):
+        self._enqueue(INSERT_SQL["salary"], (user_id, date, amount))
+
+    async def bulk_insert(self, rows_by_table: dict, create_categories: bool = True) -> int:
+        # {table: [params, ...]} in one transaction, one executemany per table; the rollup triggers
+        # see every row exactly as they do for single inserts. Expense category names that are not the
+        # user's categories yet are created within the limit (see category_ids), or all go to FALLBACK_CATEGORY
+        if rows_by_table.get("expenses"):
+            expenses = await self._with_category_ids(rows_by_table["expenses"], create_categories)
+            rows_by_table = {**rows_by_table, "expenses": expenses}
+        async with self._write() as db:
+            for table, rows in rows_by_table.items():
+                if rows:
+                    await db.executemany(INSERT_SQL[table], rows)
+        for user_id in {row[0] for row in rows_by_table.get("expenses", ())}:
+            self._month_spending.pop(user_id, None)
+        return sum(len(rows) for rows in rows_by_table.values())
+
+    async def stream(self, sql: str, params: tuple = (), chunk_size: int = TRANSFER_CHUNK_SIZE):
+        # Rows in chunks straight from one cursor, so an export never holds a whole table in memory
+        async with self._read() as db:
+            async with db.execute(sql, params) as cursor:
+                while rows := await cursor.fetchmany(chunk_size):
+                    yield rows
+
+    async def get_weekly_stats(self, user_id: int, start_date: str, end_date: str):
+        async with self._read() as db:
+            async with db.execute(ROLLUP_STATS_SQL, rollup_params(user_id, start_date, end_date)) as cursor:
+                expenses, salary, mood_sum, mood_count, mileage = await cursor.fetchone()
 
         return {
-            "expenses": expenses,
-            "salary": salary,
-            "avg_mood": avg_mood,
-            "mileage": mileage
+            "expenses": expenses or 0.0,
+            "salary": salary or 0.0,
+            "avg_mood": mood_sum / mood_count if mood_count else None,
+            "mileage": mileage or 0.0
         }
 
-    async def get_last_data(self):
-        async with aiosqlite.connect(self.db_path) as db:
+    async def get_category_totals(self, user_id: int, start_date: str, end_date: str):
+        async with self._read() as db:
+            async with db.execute(ROLLUP_CATEGORY_SQL, rollup_params(user_id, start_date, end_date)) as cursor:
+                totals = await cursor.fetchall()
+        names = await self.get_category_names(category_id for category_id, _ in totals)
+        return [(names[category_id], total) for category_id, total in totals]
+
+    async def get_history(self, table: str, user_id: int, after: int = 0):
+        async with self._read() as db:
+            async with db.execute(HISTORY_SQL[table], (user_id, after)) as cursor:
+                return await cursor.fetchall()
+
+    async def get_history_fingerprint(self, user_id: int):
+        async with self._read() as db:
+            async with db.execute(HISTORY_FINGERPRINT_SQL, {"user_id": user_id}) as cursor:
+                return await cursor.fetchone()
+
+    async def get_last_data(self, user_id: int):
+        async with self._read() as db:
             # Last Mood
-            async with db.execute("SELECT date, value FROM mood ORDER BY date DESC LIMIT 1") as cursor:
+            async with db.execute(
+                "SELECT date, value FROM mood WHERE user_id = ? ORDER BY date DESC LIMIT 1", (user_id,)
+            ) as cursor:
                 mood = await cursor.fetchone()
 
             # Last Mileage
-            async with db.execute("SELECT date, value FROM mileage ORDER BY date DESC LIMIT 1") as cursor:
+            async with db.execute(
+                "SELECT date, value FROM mileage WHERE user_id = ? ORDER BY date DESC LIMIT 1", (user_id,)
+            ) as cursor:
                 mileage = await cursor.fetchone()
 
             # Last 3 Expenses
-            async with db.execute("SELECT date, category, amount FROM expenses ORDER BY date DESC LIMIT 3") as cursor:
+            async with db.execute(
+                "SELECT date, category_id, amount FROM expenses WHERE user_id = ? ORDER BY date DESC LIMIT 3", (user_id,)
+            ) as cursor:
                 expenses = await cursor.fetchall()
+        names = await self.get_category_names(category_id for _, category_id, _ in expenses)
+        expenses = [(date, names[category_id], amount) for date, category_id, amount in expenses]
 
         return {
             "mood": mood,
@@ -106,4 +816,8 @@ class DatabaseManager:
             "expenses": expenses
         }
 
+instrument(DatabaseManager, DB_SECONDS, "db")
+
 db = DatabaseManager(DB_PATH)
+QUEUES["db_writes"] = lambda: len(db._pending)
+expose("bot_db_writes", "Write-behind queue counters.", db.write_stats)
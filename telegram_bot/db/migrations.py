@@ -0,0 +1,226 @@
+import logging
+import os
+from collections import Counter
+from config import ADMIN_ID
+from utils.categories import DEFAULT_CATEGORIES, FALLBACK_CATEGORY, category_key, clean_name
+
+logger = logging.getLogger(__name__)
+
+# Rollup objects from before the per-user schema; schema.sql recreates them keyed by user
+LEGACY_TRIGGERS = (
+    "expenses_rollup_insert", "expenses_rollup_delete", "expenses_rollup_update",
+    "salary_rollup_insert", "salary_rollup_delete", "salary_rollup_update",
+    "mood_rollup_insert", "mood_rollup_delete", "mood_rollup_update",
+    "mileage_rollup_insert", "mileage_rollup_delete", "mileage_rollup_update",
+    "daily_rollup_insert", "daily_rollup_update",
+    "daily_category_rollup_insert", "daily_category_rollup_update",
+)
+LEGACY_ROLLUPS = ("daily_rollup", "weekly_rollup", "daily_category_rollup", "weekly_category_rollup")
+LEGACY_INDEXES = ("idx_expenses_date_amount", "idx_expenses_date_category_amount", "idx_salary_date_amount")
+
+# (table, new definition, copied columns)
+USER_TABLES = (
+    ("mood", """
+        CREATE TABLE mood_new (
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            value INTEGER CHECK(value IN (0, 1)),
+            PRIMARY KEY (user_id, date)
+        )""", "date, value"),
+    ("mileage", """
+        CREATE TABLE mileage_new (
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            value REAL CHECK(value >= 0),
+            PRIMARY KEY (user_id, date)
+        )""", "date, value"),
+    ("expenses", """
+        CREATE TABLE expenses_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            category TEXT NOT NULL,
+            amount REAL CHECK(amount >= 0)
+        )""", "id, date, category, amount"),
+    ("salary", """
+        CREATE TABLE salary_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            amount REAL CHECK(amount >= 0)
+        )""", "id, date, amount"),
+)
+
+
+async def _add_user_id(db):
+    # Single-user history belongs to the admin; without one it is parked under user 0
+    owner = int(ADMIN_ID) if ADMIN_ID else 0
+
+    for trigger in LEGACY_TRIGGERS:
+        await db.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    for table in LEGACY_ROLLUPS:
+        await db.execute(f"DROP TABLE IF EXISTS {table}")
+    for index in LEGACY_INDEXES:
+        await db.execute(f"DROP INDEX IF EXISTS {index}")
+
+    for table, create, columns in USER_TABLES:
+        await db.execute(create)
+        await db.execute(
+            f"INSERT INTO {table}_new (user_id, {columns}) SELECT ?, {columns} FROM {table}",
+            (owner,)
+        )
+        await db.execute(f"DROP TABLE {table}")
+        await db.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+    logger.info("Existing history assigned to user %s.", owner)
+
+
+async def _add_user_location(db):
+    # users only exists here if it was created by an earlier version; otherwise schema.sql creates it
+    async with db.execute("PRAGMA table_info(users)") as cursor:
+        columns = {row[1] for row in await cursor.fetchall()}
+    for column in ("latitude", "longitude"):
+        if columns and column not in columns:
+            await db.execute(f"ALTER TABLE users ADD COLUMN {column} REAL")
+
+
+CATEGORIES_TABLE = """
+    CREATE TABLE categories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        key TEXT NOT NULL,
+        budget REAL CHECK(budget > 0),
+        active INTEGER NOT NULL DEFAULT 1,
+        UNIQUE (user_id, key)
+    )"""
+
+EXPENSES_BY_CATEGORY_ID = """
+    CREATE TABLE expenses_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        category_id INTEGER NOT NULL REFERENCES categories (id),
+        amount REAL CHECK(amount >= 0)
+    )"""
+
+
+def _most_used(spellings: Counter) -> str:
+    # On a tie the spelling of the default category button wins
+    return max(spellings, key=lambda name: (spellings[name], name in DEFAULT_CATEGORIES))
+
+
+async def _normalize_categories(db):
+    # Free-text expenses.category -> categories rows referenced by expenses.category_id. Spellings that differ only
+    # in case or spacing become one category named after the most used one, and every user gets the defaults
+    async with db.execute("SELECT user_id, category, COUNT(*) FROM expenses GROUP BY user_id, category") as cursor:
+        spellings = await cursor.fetchall()
+    async with db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users'") as cursor:
+        has_users = await cursor.fetchone()
+    users = set()
+    if has_users:
+        async with db.execute("SELECT user_id FROM users") as cursor:
+            users = {row[0] for row in await cursor.fetchall()}
+
+    counts = {}  # (user_id, key) -> Counter of spellings
+    for user_id, category, count in spellings:
+        name = clean_name(category) or FALLBACK_CATEGORY
+        counts.setdefault((user_id, category_key(name)), Counter())[name] += count
+    defaults = {category_key(name): i for i, name in enumerate(DEFAULT_CATEGORIES)}
+    for user_id in users | {user_id for user_id, _, _ in spellings}:
+        for name in DEFAULT_CATEGORIES:
+            counts.setdefault((user_id, category_key(name)), Counter())[name] += 0
+
+    # Ids in keyboard order: the defaults first, then the most used
+    order = sorted(counts, key=lambda k: (k[0], defaults.get(k[1], len(defaults)), -sum(counts[k].values())))
+    await db.execute(CATEGORIES_TABLE)
+    await db.executemany(
+        "INSERT INTO categories (user_id, name, key) VALUES (?, ?, ?)",
+        [(user_id, _most_used(counts[user_id, key]), key) for user_id, key in order]
+    )
+    async with db.execute("SELECT user_id, key, id FROM categories") as cursor:
+        ids = {(user_id, key): category_id for user_id, key, category_id in await cursor.fetchall()}
+
+    # One INSERT ... SELECT through a spelling -> id map rewrites every expense
+    await db.execute(
+        "CREATE TEMP TABLE category_map (user_id INTEGER, category TEXT, category_id INTEGER, "
+        "PRIMARY KEY (user_id, category))"
+    )
+    await db.executemany(
+        "INSERT INTO category_map VALUES (?, ?, ?)",
+        [(user_id, category, ids[user_id, category_key(clean_name(category) or FALLBACK_CATEGORY)])
+         for user_id, category, _ in spellings]
+    )
+    # The rollups are keyed by category now; create_tables rebuilds them all from the raw rows
+    for trigger in LEGACY_TRIGGERS:
+        await db.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    for table in LEGACY_ROLLUPS:
+        await db.execute(f"DROP TABLE IF EXISTS {table}")
+    await db.execute(EXPENSES_BY_CATEGORY_ID)
+    await db.execute(
+        "INSERT INTO expenses_new (id, user_id, date, category_id, amount) "
+        "SELECT e.id, e.user_id, e.date, m.category_id, e.amount FROM expenses e "
+        "JOIN category_map m ON m.user_id = e.user_id AND m.category = e.category"
+    )
+    await db.execute("DROP TABLE expenses")
+    await db.execute("ALTER TABLE expenses_new RENAME TO expenses")
+    await db.execute("DROP TABLE category_map")
+
+    logger.info("%d category spellings normalized into %d categories.", len(spellings), len(ids))
+
+
+async def _drop_expenses_date_amount_index(db):
+    # idx_expenses_user_date_category_amount serves the same (user_id, date) range scans; this one only made
+    # every expense insert update one more index
+    await db.execute("DROP INDEX IF EXISTS idx_expenses_user_date_amount")
+
+
+# (version, description, step); schema.sql always describes the latest version and is applied (it is all
+# IF NOT EXISTS) whenever a file is behind, so a version whose changes are only new tables or indexes has no step.
+# Anything added to schema.sql needs a new version here, or existing databases never get it
+MIGRATIONS = (
+    (1, "per-user data", _add_user_id),
+    (2, "user locations", _add_user_location),
+    (3, "FSM state, scheduler jobs and rate alerts", None),
+    (4, "expense categories by id", _normalize_categories),
+    (5, "redundant expenses index dropped", _drop_expenses_date_amount_index),
+)
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schema.sql")
+
+
+async def _scalar(db, sql: str):
+    async with db.execute(sql) as cursor:
+        row = await cursor.fetchone()
+    return row[0] if row else None
+
+
+async def migrate(db) -> bool:
+    # True if the schema was created or changed; a current file costs one PRAGMA read
+    version = await _scalar(db, "PRAGMA user_version")
+    if version >= SCHEMA_VERSION:
+        return False
+
+    # A brand-new file gets schema.sql directly; only files with data from older versions need steps
+    has_tables = await _scalar(db, "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'mood'")
+    steps = [step for step in MIGRATIONS if step[0] > version and step[2]] if has_tables else []
+    with open(SCHEMA_PATH) as f:
+        schema = f.read()
+
+    await db.execute("BEGIN")
+    try:
+        for step_version, description, step in steps:
+            logger.info("Migrating database to version %d (%s).", step_version, description)
+            await step(db)
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+
+    # executescript commits on its own, so it runs after the steps; every statement in it is idempotent
+    await db.executescript(schema)
+    await db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    await db.commit()
+    logger.info("Database schema at version %d.", SCHEMA_VERSION)
+    return True
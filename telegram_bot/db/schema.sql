@@ -1,22 +1,273 @@
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    chat_id INTEGER NOT NULL,
+    timezone TEXT NOT NULL DEFAULT 'Europe/Dublin',
+    latitude REAL,
+    longitude REAL,
+    active INTEGER NOT NULL DEFAULT 1,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_users_timezone ON users (timezone, active);
+
 CREATE TABLE IF NOT EXISTS mood (
-    date TEXT PRIMARY KEY,
-    value INTEGER CHECK(value IN (0, 1))
+    user_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    value INTEGER CHECK(value IN (0, 1)),
+    PRIMARY KEY (user_id, date)
 );
 
 CREATE TABLE IF NOT EXISTS mileage (
-    date TEXT PRIMARY KEY,
-    value REAL CHECK(value >= 0)
+    user_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    value REAL CHECK(value >= 0),
+    PRIMARY KEY (user_id, date)
+);
+
+-- Expense categories, per user. key is the name folded for matching (utils/categories.category_key), so
+-- "їжа " and "Їжа" are one category; a removed category is only deactivated, its expenses keep pointing at it
+CREATE TABLE IF NOT EXISTS categories (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    budget REAL CHECK(budget > 0),  -- Monthly, NULL for none
+    active INTEGER NOT NULL DEFAULT 1,
+    UNIQUE (user_id, key)
 );
 
 CREATE TABLE IF NOT EXISTS expenses (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
     date TEXT NOT NULL,
-    category TEXT NOT NULL,
+    category_id INTEGER NOT NULL REFERENCES categories (id),
     amount REAL CHECK(amount >= 0)
 );
 
 CREATE TABLE IF NOT EXISTS salary (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
     date TEXT NOT NULL,
     amount REAL CHECK(amount >= 0)
 );
+
+-- Covering indexes for date-range reports: the aggregates are answered from the index alone
+CREATE INDEX IF NOT EXISTS idx_expenses_user_date_category_amount ON expenses (user_id, date, category_id, amount);
+CREATE INDEX IF NOT EXISTS idx_salary_user_date_amount ON salary (user_id, date, amount);
+
+-- Rollups: per-user, per-day and per-ISO-week totals, kept current by the triggers below.
+-- A week is keyed by the date of its Monday.
+CREATE TABLE IF NOT EXISTS daily_rollup (
+    user_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    expenses REAL NOT NULL DEFAULT 0,
+    salary REAL NOT NULL DEFAULT 0,
+    mood_sum INTEGER NOT NULL DEFAULT 0,
+    mood_count INTEGER NOT NULL DEFAULT 0,
+    mileage REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day)
+);
+
+CREATE TABLE IF NOT EXISTS weekly_rollup (
+    user_id INTEGER NOT NULL,
+    week TEXT NOT NULL,
+    expenses REAL NOT NULL DEFAULT 0,
+    salary REAL NOT NULL DEFAULT 0,
+    mood_sum INTEGER NOT NULL DEFAULT 0,
+    mood_count INTEGER NOT NULL DEFAULT 0,
+    mileage REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, week)
+);
+
+CREATE TABLE IF NOT EXISTS daily_category_rollup (
+    user_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    category_id INTEGER NOT NULL,
+    amount REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day, category_id)
+);
+
+CREATE TABLE IF NOT EXISTS weekly_category_rollup (
+    user_id INTEGER NOT NULL,
+    week TEXT NOT NULL,
+    category_id INTEGER NOT NULL,
+    amount REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, week, category_id)
+);
+
+-- Raw rows -> daily rollups (an update is applied as "remove OLD, add NEW")
+CREATE TRIGGER IF NOT EXISTS expenses_rollup_insert AFTER INSERT ON expenses BEGIN
+    INSERT INTO daily_rollup (user_id, day, expenses) VALUES (NEW.user_id, NEW.date, COALESCE(NEW.amount, 0))
+        ON CONFLICT (user_id, day) DO UPDATE SET expenses = expenses + excluded.expenses;
+    INSERT INTO daily_category_rollup (user_id, day, category_id, amount) VALUES (NEW.user_id, NEW.date, NEW.category_id, COALESCE(NEW.amount, 0))
+        ON CONFLICT (user_id, day, category_id) DO UPDATE SET amount = amount + excluded.amount;
+END;
+
+CREATE TRIGGER IF NOT EXISTS expenses_rollup_delete AFTER DELETE ON expenses BEGIN
+    INSERT INTO daily_rollup (user_id, day, expenses) VALUES (OLD.user_id, OLD.date, -COALESCE(OLD.amount, 0))
+        ON CONFLICT (user_id, day) DO UPDATE SET expenses = expenses + excluded.expenses;
+    INSERT INTO daily_category_rollup (user_id, day, category_id, amount) VALUES (OLD.user_id, OLD.date, OLD.category_id, -COALESCE(OLD.amount, 0))
+        ON CONFLICT (user_id, day, category_id) DO UPDATE SET amount = amount + excluded.amount;
+END;
+
+CREATE TRIGGER IF NOT EXISTS expenses_rollup_update AFTER UPDATE ON expenses BEGIN
+    INSERT INTO daily_rollup (user_id, day, expenses) VALUES (OLD.user_id, OLD.date, -COALESCE(OLD.amount, 0))
+        ON CONFLICT (user_id, day) DO UPDATE SET expenses = expenses + excluded.expenses;
+    INSERT INTO daily_category_rollup (user_id, day, category_id, amount) VALUES (OLD.user_id, OLD.date, OLD.category_id, -COALESCE(OLD.amount, 0))
+        ON CONFLICT (user_id, day, category_id) DO UPDATE SET amount = amount + excluded.amount;
+    INSERT INTO daily_rollup (user_id, day, expenses) VALUES (NEW.user_id, NEW.date, COALESCE(NEW.amount, 0))
+        ON CONFLICT (user_id, day) DO UPDATE SET expenses = expenses + excluded.expenses;
+    INSERT INTO daily_category_rollup (user_id, day, category_id, amount) VALUES (NEW.user_id, NEW.date, NEW.category_id, COALESCE(NEW.amount, 0))
+        ON CONFLICT (user_id, day, category_id) DO UPDATE SET amount = amount + excluded.amount;
+END;
+
+CREATE TRIGGER IF NOT EXISTS salary_rollup_insert AFTER INSERT ON salary BEGIN
+    INSERT INTO daily_rollup (user_id, day, salary) VALUES (NEW.user_id, NEW.date, COALESCE(NEW.amount, 0))
+        ON CONFLICT (user_id, day) DO UPDATE SET salary = salary + excluded.salary;
+END;
+
+CREATE TRIGGER IF NOT EXISTS salary_rollup_delete AFTER DELETE ON salary BEGIN
+    INSERT INTO daily_rollup (user_id, day, salary) VALUES (OLD.user_id, OLD.date, -COALESCE(OLD.amount, 0))
+        ON CONFLICT (user_id, day) DO UPDATE SET salary = salary + excluded.salary;
+END;
+
+CREATE TRIGGER IF NOT EXISTS salary_rollup_update AFTER UPDATE ON salary BEGIN
+    INSERT INTO daily_rollup (user_id, day, salary) VALUES (OLD.user_id, OLD.date, -COALESCE(OLD.amount, 0))
+        ON CONFLICT (user_id, day) DO UPDATE SET salary = salary + excluded.salary;
+    INSERT INTO daily_rollup (user_id, day, salary) VALUES (NEW.user_id, NEW.date, COALESCE(NEW.amount, 0))
+        ON CONFLICT (user_id, day) DO UPDATE SET salary = salary + excluded.salary;
+END;
+
+CREATE TRIGGER IF NOT EXISTS mood_rollup_insert AFTER INSERT ON mood BEGIN
+    INSERT INTO daily_rollup (user_id, day, mood_sum, mood_count) VALUES (NEW.user_id, NEW.date, COALESCE(NEW.value, 0), NEW.value IS NOT NULL)
+        ON CONFLICT (user_id, day) DO UPDATE SET mood_sum = mood_sum + excluded.mood_sum, mood_count = mood_count + excluded.mood_count;
+END;
+
+CREATE TRIGGER IF NOT EXISTS mood_rollup_delete AFTER DELETE ON mood BEGIN
+    INSERT INTO daily_rollup (user_id, day, mood_sum, mood_count) VALUES (OLD.user_id, OLD.date, -COALESCE(OLD.value, 0), -(OLD.value IS NOT NULL))
+        ON CONFLICT (user_id, day) DO UPDATE SET mood_sum = mood_sum + excluded.mood_sum, mood_count = mood_count + excluded.mood_count;
+END;
+
+CREATE TRIGGER IF NOT EXISTS mood_rollup_update AFTER UPDATE ON mood BEGIN
+    INSERT INTO daily_rollup (user_id, day, mood_sum, mood_count) VALUES (OLD.user_id, OLD.date, -COALESCE(OLD.value, 0), -(OLD.value IS NOT NULL))
+        ON CONFLICT (user_id, day) DO UPDATE SET mood_sum = mood_sum + excluded.mood_sum, mood_count = mood_count + excluded.mood_count;
+    INSERT INTO daily_rollup (user_id, day, mood_sum, mood_count) VALUES (NEW.user_id, NEW.date, COALESCE(NEW.value, 0), NEW.value IS NOT NULL)
+        ON CONFLICT (user_id, day) DO UPDATE SET mood_sum = mood_sum + excluded.mood_sum, mood_count = mood_count + excluded.mood_count;
+END;
+
+CREATE TRIGGER IF NOT EXISTS mileage_rollup_insert AFTER INSERT ON mileage BEGIN
+    INSERT INTO daily_rollup (user_id, day, mileage) VALUES (NEW.user_id, NEW.date, COALESCE(NEW.value, 0))
+        ON CONFLICT (user_id, day) DO UPDATE SET mileage = mileage + excluded.mileage;
+END;
+
+CREATE TRIGGER IF NOT EXISTS mileage_rollup_delete AFTER DELETE ON mileage BEGIN
+    INSERT INTO daily_rollup (user_id, day, mileage) VALUES (OLD.user_id, OLD.date, -COALESCE(OLD.value, 0))
+        ON CONFLICT (user_id, day) DO UPDATE SET mileage = mileage + excluded.mileage;
+END;
+
+CREATE TRIGGER IF NOT EXISTS mileage_rollup_update AFTER UPDATE ON mileage BEGIN
+    INSERT INTO daily_rollup (user_id, day, mileage) VALUES (OLD.user_id, OLD.date, -COALESCE(OLD.value, 0))
+        ON CONFLICT (user_id, day) DO UPDATE SET mileage = mileage + excluded.mileage;
+    INSERT INTO daily_rollup (user_id, day, mileage) VALUES (NEW.user_id, NEW.date, COALESCE(NEW.value, 0))
+        ON CONFLICT (user_id, day) DO UPDATE SET mileage = mileage + excluded.mileage;
+END;
+
+-- Daily rollups -> weekly rollups (apply the change of each daily row to its week)
+CREATE TRIGGER IF NOT EXISTS daily_rollup_insert AFTER INSERT ON daily_rollup BEGIN
+    INSERT INTO weekly_rollup (user_id, week, expenses, salary, mood_sum, mood_count, mileage)
+        VALUES (NEW.user_id, date(NEW.day, 'weekday 0', '-6 days'), NEW.expenses, NEW.salary, NEW.mood_sum, NEW.mood_count, NEW.mileage)
+        ON CONFLICT (user_id, week) DO UPDATE SET
+            expenses = expenses + excluded.expenses,
+            salary = salary + excluded.salary,
+            mood_sum = mood_sum + excluded.mood_sum,
+            mood_count = mood_count + excluded.mood_count,
+            mileage = mileage + excluded.mileage;
+END;
+
+CREATE TRIGGER IF NOT EXISTS daily_rollup_update AFTER UPDATE ON daily_rollup BEGIN
+    INSERT INTO weekly_rollup (user_id, week, expenses, salary, mood_sum, mood_count, mileage)
+        VALUES (
+            NEW.user_id,
+            date(NEW.day, 'weekday 0', '-6 days'),
+            NEW.expenses - OLD.expenses,
+            NEW.salary - OLD.salary,
+            NEW.mood_sum - OLD.mood_sum,
+            NEW.mood_count - OLD.mood_count,
+            NEW.mileage - OLD.mileage
+        )
+        ON CONFLICT (user_id, week) DO UPDATE SET
+            expenses = expenses + excluded.expenses,
+            salary = salary + excluded.salary,
+            mood_sum = mood_sum + excluded.mood_sum,
+            mood_count = mood_count + excluded.mood_count,
+            mileage = mileage + excluded.mileage;
+END;
+
+CREATE TRIGGER IF NOT EXISTS daily_category_rollup_insert AFTER INSERT ON daily_category_rollup BEGIN
+    INSERT INTO weekly_category_rollup (user_id, week, category_id, amount)
+        VALUES (NEW.user_id, date(NEW.day, 'weekday 0', '-6 days'), NEW.category_id, NEW.amount)
+        ON CONFLICT (user_id, week, category_id) DO UPDATE SET amount = amount + excluded.amount;
+END;
+
+CREATE TRIGGER IF NOT EXISTS daily_category_rollup_update AFTER UPDATE ON daily_category_rollup BEGIN
+    INSERT INTO weekly_category_rollup (user_id, week, category_id, amount)
+        VALUES (NEW.user_id, date(NEW.day, 'weekday 0', '-6 days'), NEW.category_id, NEW.amount - OLD.amount)
+        ON CONFLICT (user_id, week, category_id) DO UPDATE SET amount = amount + excluded.amount;
+END;
+
+-- FSM state for in-progress flows (expense, salary, mileage), keyed by the aiogram storage key
+CREATE TABLE IF NOT EXISTS fsm_state (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT NOT NULL DEFAULT '{}',
+    updated_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_fsm_state_updated_at ON fsm_state (updated_at);
+
+-- Scheduled jobs (jobs/store.py), so runs missed while the bot was down are caught up after a restart
+CREATE TABLE IF NOT EXISTS scheduler_jobs (
+    id TEXT PRIMARY KEY,
+    next_run_time REAL,
+    job_state BLOB NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_scheduler_jobs_next_run_time ON scheduler_jobs (next_run_time);
+
+-- One row per job run (or missed run), for the job lag report
+CREATE TABLE IF NOT EXISTS job_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    scheduled_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    status TEXT NOT NULL  -- ok, error or missed
+);
+
+CREATE INDEX IF NOT EXISTS idx_job_runs_scheduled_at ON job_runs (scheduled_at);
+
+-- Rate quotes, one row per change of an asset's quote (utils/rates.py)
+CREATE TABLE IF NOT EXISTS rate_quotes (
+    asset TEXT NOT NULL,
+    ts REAL NOT NULL,
+    rate REAL NOT NULL,
+    PRIMARY KEY (asset, ts)
+);
+
+CREATE INDEX IF NOT EXISTS idx_rate_quotes_ts ON rate_quotes (ts);
+
+-- Rate alerts: kind is above/below (value is the threshold) or move (value is a percentage from `reference`)
+CREATE TABLE IF NOT EXISTS rate_alerts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    chat_id INTEGER NOT NULL,
+    asset TEXT NOT NULL,
+    kind TEXT NOT NULL CHECK(kind IN ('above', 'below', 'move')),
+    value REAL NOT NULL,
+    reference REAL,
+    active INTEGER NOT NULL DEFAULT 1,
+    updated_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_rate_alerts_user ON rate_alerts (user_id, active);
+CREATE INDEX IF NOT EXISTS idx_rate_alerts_updated_at ON rate_alerts (updated_at);
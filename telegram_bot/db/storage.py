@@ -0,0 +1,93 @@
+import json
+import time
+from collections import OrderedDict
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey
+from config import FSM_CACHE_SIZE, FSM_TTL
+from db.manager import db
+from utils.metrics import expose
+
+
+def _key(key: StorageKey) -> str:
+    return ":".join(str(part) if part is not None else "" for part in (
+        key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny
+    ))
+
+
+class SQLiteStorage(BaseStorage):
+    # FSM storage in the bot's SQLite file. Reads are served from an LRU of recently active chats;
+    # every change updates the LRU and is written through the manager's write-behind queue.
+    def __init__(self, manager=db, cache_size: int = FSM_CACHE_SIZE, ttl: float = FSM_TTL):
+        self.manager = manager
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.shared = False  # Set when other processes use the same file: no cached reads, no deferred writes
+        self._cache = OrderedDict()  # key -> [state, data, updated_at]
+        self.stats = {"hits": 0, "misses": 0, "expired": 0}
+
+    async def _load(self, key: StorageKey):
+        k = _key(key)
+        entry = None if self.shared else self._cache.get(k)
+        if entry is not None:
+            self._cache.move_to_end(k)
+            self.stats["hits"] += 1
+        else:
+            self.stats["misses"] += 1
+            row = await self.manager.load_fsm(k)
+            entry = [row[0], json.loads(row[1]), row[2]] if row else [None, {}, time.time()]
+            self._remember(k, entry)
+
+        if (entry[0] is not None or entry[1]) and time.time() - entry[2] > self.ttl:
+            # A flow the user walked away from: start over instead of resuming it days later
+            self.stats["expired"] += 1
+            entry[0], entry[1] = None, {}
+            await self.manager.delete_fsm(k)
+        return k, entry
+
+    def _remember(self, k: str, entry: list):
+        self._cache[k] = entry
+        self._cache.move_to_end(k)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _store(self, k: str, state, data: dict):
+        now = time.time()
+        self._remember(k, [state, data, now])
+        if state is None and not data:
+            # Finished flows leave no row behind
+            await self.manager.delete_fsm(k)
+        else:
+            await self.manager.save_fsm(k, state, json.dumps(data, ensure_ascii=False), now)
+        if self.shared:
+            await self.manager.flush()
+
+    async def set_state(self, key: StorageKey, state=None) -> None:
+        k, entry = await self._load(key)
+        state = state.state if isinstance(state, State) else state
+        await self._store(k, state, entry[1])
+
+    async def get_state(self, key: StorageKey):
+        _, entry = await self._load(key)
+        return entry[0]
+
+    async def set_data(self, key: StorageKey, data) -> None:
+        k, entry = await self._load(key)
+        await self._store(k, entry[0], dict(data))
+
+    async def get_data(self, key: StorageKey) -> dict:
+        _, entry = await self._load(key)
+        return dict(entry[1])
+
+    async def purge_expired(self) -> int:
+        # Drops abandoned flows that were never read again; the LRU forgets them on its own
+        cutoff = time.time() - self.ttl
+        for k in [k for k, entry in self._cache.items() if entry[2] < cutoff]:
+            del self._cache[k]
+        return await self.manager.purge_fsm(cutoff)
+
+    async def close(self) -> None:
+        await self.manager.flush()
+
+
+storage = SQLiteStorage()
+expose("bot_fsm_cache", "FSM state cache counters.", storage.stats)
@@ -0,0 +1,82 @@
+from aiogram import Router
+from aiogram.types import Message
+from aiogram.filters import Command, CommandObject
+from aiogram.fsm.context import FSMContext
+from config import CATEGORIES_PER_USER
+from utils.categories import clean_name, parse_budget
+from utils.dates import local_today
+from utils.keyboards import expense_categories
+from utils.states import ExpenseState
+from db.manager import db
+
+# Included before the expense flow, so these commands also work while it waits for a category
+router = Router()
+
+CATEGORY_HELP = (
+    "/category_add Назва — додати категорію\n"
+    "/category_del Назва — прибрати (старі витрати лишаються у звітах)\n"
+    "/budget Назва 300 — місячний бюджет, /budget Назва 0 — без бюджету"
+)
+
+@router.message(Command("categories"))
+async def cmd_categories(message: Message):
+    user_id = message.from_user.id
+    categories = await db.get_categories(user_id)
+    month = local_today(await db.get_timezone(user_id)).isoformat()[:7]
+    spending = await db.get_month_spending(user_id, month) if any(budget for _, _, budget in categories) else {}
+    lines = [
+        f"— {name}: {spending.get(category_id, 0):.2f} з {budget:.2f} € цього місяця" if budget else f"— {name}"
+        for category_id, name, budget in categories
+    ]
+    text = "🗂 Твої категорії:\n" + "\n".join(lines) if lines else "Категорій немає."
+    await message.answer(f"{text}\n\n{CATEGORY_HELP}")
+
+@router.message(Command("category_add"))
+async def cmd_category_add(message: Message, command: CommandObject, state: FSMContext):
+    name = clean_name(command.args)
+    if not name:
+        await message.answer("Вкажи назву, наприклад: /category_add Кафе")
+        return
+
+    user_id = message.from_user.id
+    if len(await db.get_categories(user_id)) >= CATEGORIES_PER_USER:
+        await message.answer(f"Можна мати до {CATEGORIES_PER_USER} категорій. Прибери зайве: /categories")
+        return
+    if not await db.add_category(user_id, name):
+        await message.answer(f"Категорія «{name}» вже є.")
+        return
+
+    names = [category for _, category, _ in await db.get_categories(user_id)]
+    # Mid-expense, the new category goes straight onto the keyboard
+    markup = expense_categories(names) if await state.get_state() == ExpenseState.category.state else None
+    await message.answer(f"✅ Категорію «{name}» додано.", reply_markup=markup)
+
+@router.message(Command("category_del"))
+async def cmd_category_del(message: Message, command: CommandObject):
+    name = clean_name(command.args)
+    if not name:
+        await message.answer("Вкажи назву, наприклад: /category_del Кафе")
+        return
+    if await db.remove_category(message.from_user.id, name):
+        await message.answer(f"Категорію «{name}» прибрано.")
+    else:
+        await message.answer("Такої категорії немає. Список: /categories")
+
+@router.message(Command("budget"))
+async def cmd_budget(message: Message, command: CommandObject):
+    # The amount is the last word, everything before it is the name
+    name, _, amount = (command.args or "").strip().rpartition(" ")
+    try:
+        budget = parse_budget(amount)
+    except ValueError:
+        budget = name = ""
+    if not clean_name(name):
+        await message.answer("Приклад: /budget Їжа 300")
+        return
+
+    if not await db.set_category_budget(message.from_user.id, name, budget):
+        await message.answer("Такої категорії немає. Список: /categories")
+    elif budget is None:
+        await message.answer(f"Бюджет для «{clean_name(name)}» прибрано.")
+    else:
+        await message.answer(f"💶 Бюджет для «{clean_name(name)}»: {budget:.2f} € на місяць.")
@@ -1,21 +1,53 @@
 from aiogram import Router, F
 from aiogram.types import Message
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from utils.keyboards import main_menu
+from utils.dates import local_today, is_valid_timezone
 
 router = Router()
 
 @router.message(Command("start"))
 async def cmd_start(message: Message):
+    from db.manager import db
+
+    await db.register_user(message.from_user.id, message.chat.id)
     await message.answer(
         "Привіт! Я твій персональний бот-трекер. 🤖\n"
         "Я допоможу тобі стежити за настроєм, витратами та іншими важливими речами.",
         reply_markup=main_menu()
     )
 
+@router.message(Command("timezone"))
+async def cmd_timezone(message: Message, command: CommandObject):
+    from db.manager import db
+
+    if not command.args:
+        current = await db.get_timezone(message.from_user.id)
+        await message.answer(f"Твій часовий пояс: {current}\nЩоб змінити: /timezone Europe/Kyiv")
+        return
+
+    timezone = command.args.strip()
+    if not is_valid_timezone(timezone):
+        await message.answer("Невідомий часовий пояс. Приклад: /timezone Europe/Kyiv")
+        return
+
+    await db.register_user(message.from_user.id, message.chat.id)
+    # The leader's scheduler adds jobs for a new timezone on its next sync (TIMEZONE_SYNC_INTERVAL)
+    await db.set_timezone(message.from_user.id, timezone)
+    await message.answer(f"Часовий пояс змінено на {timezone}. Нагадування приходитимуть за твоїм місцевим часом. 🕰")
+
+@router.message(F.location)
+async def save_location(message: Message):
+    from db.manager import db
+
+    await db.register_user(message.from_user.id, message.chat.id)
+    await db.set_location(message.from_user.id, message.location.latitude, message.location.longitude)
+    await message.answer("Локацію збережено! Погода тепер для твого місця. 📍", reply_markup=main_menu())
+
 @router.message(F.text == "Останні дані")
 async def show_last_data(message: Message):
     from db.manager import db
+    from utils.templates import last_data
 
     # We need to add a method to DB manager to get last entries, or just query here if we imported aiosqlite.
     # Better to add a method to db/manager.py. Let's assume we will add `get_last_data` there.
@@ -23,42 +55,47 @@ async def show_last_data(message: Message):
     # Let's check db/manager.py content first? I have it in previous turns.
     # I will add `get_last_data` to db/manager.py first.
 
-    data = await db.get_last_data()
-
-    msg = "📋 **Останні записи:**\n\n"
-
-    if data['mood']:
-        mood = "😊" if data['mood'][1] == 1 else "😞"
-        msg += f"Настрій ({data['mood'][0]}): {mood}\n"
-
-    if data['mileage']:
-        msg += f"Пробіг ({data['mileage'][0]}): {data['mileage'][1]} км\n"
-
-    if data['expenses']:
-        msg += "\n🛒 **Останні витрати:**\n"
-        for exp in data['expenses']:
-            msg += f"— {exp[0]}: {exp[1]} ({exp[2]}€)\n"
+    data = await db.get_last_data(message.from_user.id)
 
+    msg = last_data(data)
     await message.answer(msg, parse_mode="Markdown")
 
 @router.message(F.text == "Показати статистику за тиждень")
 async def show_weekly_stats(message: Message):
     from db.manager import db
-    from datetime import date, timedelta
+    from datetime import timedelta
+    from utils.charts import send_charts
+    from utils.templates import weekly_stats
 
-    today = date.today()
+    user_id = message.from_user.id
+    today = local_today(await db.get_timezone(user_id))
     start_of_week = today - timedelta(days=6)
 
-    stats = await db.get_weekly_stats(start_of_week.isoformat(), today.isoformat())
+    stats = await db.get_weekly_stats(user_id, start_of_week.isoformat(), today.isoformat())
+    categories = await db.get_category_totals(user_id, start_of_week.isoformat(), today.isoformat())
 
-    mood_percent = int(stats['avg_mood'] * 100) if stats['avg_mood'] is not None else 0
-
-    msg = (
-        "📊 **Тижневий звіт** (останні 7 днів):\n\n"
-        f"💸 Витрачено: {stats['expenses']:.2f} €\n"
-        f"💰 Зарплата: {stats['salary']:.2f} €\n"
-        f"📉 Залишок: {stats['salary'] - stats['expenses']:.2f} €\n"
-        f"😊 Середній настрій: {mood_percent}%\n"
-        f"🚗 Пробіг: {stats['mileage']:.1f} км"
-    )
+    msg = weekly_stats(stats, categories)
     await message.answer(msg, parse_mode="Markdown")
+    await send_charts(message.bot, message.chat.id, user_id, ("week",), today)
+
+@router.message(F.text == "Звіт за місяць 📊")
+async def show_monthly_report(message: Message):
+    from db.manager import db
+    from utils.analytics import monthly_report
+    from utils.charts import send_charts
+
+    user_id = message.from_user.id
+    today = local_today(await db.get_timezone(user_id))
+    await message.answer(await monthly_report(user_id, today), parse_mode="Markdown")
+    await send_charts(message.bot, message.chat.id, user_id, ("categories", "mood"), today)
+
+@router.message(F.text == "Звіт за рік 📈")
+async def show_yearly_report(message: Message):
+    from db.manager import db
+    from utils.analytics import yearly_report
+    from utils.charts import send_charts
+
+    user_id = message.from_user.id
+    today = local_today(await db.get_timezone(user_id))
+    await message.answer(await yearly_report(user_id, today), parse_mode="Markdown")
+    await send_charts(message.bot, message.chat.id, user_id, ("mileage",), today)
@@ -2,8 +2,8 @@ from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from utils.states import DailyState
+from utils.dates import local_today
 from db.manager import db
-from datetime import date
 
 router = Router()
 
@@ -13,9 +13,10 @@ router = Router()
 @router.callback_query(F.data.startswith("mood_"))
 async def process_mood(callback: CallbackQuery, state: FSMContext):
     mood_value = int(callback.data.split("_")[1])
-    today = date.today().isoformat()
+    user_id = callback.from_user.id
+    today = local_today(await db.get_timezone(user_id)).isoformat()
 
-    await db.add_mood(today, mood_value)
+    await db.add_mood(user_id, today, mood_value)
     await callback.message.answer("Настрій записано! 👌")
 
     # Prompt for mileage immediately after mood
@@ -38,8 +39,9 @@ async def process_mileage(message: Message, state: FSMContext):
             return
 
         if value > 0:
-            today = date.today().isoformat()
-            await db.add_mileage(today, value)
+            user_id = message.from_user.id
+            today = local_today(await db.get_timezone(user_id)).isoformat()
+            await db.add_mileage(user_id, today, value)
             msg = f"Пробіг {value} км записано."
             if value > 200:
                 msg += " ⚠️ Час перевірити масло!"
@@ -2,20 +2,40 @@ from aiogram import Router, F
 from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 from utils.states import ExpenseState
+from utils.categories import budget_status, clean_name, suggest
 from utils.keyboards import expense_categories, main_menu
+from utils.dates import local_today
 from db.manager import db
-from datetime import date
 
 router = Router()
 
 @router.message(F.text == "Додати витрату 🛒")
 async def start_expense(message: Message, state: FSMContext):
+    names = [name for _, name, _ in await db.get_categories(message.from_user.id)]
+    if not names:
+        await message.answer("Немає жодної категорії. Додай: /category_add Назва")
+        return
     await state.set_state(ExpenseState.category)
-    await message.answer("Оберіть категорію витрати:", reply_markup=expense_categories())
+    await message.answer("Оберіть категорію витрати:", reply_markup=expense_categories(names))
 
 @router.message(ExpenseState.category)
 async def process_category(message: Message, state: FSMContext):
-    await state.update_data(category=message.text)
+    # Only known categories, so a typo does not start a new one
+    user_id = message.from_user.id
+    category = await db.get_category(user_id, message.text or "")
+    if category is None or not category[3]:
+        names = [name for _, name, _ in await db.get_categories(user_id)]
+        hint = suggest(message.text or "", names)
+        text = f"Немає категорії «{clean_name(message.text)}»."
+        if hint:
+            text += f" Може, «{hint}»?"
+        await message.answer(
+            f"{text}\nОбери з клавіатури або додай нову: /category_add Назва",
+            reply_markup=expense_categories(names)
+        )
+        return
+
+    await state.update_data(category=category[1])
     await state.set_state(ExpenseState.amount)
     await message.answer("Введи суму в €.", reply_markup=None)
 
@@ -28,10 +48,17 @@ async def process_amount(message: Message, state: FSMContext):
 
         data = await state.get_data()
         category = data['category']
-        today = date.today().isoformat()
+        user_id = message.from_user.id
+        today = local_today(await db.get_timezone(user_id)).isoformat()
 
-        await db.add_expense(today, category, amount)
-        await message.answer(f"✅ Записано: {category} - {amount}€", reply_markup=main_menu())
+        await db.add_expense(user_id, today, category, amount)
+        reply = f"✅ Записано: {category} - {amount}€"
+        category_id, _, budget, _ = await db.get_category(user_id, category)
+        if budget:
+            # Running month totals in memory, already including this expense
+            spent = (await db.get_month_spending(user_id, today[:7])).get(category_id, 0)
+            reply += "\n" + budget_status(category, spent, amount, budget)
+        await message.answer(reply, reply_markup=main_menu())
         await state.clear()
 
     except ValueError:
@@ -54,8 +81,9 @@ async def process_salary(message: Message, state: FSMContext):
         if amount < 0:
             raise ValueError("Negative amount")
 
-        today = date.today().isoformat()
-        await db.add_salary(today, amount)
+        user_id = message.from_user.id
+        today = local_today(await db.get_timezone(user_id)).isoformat()
+        await db.add_salary(user_id, today, amount)
 
         await message.answer(f"🤑 Зарплата {amount}€ записана! Гуляємо! 🎉", reply_markup=main_menu())
         await state.clear()
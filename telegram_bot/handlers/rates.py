@@ -0,0 +1,82 @@
+import time
+from aiogram import Router
+from aiogram.types import Message
+from aiogram.filters import Command, CommandObject
+from config import RATE_ALERTS_PER_USER
+
+router = Router()
+
+ALERT_HELP = (
+    "Сповіщення про курс:\n"
+    "/alert USD > 42 — коли курс стане вищим за 42\n"
+    "/alert BTC < 60000 — коли впаде нижче 60000\n"
+    "/alert ETH 5% — коли зміниться на 5% від останнього сповіщення\n"
+    "/alerts — мої сповіщення, /unalert <номер> — видалити"
+)
+
+@router.message(Command("rates"))
+async def cmd_rates(message: Message):
+    from db.manager import db
+    from utils.finance import SOURCES, fetch_rates
+    from utils.rates import format_change
+
+    rates = await fetch_rates()
+    if not rates:
+        await message.answer("Помилка отримання курсів: жодне джерело не відповіло.")
+        return
+
+    day_ago = await db.get_rates_at(time.time() - 86400)
+    sections = []
+    for source in SOURCES:
+        if source.name not in rates:
+            sections.append(f"{source.title}\n⚠️ Дані тимчасово недоступні")
+            continue
+        lines = [format_change(asset, rate, day_ago.get(asset)) for asset, rate in rates[source.name].items()]
+        sections.append("\n".join([source.title, *lines]))
+    await message.answer("\n\n".join(sections) + "\n\nЗміна за добу в дужках. Сповіщення: /alert")
+
+@router.message(Command("alert"))
+async def cmd_alert(message: Message, command: CommandObject):
+    from db.manager import db
+    from utils.rates import ASSET_SOURCES, parse_alert, describe
+
+    try:
+        asset, kind, value = parse_alert(command.args or "")
+    except ValueError:
+        await message.answer(f"{ALERT_HELP}\n\nДоступні активи: {', '.join(ASSET_SOURCES)}")
+        return
+
+    user_id = message.from_user.id
+    if len(await db.get_rate_alerts(user_id)) >= RATE_ALERTS_PER_USER:
+        await message.answer(f"Можна мати до {RATE_ALERTS_PER_USER} сповіщень. Видали зайве: /alerts")
+        return
+
+    await db.register_user(user_id, message.chat.id)
+    alert_id = await db.add_rate_alert(user_id, message.chat.id, asset, kind, value)
+    alert = {"asset": asset, "kind": kind, "value": value}
+    await message.answer(f"🔔 Сповіщення #{alert_id}: {describe(alert)}. Перевіряю курс кожні кілька хвилин.")
+
+@router.message(Command("alerts"))
+async def cmd_alerts(message: Message):
+    from db.manager import db
+    from utils.rates import describe
+
+    alerts = await db.get_rate_alerts(message.from_user.id)
+    if not alerts:
+        await message.answer(f"Сповіщень немає.\n\n{ALERT_HELP}")
+        return
+    lines = [f"#{alert['id']} {describe(alert)}" for alert in alerts]
+    await message.answer("🔔 Твої сповіщення:\n" + "\n".join(lines) + "\n\nВидалити: /unalert <номер>")
+
+@router.message(Command("unalert"))
+async def cmd_unalert(message: Message, command: CommandObject):
+    from db.manager import db
+
+    alert_id = (command.args or "").strip().lstrip("#")
+    if not alert_id.isdigit():
+        await message.answer("Вкажи номер сповіщення, наприклад: /unalert 3")
+        return
+    if await db.delete_rate_alert(message.from_user.id, int(alert_id)):
+        await message.answer(f"Сповіщення #{alert_id} видалено.")
+    else:
+        await message.answer("Такого сповіщення немає. Список: /alerts")
@@ -0,0 +1,70 @@
+import os
+import tempfile
+from aiogram import Router, F
+from aiogram.types import Message, FSInputFile
+from aiogram.filters import Command, CommandObject
+from utils.dates import local_today
+
+router = Router()
+
+# Bots can only download files up to 20 MB
+MAX_IMPORT_SIZE = 20 * 1024 * 1024
+
+@router.message(Command("export"))
+async def cmd_export(message: Message, command: CommandObject):
+    from db.manager import db
+    from utils.transfer import export_file, format_for, TransferError
+
+    user_id = message.from_user.id
+    fmt = (command.args or "csv").strip().lower()
+    today = local_today(await db.get_timezone(user_id)).isoformat()
+    path = os.path.join(tempfile.gettempdir(), f"export_{user_id}_{today}.{fmt}")
+
+    try:
+        format_for(path, fmt)
+        count = await export_file(user_id, path, fmt)
+        if not count:
+            await message.answer("Немає даних для експорту.")
+            return
+        await message.answer_document(
+            FSInputFile(path, filename=f"tracker_{today}.{fmt}"),
+            caption=f"📦 Експортовано записів: {count}"
+        )
+    except TransferError as e:
+        await message.answer(str(e))
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+@router.message(Command("import"), F.document)
+async def cmd_import_file(message: Message):
+    from utils.transfer import import_file, TransferError
+
+    document = message.document
+    if document.file_size and document.file_size > MAX_IMPORT_SIZE:
+        await message.answer("Файл завеликий (максимум 20 МБ). Розбий його на частини.")
+        return
+
+    suffix = ".parquet" if (document.file_name or "").lower().endswith(".parquet") else ".csv"
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    try:
+        await message.bot.download(document, destination=path)
+        stats = await import_file(message.from_user.id, path)
+        await message.answer(
+            f"✅ Імпортовано записів: {stats['imported']}\n"
+            f"Пропущено (надходження): {stats['skipped']}\n"
+            f"Некоректних рядків: {stats['invalid']}"
+        )
+    except TransferError as e:
+        await message.answer(str(e))
+    finally:
+        os.remove(path)
+
+@router.message(Command("import"))
+async def cmd_import_help(message: Message):
+    await message.answer(
+        "Надішли CSV або Parquet файл з підписом /import.\n"
+        "Формат експорту (type,date,category,value) або виписка банку: "
+        "витрати (від'ємні суми) стануть записами витрат."
+    )
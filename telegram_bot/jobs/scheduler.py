@@ -1,58 +1,141 @@
+import asyncio
+import time
+from datetime import datetime
+from apscheduler.events import EVENT_JOB_SUBMITTED, EVENT_JOB_EXECUTED, EVENT_JOB_ERROR, EVENT_JOB_MISSED
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.base import BaseTrigger
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from aiogram import Bot
-from config import TIMEZONE
-from jobs.tasks import send_morning_checkin, check_salary_reminder, send_weekly_report, send_evening_forecast, send_hourly_rates
+from config import (
+    TIMEZONE, DB_PATH, SCHEDULER_MISFIRE_GRACE, SCHEDULER_COALESCE, RATE_POLL_INTERVAL, TIMEZONE_SYNC_INTERVAL,
+)
+from db.manager import db
+from db.storage import storage
+from jobs.store import SQLiteJobStore
+from utils.metrics import JOB_SECONDS, JOB_LAG_SECONDS, ERRORS
+from jobs.tasks import (
+    send_morning_checkin, check_salary_reminder, send_weekly_report, send_evening_forecast,
+    check_rate_alerts, purge_rate_history,
+)
 
-def setup_scheduler(bot: Bot):
-    scheduler = AsyncIOScheduler(timezone=TIMEZONE)
+# Jobs persist in the database: a run that came due while the bot was down is made up after a restart if it is
+# at most SCHEDULER_MISFIRE_GRACE seconds late, and several missed runs of one job collapse into one
+JOB_DEFAULTS = {"misfire_grace_time": SCHEDULER_MISFIRE_GRACE, "coalesce": SCHEDULER_COALESCE}
 
-    # Daily Morning Routine (05:30)
-    scheduler.add_job(
-        send_morning_checkin,
-        'cron',
-        hour=5,
-        minute=30,
-        kwargs={'bot': bot}
-    )
+scheduler = AsyncIOScheduler(timezone=TIMEZONE, jobstores={"default": SQLiteJobStore(DB_PATH)}, job_defaults=JOB_DEFAULTS)
+_bot = None
 
+# Jobs that fire at the users' local time; each timezone in use gets its own copy
+LOCAL_JOBS = (
+    # Daily Morning Routine (05:30)
+    ("morning_checkin", send_morning_checkin, {"hour": 5, "minute": 30}),
     # Salary Reminders (Wed, Fri at 05:30)
-    # We can reuse the same time slot or add separate jobs.
-    # Prompt says "Wednesday... at 05:30 adds...", "Friday... at 05:30 asks..."
-    # So it's part of the morning routine or separate. Let's make it separate for clarity.
-    scheduler.add_job(
-        check_salary_reminder,
-        'cron',
-        day_of_week='wed,fri',
-        hour=5,
-        minute=30,
-        kwargs={'bot': bot}
-    )
-
+    ("salary_reminder", check_salary_reminder, {"day_of_week": "wed,fri", "hour": 5, "minute": 30}),
     # Weekly Report (Sunday 20:00)
-    scheduler.add_job(
-        send_weekly_report,
-        'cron',
-        day_of_week='sun',
-        hour=20,
-        minute=0,
-        kwargs={'bot': bot}
-    )
-
+    ("weekly_report", send_weekly_report, {"day_of_week": "sun", "hour": 20, "minute": 0}),
     # Evening Forecast (Daily 20:00)
-    scheduler.add_job(
-        send_evening_forecast,
-        'cron',
-        hour=20,
-        minute=0,
-        kwargs={'bot': bot}
-    )
+    ("evening_forecast", send_evening_forecast, {"hour": 20, "minute": 0}),
+)
+
+# Same moment for everyone: cron fields or a trigger. Interval triggers get a fixed start date, so their
+# repr (and with it the stored next run time) does not change on every restart
+GLOBAL_JOBS = (
+    # Rate alerts: poll the sources, message only the users whose alerts fired
+    ("rate_alerts", check_rate_alerts,
+     IntervalTrigger(seconds=RATE_POLL_INTERVAL, start_date=datetime(2024, 1, 1), timezone=TIMEZONE)),
+    # Drop rate quotes older than RATE_HISTORY_DAYS
+    ("rate_history_cleanup", purge_rate_history, {"hour": 4, "minute": 15}),
+    # Forget FSM flows abandoned longer than FSM_TTL
+    ("fsm_cleanup", lambda bot: storage.purge_expired(), {"minute": 30}),
+    # Local jobs for timezones users picked since the last sync, possibly in another process
+    ("timezone_sync", lambda bot: sync_timezones(),
+     IntervalTrigger(seconds=TIMEZONE_SYNC_INTERVAL, start_date=datetime(2024, 1, 1), timezone=TIMEZONE)),
+)
+
+JOBS = {name: job for name, job, _ in (*LOCAL_JOBS, *GLOBAL_JOBS)}
+
+async def run_job(name: str, **kwargs):
+    # Stored jobs point here by name instead of holding the bot, which cannot be pickled
+    await JOBS[name](_bot, **kwargs)
+
 
-    # Hourly Rates
-    scheduler.add_job(
-        send_hourly_rates,
-        'cron',
-        minute=0, # Every hour at minute 0
-        kwargs={'bot': bot}
+_started = {}  # job id -> (perf_counter, wall clock) at submission
+_recording = set()
+
+def _record(job_id: str, scheduled: datetime, started: float, status: str):
+    task = asyncio.get_running_loop().create_task(
+        db.record_job_run(job_id, scheduled.timestamp(), started, time.time() if started else None, status)
     )
+    _recording.add(task)
+    task.add_done_callback(_recording.discard)
+
+def _track_job(event):
+    # Job ids are "name" or "name:timezone"; the name is the label
+    name = event.job_id.split(":")[0]
+    if event.code == EVENT_JOB_SUBMITTED:
+        _started[event.job_id] = (time.perf_counter(), time.time())
+        scheduled = min(event.scheduled_run_times)
+        JOB_LAG_SECONDS.observe((datetime.now(scheduled.tzinfo) - scheduled).total_seconds(), name)
+    elif event.code == EVENT_JOB_MISSED:
+        ERRORS.inc("job_missed", name)
+        _record(event.job_id, event.scheduled_run_time, None, "missed")
+    else:
+        started, wall_clock = _started.pop(event.job_id, (None, None))
+        if started is not None:
+            JOB_SECONDS.observe(time.perf_counter() - started, name)
+        if event.code == EVENT_JOB_ERROR:
+            ERRORS.inc("job", name)
+        _record(event.job_id, event.scheduled_run_time, wall_clock, "error" if event.code == EVENT_JOB_ERROR else "ok")
+
+scheduler.add_listener(_track_job, EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
+
+
+def _ensure_job(job_id: str, name: str, trigger: BaseTrigger, **kwargs):
+    # A stored job keeps its next run time, so a run missed during a restart is still due;
+    # re-adding it would recompute the time from now and silently drop that run
+    job = scheduler.get_job(job_id)
+    if job is None:
+        scheduler.add_job(run_job, trigger, id=job_id, args=(name,), kwargs=kwargs)
+        return
+    if repr(job.trigger) != repr(trigger):
+        job.reschedule(trigger)
+    if (job.misfire_grace_time, job.coalesce) != (SCHEDULER_MISFIRE_GRACE, SCHEDULER_COALESCE):
+        job.modify(**JOB_DEFAULTS)
+
+def schedule_timezone(timezone: str):
+    for name, _, fields in LOCAL_JOBS:
+        _ensure_job(f"{name}:{timezone}", name, CronTrigger(timezone=timezone, **fields), timezone=timezone)
+
+async def sync_timezones() -> set:
+    # Runs only where the scheduler does (the leader): every timezone in use gets its local jobs, and those of
+    # timezones nobody uses any more are dropped
+    timezones = {TIMEZONE, *await db.get_timezones()}
+    for timezone in timezones:
+        schedule_timezone(timezone)
+    local = {name for name, _, _ in LOCAL_JOBS}
+    for job in scheduler.get_jobs():
+        name, _, timezone = job.id.partition(":")
+        if name in local and timezone not in timezones:
+            job.remove()
+    return timezones
+
+async def setup_scheduler(bot: Bot):
+    global _bot
+    _bot = bot
+
+    # Paused until the job list is reconciled with the code, so no run starts from an outdated trigger
+    scheduler.start(paused=True)
+
+    timezones = await sync_timezones()
+    for name, _, fields in GLOBAL_JOBS:
+        _ensure_job(name, name, fields if isinstance(fields, BaseTrigger) else CronTrigger(timezone=TIMEZONE, **fields))
+
+    # Jobs that were removed from the code (or whose timezone is no longer used)
+    expected = {f"{name}:{timezone}" for name, _, _ in LOCAL_JOBS for timezone in timezones}
+    expected.update(name for name, _, _ in GLOBAL_JOBS)
+    for job in scheduler.get_jobs():
+        if job.id not in expected:
+            job.remove()
 
-    scheduler.start()
+    scheduler.resume()
@@ -0,0 +1,94 @@
+import pickle
+import sqlite3
+from apscheduler.job import Job
+from apscheduler.jobstores.base import BaseJobStore, ConflictingIdError, JobLookupError
+from apscheduler.util import datetime_to_utc_timestamp, utc_timestamp_to_datetime
+
+
+class SQLiteJobStore(BaseJobStore):
+    # APScheduler's SQLAlchemyJobStore on plain sqlite3, against the scheduler_jobs table in schema.sql.
+    # Job store calls are synchronous by design; they touch a handful of rows a few times an hour
+    def __init__(self, db_path: str):
+        super().__init__()
+        self.db_path = db_path
+        self._conn = None
+
+    def start(self, scheduler, alias):
+        super().start(scheduler, alias)
+        self._conn = sqlite3.connect(self.db_path, isolation_level=None)
+        self._conn.execute("PRAGMA busy_timeout = 5000")
+
+    def shutdown(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def lookup_job(self, job_id):
+        row = self._conn.execute("SELECT job_state FROM scheduler_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._reconstitute_job(row[0]) if row else None
+
+    def get_due_jobs(self, now):
+        return self._get_jobs("WHERE next_run_time <= ?", (datetime_to_utc_timestamp(now),))
+
+    def get_next_run_time(self):
+        row = self._conn.execute(
+            "SELECT next_run_time FROM scheduler_jobs WHERE next_run_time IS NOT NULL ORDER BY next_run_time LIMIT 1"
+        ).fetchone()
+        return utc_timestamp_to_datetime(row[0]) if row else None
+
+    def get_all_jobs(self):
+        jobs = self._get_jobs()
+        self._fix_paused_jobs_sorting(jobs)
+        return jobs
+
+    def add_job(self, job):
+        try:
+            self._conn.execute(
+                "INSERT INTO scheduler_jobs (id, next_run_time, job_state) VALUES (?, ?, ?)",
+                (job.id, datetime_to_utc_timestamp(job.next_run_time), self._state(job))
+            )
+        except sqlite3.IntegrityError:
+            raise ConflictingIdError(job.id)
+
+    def update_job(self, job):
+        cursor = self._conn.execute(
+            "UPDATE scheduler_jobs SET next_run_time = ?, job_state = ? WHERE id = ?",
+            (datetime_to_utc_timestamp(job.next_run_time), self._state(job), job.id)
+        )
+        if not cursor.rowcount:
+            raise JobLookupError(job.id)
+
+    def remove_job(self, job_id):
+        cursor = self._conn.execute("DELETE FROM scheduler_jobs WHERE id = ?", (job_id,))
+        if not cursor.rowcount:
+            raise JobLookupError(job_id)
+
+    def remove_all_jobs(self):
+        self._conn.execute("DELETE FROM scheduler_jobs")
+
+    def _state(self, job) -> bytes:
+        return pickle.dumps(job.__getstate__(), pickle.HIGHEST_PROTOCOL)
+
+    def _reconstitute_job(self, job_state):
+        state = pickle.loads(job_state)
+        state["jobstore"] = self
+        job = Job.__new__(Job)
+        job.__setstate__(state)
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
+
+    def _get_jobs(self, where: str = "", params: tuple = ()):
+        jobs, broken = [], []
+        for job_id, job_state in self._conn.execute(
+            f"SELECT id, job_state FROM scheduler_jobs {where} ORDER BY next_run_time", params
+        ):
+            try:
+                jobs.append(self._reconstitute_job(job_state))
+            except Exception:
+                # e.g. the job's function was renamed in the meantime
+                self._logger.exception('Unable to restore job "%s" -- removing it', job_id)
+                broken.append(job_id)
+        if broken:
+            self._conn.executemany("DELETE FROM scheduler_jobs WHERE id = ?", [(job_id,) for job_id in broken])
+        return jobs
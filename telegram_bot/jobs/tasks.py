@@ -1,70 +1,121 @@
+import time
 from aiogram import Bot
-from config import ADMIN_ID
-from utils.weather import get_weather
+from config import TIMEZONE, RATE_HISTORY_DAYS
+from utils.weather import get_weather, grid_cell, prefetch_weather
 from utils.keyboards import mood_keyboard
+from utils.broadcast import broadcast
+from utils.payloads import SharedMessage
+from utils.dates import local_today
 from db.manager import db
-from datetime import date, timedelta
+from datetime import timedelta
 
-async def send_morning_checkin(bot: Bot):
-    # 1. Mood
-    await bot.send_message(
-        ADMIN_ID,
-        "Як твій настрій сьогодні? 😊 / 😞",
-        reply_markup=mood_keyboard()
-    )
+# Jobs that take a timezone run once per timezone at the users' local time and only reach the users in it
 
-    # 2. Weather
-    weather_info = await get_weather()
-    await bot.send_message(ADMIN_ID, weather_info)
+async def send_morning_checkin(bot: Bot, timezone: str = TIMEZONE):
+    recipients = await db.get_recipients(timezone)
+    if not recipients:
+        return
 
-async def check_salary_reminder(bot: Bot):
+    # One batched upstream call per group of grid cells; deliveries then read the cache
+    locations = await db.get_locations(timezone)
+    cells = {user_id: grid_cell(*locations[user_id]) if user_id in locations else grid_cell() for user_id, _ in recipients}
+    await prefetch_weather(cells.values())
+
+    # Everyone gets the same check-in and everyone in a cell the same weather: each is serialized once
+    checkin = SharedMessage("Як твій настрій сьогодні? 😊 / 😞", reply_markup=mood_keyboard())
+    weather = {}
+
+    async def deliver(user_id: int, chat_id: int):
+        # 1. Mood
+        await checkin.send(bot, chat_id)
+
+        # 2. Weather
+        cell = cells[user_id]
+        if cell not in weather:
+            weather[cell] = SharedMessage(await get_weather(cell))
+        await weather[cell].send(bot, chat_id)
+
+    await broadcast("morning_checkin", recipients, deliver)
+
+async def check_salary_reminder(bot: Bot, timezone: str = TIMEZONE):
     # Logic: Check if tomorrow is salary day?
     # Prompt says: "Wednesday: Tomorrow is salary! ... Friday: How much came?"
     # This implies static days of week, not specific dates.
 
-    today = date.today().weekday() # Mon=0, Tue=1, Wed=2, Thu=3, Fri=4, Sat=5, Sun=6
+    today = local_today(timezone).weekday() # Mon=0, Tue=1, Wed=2, Thu=3, Fri=4, Sat=5, Sun=6
 
     if today == 2: # Wednesday
-        await bot.send_message(ADMIN_ID, "Завтра зарплата! Плани на фінанси? 💸")
+        reminder = SharedMessage("Завтра зарплата! Плани на фінанси? 💸")
     elif today == 4: # Friday
         from utils.keyboards import salary_keyboard
-        await bot.send_message(ADMIN_ID, "Скільки прийшло на карту? Введи суму в €.", reply_markup=salary_keyboard())
-        # Note: To handle the response, we might need to set a state here.
-        # However, setting state from a job without a user message context is tricky in aiogram 3.
-        # We can just ask the question. If the user replies with a number, we might need a handler
-        # that catches numbers if no other state is active, OR we rely on the user to trigger "Add Salary" command if we had one.
-        # But the prompt implies the bot asks and user answers.
-        # For simplicity in this prompt context, we'll assume the user will answer and we might need a generic handler or
-        # we just leave it as a reminder.
-        # To strictly follow "Save to table salary", we should probably set a state.
-        # But setting state requires a user_id and chat_id context.
-        pass
-
-async def send_weekly_report(bot: Bot):
-    today = date.today()
+
+        reminder = SharedMessage("Скільки прийшло на карту? Введи суму в €.", reply_markup=salary_keyboard())
+        # The reply is handled by the "add_salary" callback, which sets SalaryState for that user.
+    else:
+        return
+
+    async def deliver(user_id: int, chat_id: int):
+        await reminder.send(bot, chat_id)
+
+    await broadcast("salary_reminder", await db.get_recipients(timezone), deliver)
+
+async def send_weekly_report(bot: Bot, timezone: str = TIMEZONE):
+    from utils.charts import send_charts
+    from utils.templates import weekly_report
+
+    today = local_today(timezone)
     start_of_week = today - timedelta(days=6) # Last 7 days including today
 
-    stats = await db.get_weekly_stats(start_of_week.isoformat(), today.isoformat())
+    async def deliver(user_id: int, chat_id: int):
+        stats = await db.get_weekly_stats(user_id, start_of_week.isoformat(), today.isoformat())
+        categories = await db.get_category_totals(user_id, start_of_week.isoformat(), today.isoformat())
+
+        await bot.send_message(chat_id, weekly_report(stats, categories))
+        await send_charts(bot, chat_id, user_id, ("week",), today)
+
+    await broadcast("weekly_report", await db.get_recipients(timezone), deliver)
+
+async def send_evening_forecast(bot: Bot, timezone: str = TIMEZONE):
+    from utils.weather import get_weather_forecast, prefetch_forecast
+
+    recipients = await db.get_recipients(timezone)
+    if not recipients:
+        return
+
+    locations = await db.get_locations(timezone)
+    cells = {user_id: grid_cell(*locations[user_id]) if user_id in locations else grid_cell() for user_id, _ in recipients}
+    await prefetch_forecast(cells.values())
+
+    forecasts = {}
+
+    async def deliver(user_id: int, chat_id: int):
+        cell = cells[user_id]
+        if cell not in forecasts:
+            forecasts[cell] = SharedMessage(await get_weather_forecast(cell))
+        await forecasts[cell].send(bot, chat_id)
+
+    await broadcast("evening_forecast", recipients, deliver)
+
+async def check_rate_alerts(bot: Bot):
+    # One poll of the rate sources; only users whose alerts fired hear about it, in one message each
+    from utils.rates import monitor, describe, format_change
 
-    mood_percent = int(stats['avg_mood'] * 100) if stats['avg_mood'] is not None else 0
+    fired = await monitor.tick()
+    if not fired:
+        return
 
-    msg = (
-        "Тижневий звіт:\n"
-        f"— Витрачено: {stats['expenses']} €\n"
-        f"— Зарплата: {stats['salary']} €\n"
-        f"— Залишок: {stats['salary'] - stats['expenses']} €\n"
-        f"— Середній настрій: {mood_percent}%\n"
-        f"— Пробіг за тиждень: {stats['mileage']} км"
-    )
+    day_ago = time.time() - 86400
+    messages = {}
+    for alert, _, price in fired:
+        before = monitor.buffer(alert["asset"]).at(day_ago)
+        line = f"🔔 {describe(alert)}\n{format_change(alert['asset'], price, before)}"
+        messages.setdefault((alert["user_id"], alert["chat_id"]), []).append(line)
 
-    await bot.send_message(ADMIN_ID, msg)
+    async def deliver(user_id: int, chat_id: int):
+        await bot.send_message(chat_id, "\n\n".join(messages[user_id, chat_id]) + "\n\n(зміна за добу в дужках)")
 
-async def send_evening_forecast(bot: Bot):
-    from utils.weather import get_weather_forecast
-    forecast_info = await get_weather_forecast()
-    await bot.send_message(ADMIN_ID, forecast_info)
+    # Alerts are news only while they are fresh, so no spread
+    await broadcast("rate_alerts", list(messages), deliver, spread=0)
 
-async def send_hourly_rates(bot: Bot):
-    from utils.finance import get_exchange_rates
-    rates_info = await get_exchange_rates()
-    await bot.send_message(ADMIN_ID, rates_info)
+async def purge_rate_history(bot: Bot):
+    await db.purge_rate_quotes(time.time() - RATE_HISTORY_DAYS * 86400)
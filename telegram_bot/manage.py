@@ -0,0 +1,110 @@
+# Maintenance commands. Run from the telegram_bot directory: python manage.py <command>
+import argparse
+import asyncio
+import logging
+import sys
+from db.manager import db
+from utils.transfer import TransferError
+
+
+async def rebuild_rollups(args) -> int:
+    await db.rebuild_rollups()
+    return 0
+
+
+async def check_rollups(args) -> int:
+    problems = await db.check_rollups()
+    for problem in problems:
+        print(problem)
+    print(f"{len(problems)} inconsistent rollup rows." if problems else "Rollups are consistent.")
+    return 1 if problems else 0
+
+
+async def job_lag(args) -> int:
+    import statistics
+    import time
+
+    runs = await db.get_job_runs(time.time() - args.days * 86400)
+    by_job = {}
+    for job_id, scheduled_at, started_at, finished_at, status in runs:
+        by_job.setdefault(job_id, []).append((scheduled_at, started_at, finished_at, status))
+
+    print(f"{'job':<34}{'runs':>6}{'missed':>8}{'failed':>8}{'lag p50':>10}{'lag p95':>10}{'lag max':>10}{'duration':>10}")
+    for job_id, job_runs in sorted(by_job.items()):
+        started = [run for run in job_runs if run[1] is not None]
+        lags = sorted(started_at - scheduled_at for scheduled_at, started_at, _, _ in started)
+        durations = [finished_at - started_at for _, started_at, finished_at, _ in started]
+        missed = sum(run[3] == "missed" for run in job_runs)
+        failed = sum(run[3] == "error" for run in job_runs)
+        if lags:
+            p95 = lags[min(len(lags) - 1, int(len(lags) * 0.95))]
+            timing = f"{statistics.median(lags):>9.1f}s{p95:>9.1f}s{lags[-1]:>9.1f}s{statistics.mean(durations):>9.1f}s"
+        else:
+            timing = f"{'-':>10}" * 4
+        print(f"{job_id:<34}{len(started):>6}{missed:>8}{failed:>8}{timing}")
+    if not by_job:
+        print(f"No job runs recorded in the last {args.days} days.")
+    return 0
+
+
+async def export_data(args) -> int:
+    from utils.transfer import export_file
+
+    count = await export_file(args.user, args.path, args.format)
+    print(f"Exported {count} records to {args.path}.")
+    return 0
+
+
+async def import_data(args) -> int:
+    from utils.transfer import import_file
+
+    stats = await import_file(args.user, args.path, args.format)
+    print(f"Imported {stats['imported']} records, skipped {stats['skipped']}, {stats['invalid']} invalid rows.")
+    return 0
+
+
+TRANSFER_ARGUMENTS = (
+    (("--user",), {"type": int, "required": True, "help": "Telegram user id"}),
+    (("--format",), {"choices": ("csv", "parquet"), "help": "Default: from the file extension"}),
+    (("path",), {"help": "CSV or Parquet file"}),
+)
+
+# name: (handler, help, arguments)
+COMMANDS = {
+    "rebuild-rollups": (rebuild_rollups, "Recompute all rollup tables from the raw data", ()),
+    "check-rollups": (check_rollups, "Compare rollup tables against the raw data", ()),
+    "job-lag": (job_lag, "Lag, duration and misses of scheduled jobs", (
+        (("--days",), {"type": float, "default": 7, "help": "How far back to look (default: 7)"}),
+    )),
+    "export": (export_data, "Stream a user's history to CSV or Parquet", TRANSFER_ARGUMENTS),
+    "import": (import_data, "Bulk-import an export or a bank statement for a user", TRANSFER_ARGUMENTS),
+}
+
+
+async def run(args) -> int:
+    handler = COMMANDS[args.command][0]
+    await db.create_tables()
+    try:
+        return await handler(args)
+    except TransferError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        await db.close()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Tracker bot maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, (_, help_text, arguments) in COMMANDS.items():
+        subparser = subparsers.add_parser(name, help=help_text)
+        for flags, options in arguments:
+            subparser.add_argument(*flags, **options)
+
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+if __name__ == "__main__":
+    main()
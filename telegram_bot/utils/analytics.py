@@ -0,0 +1,231 @@
+import asyncio
+import datetime as dt
+from collections import OrderedDict
+import numpy as np
+from config import ANALYTICS_CACHE_USERS, FUEL_CATEGORY
+from db.manager import db
+from utils.categories import category_key
+from utils.templates import escape
+
+MONTH_NAMES = ("Січ", "Лют", "Бер", "Кві", "Тра", "Чер", "Лип", "Сер", "Вер", "Жов", "Лис", "Гру")
+
+
+class History:
+    # One user's history as columnar arrays. Expenses and salary are append-only and grow by rowid;
+    # mood and mileage are upserted in place and reloaded whole when their fingerprint changes
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.categories = []  # code -> name
+        self._codes = {}
+        self._last_ids = {"expenses": 0, "salary": 0}
+        self._fingerprint = None
+        self._lock = asyncio.Lock()
+
+        self.expense_days = np.empty(0, "datetime64[D]")
+        self.expense_amounts = np.empty(0)
+        self.expense_codes = np.empty(0, np.int32)
+        self.salary_days = np.empty(0, "datetime64[D]")
+        self.salary_amounts = np.empty(0)
+        self.mood_days = np.empty(0, "datetime64[D]")
+        self.mood_values = np.empty(0)
+        self.mileage_days = np.empty(0, "datetime64[D]")
+        self.mileage_values = np.empty(0)
+
+    @property
+    def version(self):
+        # Changes whenever any of the arrays do; usable as a cache key for derived reports
+        return (self._last_ids["expenses"], self._last_ids["salary"], self._fingerprint)
+
+    def _code(self, category: str) -> int:
+        code = self._codes.get(category)
+        if code is None:
+            code = self._codes[category] = len(self.categories)
+            self.categories.append(category)
+        return code
+
+    def code_of(self, name: str):
+        # The code of the category `name` in any spelling ("паливо" for "Паливо"); None if it has no expenses
+        key = category_key(name)
+        for code, category in enumerate(self.categories):
+            if category_key(category) == key:
+                return code
+        return None
+
+    async def refresh(self):
+        async with self._lock:
+            rows = await db.get_history("expenses", self.user_id, self._last_ids["expenses"])
+            if rows:
+                ids, days, amounts, category_ids = zip(*rows)
+                names = await db.get_category_names(category_ids)
+                self.expense_days = np.concatenate((self.expense_days, np.array(days, "datetime64[D]")))
+                self.expense_amounts = np.concatenate((self.expense_amounts, np.array(amounts, float)))
+                codes = np.fromiter((self._code(names[c]) for c in category_ids), np.int32, len(category_ids))
+                self.expense_codes = np.concatenate((self.expense_codes, codes))
+                self._last_ids["expenses"] = ids[-1]
+
+            rows = await db.get_history("salary", self.user_id, self._last_ids["salary"])
+            if rows:
+                ids, days, amounts = zip(*rows)
+                self.salary_days = np.concatenate((self.salary_days, np.array(days, "datetime64[D]")))
+                self.salary_amounts = np.concatenate((self.salary_amounts, np.array(amounts, float)))
+                self._last_ids["salary"] = ids[-1]
+
+            fingerprint = tuple(await db.get_history_fingerprint(self.user_id))
+            if fingerprint != self._fingerprint:
+                self.mood_days, self.mood_values = _columns(await db.get_history("mood", self.user_id))
+                self.mileage_days, self.mileage_values = _columns(await db.get_history("mileage", self.user_id))
+                self._fingerprint = fingerprint
+
+
+def _columns(rows):
+    if not rows:
+        return np.empty(0, "datetime64[D]"), np.empty(0)
+    _, days, values = zip(*rows)
+    return np.array(days, "datetime64[D]"), np.array(values, float)
+
+
+_histories = OrderedDict()
+
+async def get_history(user_id: int) -> History:
+    history = _histories.get(user_id)
+    if history is None:
+        history = _histories[user_id] = History(user_id)
+        if len(_histories) > ANALYTICS_CACHE_USERS:
+            _histories.popitem(last=False)
+    _histories.move_to_end(user_id)
+    await history.refresh()
+    return history
+
+
+# Vectorized building blocks
+
+def in_range(days, start, end):
+    return (days >= start) & (days <= end)
+
+def daily_series(days, values, start, end):
+    # Dense per-day totals from start to end inclusive
+    length = int((end - start).astype(int)) + 1
+    mask = in_range(days, start, end)
+    return np.bincount((days[mask] - start).astype(int), weights=values[mask], minlength=length)
+
+def rolling_mean(series, window: int):
+    # Mean of each trailing `window` days; the first full window ends at index window - 1
+    sums = np.cumsum(np.concatenate(([0.0], series)))
+    return (sums[window:] - sums[:-window]) / window
+
+def by_category(history: History, start, end):
+    mask = in_range(history.expense_days, start, end)
+    totals = np.bincount(history.expense_codes[mask], weights=history.expense_amounts[mask],
+                         minlength=len(history.categories))
+    order = np.argsort(totals)[::-1]
+    return [(history.categories[i], totals[i]) for i in order if totals[i] > 0]
+
+def monthly_by_category(history: History, first_month, months: int):
+    # (months x categories) matrix of spending
+    month_index = (history.expense_days.astype("datetime64[M]") - first_month).astype(int)
+    mask = (month_index >= 0) & (month_index < months)
+    keys = month_index[mask] * len(history.categories) + history.expense_codes[mask]
+    totals = np.bincount(keys, weights=history.expense_amounts[mask], minlength=months * len(history.categories))
+    return totals.reshape(months, len(history.categories))
+
+def monthly_totals(days, values, first_month, months: int):
+    month_index = (days.astype("datetime64[M]") - first_month).astype(int)
+    mask = (month_index >= 0) & (month_index < months)
+    return np.bincount(month_index[mask], weights=values[mask], minlength=months)
+
+def mood_spending_correlation(history: History, start, end):
+    # Pearson correlation between a day's mood and that day's spending, over days with a mood entry
+    mask = in_range(history.mood_days, start, end)
+    if mask.sum() < 3:
+        return None
+    spending = daily_series(history.expense_days, history.expense_amounts, start, end)
+    x = history.mood_values[mask]
+    y = spending[(history.mood_days[mask] - start).astype(int)]
+    if x.std() == 0 or y.std() == 0:
+        return None
+    return float(np.corrcoef(x, y)[0, 1])
+
+def fuel_cost_per_km(history: History, start, end):
+    code = history.code_of(FUEL_CATEGORY)
+    if code is None:
+        return None
+    mask = in_range(history.expense_days, start, end) & (history.expense_codes == code)
+    kilometres = history.mileage_values[in_range(history.mileage_days, start, end)].sum()
+    return float(history.expense_amounts[mask].sum() / kilometres) if kilometres else None
+
+
+# Reports
+
+def _describe_correlation(value) -> str:
+    if value is None:
+        return "замало даних"
+    if value <= -0.3:
+        return f"{value:+.2f} (у гарні дні витрачаєш менше)"
+    if value >= 0.3:
+        return f"{value:+.2f} (у гарні дні витрачаєш більше)"
+    return f"{value:+.2f} (помітного зв'язку немає)"
+
+async def monthly_report(user_id: int, today: dt.date) -> str:
+    history = await get_history(user_id)
+    day = np.datetime64(today, "D")
+    month = day.astype("datetime64[M]")
+    month_start = month.astype("datetime64[D]")
+
+    spent = monthly_totals(history.expense_days, history.expense_amounts, month - 1, 2)
+    salary = monthly_totals(history.salary_days, history.salary_amounts, month, 1)[0]
+    daily = daily_series(history.expense_days, history.expense_amounts, day - 29, day)
+    fuel = fuel_cost_per_km(history, month_start, day)
+    correlation = mood_spending_correlation(history, day - 89, day)
+
+    msg = (
+        f"📊 **Звіт за місяць** ({MONTH_NAMES[today.month - 1]} {today.year}):\n\n"
+        f"💸 Витрачено: {spent[1]:.2f} €"
+    )
+    if spent[0]:
+        msg += f" ({(spent[1] - spent[0]) / spent[0] * 100:+.0f}% до минулого місяця)"
+    msg += (
+        f"\n💰 Зарплата: {salary:.2f} €\n"
+        f"📉 Залишок: {salary - spent[1]:.2f} €\n"
+        f"📆 В середньому за день: {rolling_mean(daily, 7)[-1]:.2f} € (7 днів), "
+        f"{rolling_mean(daily, 30)[-1]:.2f} € (30 днів)\n"
+    )
+    if fuel is not None:
+        msg += f"⛽ Пальне: {fuel:.3f} € / км\n"
+    msg += f"😊 Настрій vs витрати (90 днів): {_describe_correlation(correlation)}\n"
+
+    categories = by_category(history, month_start, day)
+    if categories:
+        msg += "\n🛒 **По категоріях:**\n"
+        msg += "\n".join(f"— {escape(category)}: {total:.2f} €" for category, total in categories)
+    return msg
+
+async def yearly_report(user_id: int, today: dt.date) -> str:
+    history = await get_history(user_id)
+    day = np.datetime64(today, "D")
+    first_month = day.astype("datetime64[M]") - 11
+    start = first_month.astype("datetime64[D]")
+
+    spent = monthly_totals(history.expense_days, history.expense_amounts, first_month, 12)
+    salary = monthly_totals(history.salary_days, history.salary_amounts, first_month, 12)
+    mileage = monthly_totals(history.mileage_days, history.mileage_values, first_month, 12)
+    fuel = fuel_cost_per_km(history, start, day)
+    correlation = mood_spending_correlation(history, start, day)
+
+    msg = "📈 **Звіт за рік** (останні 12 місяців):\n\n"
+    for i in range(12):
+        month = (first_month + i).astype(object)
+        msg += f"{MONTH_NAMES[month.month - 1]} {month.year % 100:02d}: 💸 {spent[i]:.0f} € · 💰 {salary[i]:.0f} € · 🚗 {mileage[i]:.0f} км\n"
+
+    msg += (
+        f"\nРазом: 💸 {spent.sum():.2f} € · 💰 {salary.sum():.2f} € · 📉 {salary.sum() - spent.sum():.2f} €\n"
+        f"В середньому за місяць: {spent.mean():.2f} €\n"
+    )
+    if fuel is not None:
+        msg += f"⛽ Пальне: {fuel:.3f} € / км ({mileage.sum():.0f} км)\n"
+    msg += f"😊 Настрій vs витрати: {_describe_correlation(correlation)}\n"
+
+    categories = by_category(history, start, day)[:5]
+    if categories:
+        msg += "\n🛒 **Топ категорій:**\n"
+        msg += "\n".join(f"— {escape(category)}: {total:.2f} €" for category, total in categories)
+    return msg
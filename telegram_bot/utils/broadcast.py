@@ -0,0 +1,45 @@
+import asyncio
+import logging
+import time
+from aiogram.exceptions import TelegramForbiddenError
+from config import BROADCAST_CONCURRENCY, BROADCAST_SPREAD
+from utils.sender import send_priority, BROADCAST
+
+logger = logging.getLogger(__name__)
+
+def spread_offset(user_id: int, spread: float) -> float:
+    # Multiplicative hash: offsets are even across users and the same for one user every day
+    return (user_id * 2654435761 % 2 ** 32) / 2 ** 32 * spread
+
+async def broadcast(name: str, recipients, deliver, concurrency: int = BROADCAST_CONCURRENCY,
+                    spread: float = BROADCAST_SPREAD):
+    # deliver(user_id, chat_id) sends everything one recipient should get, `spread_offset` seconds
+    # after the start; rate limits and flood retries are handled by utils.sender.outbound
+    from db.manager import db
+
+    semaphore = asyncio.Semaphore(concurrency)
+    failed = 0
+    started = time.monotonic()
+
+    async def run(user_id: int, chat_id: int):
+        nonlocal failed
+        delay = spread_offset(user_id, spread) - (time.monotonic() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        async with semaphore:
+            try:
+                await deliver(user_id, chat_id)
+            except TelegramForbiddenError:
+                # The user blocked the bot; stop sending until they /start again
+                failed += 1
+                await db.deactivate_user(user_id)
+            except Exception:
+                failed += 1
+                logger.exception("Broadcast to %s failed.", chat_id)
+
+    # Queued behind interactive replies
+    with send_priority(BROADCAST):
+        await asyncio.gather(*(run(user_id, chat_id) for user_id, chat_id in recipients))
+
+    logger.info("Broadcast %s: %d recipients, %d failed.", name, len(recipients), failed)
+    return len(recipients) - failed
@@ -0,0 +1,60 @@
+import asyncio
+import logging
+import time
+from utils.metrics import expose
+
+logger = logging.getLogger(__name__)
+
+class TTLCache:
+    # Values are fresh for `ttl` seconds. Concurrent misses for one key share a single fetch, and if a
+    # refresh fails the previous value is served for up to `stale_ttl` more seconds.
+    def __init__(self, name: str, ttl: float, stale_ttl: float = 0):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = {}  # key -> (value, fetched_at)
+        self._inflight = {}  # key -> task
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "stale": 0, "errors": 0}
+        expose(f"bot_cache_{name}", f"Counters of the {name} cache.", self.stats)
+
+    async def get(self, key, fetch, ttl: float = None):
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[1] < (ttl or self.ttl):
+            self.stats["hits"] += 1
+            return entry[0]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["misses"] += 1
+            task = self._inflight[key] = asyncio.ensure_future(self._refresh(key, fetch, ttl or self.ttl))
+        # Shielded so one caller being cancelled does not abort the fetch the others wait on
+        return await asyncio.shield(task)
+
+    async def _refresh(self, key, fetch, ttl: float):
+        try:
+            value = await fetch()
+            self._entries[key] = (value, time.monotonic())
+            return value
+        except Exception as e:
+            self.stats["errors"] += 1
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] < ttl + self.stale_ttl:
+                self.stats["stale"] += 1
+                logger.warning("%s: refresh of %r failed (%s), serving stale value.", self.name, key, e)
+                return entry[0]
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def fresh(self, key, ttl: float = None) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and time.monotonic() - entry[1] < (ttl or self.ttl)
+
+    def put(self, key, value):
+        # For callers that fetch many keys in one upstream request
+        self._entries[key] = (value, time.monotonic())
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,43 @@
+import difflib
+import math
+from config import BUDGET_WARN_AT
+
+# Every user starts with these; the rest are added from the bot (/categories)
+DEFAULT_CATEGORIES = ("Їжа", "Паливо", "Розваги", "Інше")
+FALLBACK_CATEGORY = "Інше"  # Imported rows without one
+MAX_NAME_LENGTH = 32
+
+
+def clean_name(text: str) -> str:
+    return " ".join((text or "").split())[:MAX_NAME_LENGTH]
+
+def category_key(name: str) -> str:
+    # What two spellings of one category have in common: "їжа " and "Їжа" are the same category
+    return clean_name(name).casefold()
+
+def suggest(name: str, names) -> str:
+    # The closest existing name, for a likely typo
+    keys = {category_key(n): n for n in names}
+    matches = difflib.get_close_matches(category_key(name), keys, n=1, cutoff=0.6)
+    return keys[matches[0]] if matches else None
+
+def parse_budget(text: str) -> float:
+    # "250", "250,50" or "0"/"-" to remove the budget (None)
+    text = text.strip()
+    if text in ("-", "0"):
+        return None
+    value = float(text.replace(",", "."))
+    # "nan" would be stored as NULL, silently removing the budget
+    if not math.isfinite(value) or value <= 0:
+        raise ValueError("Budget must be positive")
+    return value
+
+def budget_status(name: str, spent: float, amount: float, budget: float) -> str:
+    # The line under an expense confirmation: what is left this month, or a warning when this expense
+    # crossed one of BUDGET_WARN_AT or the budget itself
+    if spent > budget:
+        return f"🚨 Бюджет «{name}» перевищено на {spent - budget:.2f} € ({spent:.2f} з {budget:.2f} €)"
+    crossed = [share for share in BUDGET_WARN_AT if spent - amount < share * budget <= spent]
+    if crossed:
+        return f"⚠️ Вже {max(crossed):.0%} бюджету «{name}»: лишилось {budget - spent:.2f} з {budget:.2f} €"
+    return f"💶 «{name}»: лишилось {budget - spent:.2f} з {budget:.2f} € на місяць"
@@ -0,0 +1,175 @@
+import asyncio
+import io
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from config import CHART_WORKERS, CHART_CACHE_SIZE
+from utils.metrics import expose
+from utils.analytics import get_history, by_category, monthly_totals, rolling_mean, MONTH_NAMES
+
+# Rendering (runs in the worker processes; everything passed in and out is plain data)
+
+def _warm_up():
+    # Pay for the matplotlib import once per worker instead of on the first chart
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot  # noqa: F401
+
+def _png(fig) -> bytes:
+    import matplotlib.pyplot as plt
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=100, bbox_inches="tight")
+    plt.close(fig)
+    return buffer.getvalue()
+
+def render_categories(title: str, labels, totals) -> bytes:
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(6, 0.5 * len(labels) + 1.5))
+    bars = ax.barh(labels[::-1], totals[::-1], color="#4c72b0")
+    ax.bar_label(bars, fmt="%.0f €", padding=3)
+    ax.set_title(title)
+    ax.set_xlabel("€")
+    ax.spines[["top", "right"]].set_visible(False)
+    return _png(fig)
+
+def render_mood(title: str, days, values, trend) -> bytes:
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(7, 3))
+    ax.scatter(days, values, c=["#55a868" if v else "#c44e52" for v in values], s=12)
+    ax.plot(days[len(days) - len(trend):], trend, color="#4c72b0", label="середнє за 7 записів")
+    ax.set_yticks([0, 1], ["не дуже", "норм"])
+    ax.set_ylim(-0.2, 1.5)
+    ax.set_title(title)
+    ax.legend(loc="upper right", frameon=False)
+    fig.autofmt_xdate()
+    return _png(fig)
+
+def render_mileage(title: str, labels, kilometres) -> bytes:
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(7, 3))
+    ax.plot(labels, kilometres, marker="o", color="#dd8452")
+    ax.fill_between(labels, kilometres, alpha=0.2, color="#dd8452")
+    ax.set_title(title)
+    ax.set_ylabel("км")
+    ax.set_ylim(bottom=0)
+    ax.tick_params(axis="x", labelrotation=45)
+    return _png(fig)
+
+
+# Chart data (runs on the event loop over the cached columnar history; cheap)
+
+def _categories(history, day, days: int = 30):
+    totals = by_category(history, day - (days - 1), day)
+    if not totals:
+        return None
+    labels, values = zip(*totals)
+    return render_categories, (f"Витрати по категоріях, {days} днів", list(labels), list(values))
+
+def _mood(history, day):
+    mask = (history.mood_days >= day - 89) & (history.mood_days <= day)
+    if mask.sum() < 2:
+        return None
+    order = np.argsort(history.mood_days[mask])
+    days, values = history.mood_days[mask][order], history.mood_values[mask][order]
+    trend = rolling_mean(values, 7) if len(values) >= 7 else np.empty(0)
+    return render_mood, ("Настрій, 90 днів", days.astype(object), values.tolist(), trend.tolist())
+
+def _mileage(history, day):
+    first_month = day.astype("datetime64[M]") - 11
+    kilometres = monthly_totals(history.mileage_days, history.mileage_values, first_month, 12)
+    if not kilometres.any():
+        return None
+    labels = [MONTH_NAMES[(first_month + i).astype(object).month - 1] for i in range(12)]
+    return render_mileage, ("Пробіг по місяцях", labels, kilometres.tolist())
+
+CHARTS = {
+    "week": lambda history, day: _categories(history, day, 7),
+    "categories": _categories,
+    "mood": _mood,
+    "mileage": _mileage,
+}
+
+
+# Pool and cache
+
+_pool = None
+_cache = OrderedDict()  # (user_id, kind, today, data version) -> PNG bytes, or None when there is nothing to draw
+_inflight = {}
+stats = {"hits": 0, "misses": 0, "renders": 0}
+expose("bot_chart_cache", "Chart cache counters.", stats)
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # Same start method as the bot's own worker processes: no forked event loop or sqlite threads
+        _pool = ProcessPoolExecutor(CHART_WORKERS, multiprocessing.get_context("spawn"), initializer=_warm_up)
+    return _pool
+
+def _remember(key, png):
+    _cache[key] = png
+    _cache.move_to_end(key)
+    while len(_cache) > CHART_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+async def chart(user_id: int, kind: str, today) -> bytes:
+    # PNG bytes, or None when the user has no data for this chart yet
+    history = await get_history(user_id)
+    day = np.datetime64(today, "D")
+    key = (user_id, kind, day, history.version)
+
+    if key in _cache:
+        stats["hits"] += 1
+        _cache.move_to_end(key)
+        return _cache[key]
+    if key in _inflight:
+        # Someone is already rendering exactly this chart; share the result
+        stats["hits"] += 1
+        return await asyncio.shield(_inflight[key])
+
+    stats["misses"] += 1
+    job = CHARTS[kind](history, day)
+    if job is None:
+        _remember(key, None)
+        return None
+
+    render, args = job
+    future = asyncio.get_running_loop().run_in_executor(_get_pool(), render, *args)
+    _inflight[key] = future
+    try:
+        png = await future
+    except BrokenProcessPool:
+        # A worker died (OOM, killed); start a fresh pool for the next request
+        close()
+        raise
+    finally:
+        del _inflight[key]
+    stats["renders"] += 1
+    _remember(key, png)
+    return png
+
+async def send_charts(bot, chat_id: int, user_id: int, kinds, today):
+    from aiogram.types import BufferedInputFile
+
+    # Rendered concurrently, sent in order; charts without data are left out
+    pngs = await asyncio.gather(*(chart(user_id, kind, today) for kind in kinds))
+    for kind, png in zip(kinds, pngs):
+        if png:
+            await bot.send_photo(chat_id, BufferedInputFile(png, filename=f"{kind}.png"))
+
+def warm_up():
+    # Start the workers ahead of the first request (they import matplotlib on start)
+    pool = _get_pool()
+    for _ in range(CHART_WORKERS):
+        pool.submit(_warm_up)
+
+def close():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
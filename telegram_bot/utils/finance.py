@@ -1,38 +1,125 @@
-import httpx
+import asyncio
+import logging
+from config import RATES_CACHE_TTL, CACHE_STALE_TTL, RATE_SOURCE_TIMEOUT, RATE_FIAT_ASSETS, RATE_CRYPTO_ASSETS
+from utils.cache import TTLCache
+from utils.http import get_json
+
+logger = logging.getLogger(__name__)
+
+# Parsed {asset: rate} per source, so each payload is indexed once per refresh
+rates_cache = TTLCache("rates", RATES_CACHE_TTL, CACHE_STALE_TTL)
+
+ASSET_LABELS = {
+    "USD": "🇺🇸", "EUR": "🇪🇺", "GBP": "🇬🇧", "PLN": "🇵🇱", "CHF": "🇨🇭",
+    "CZK": "🇨🇿", "CAD": "🇨🇦", "JPY": "🇯🇵", "CNY": "🇨🇳", "TRY": "🇹🇷",
+    "BTC": "₿", "ETH": "Ξ", "SOL": "◎", "TON": "💎", "USDT": "₮",
+}
+
+COINGECKO_IDS = {
+    "BTC": "bitcoin", "ETH": "ethereum", "SOL": "solana", "TON": "the-open-network",
+    "USDT": "tether", "BNB": "binancecoin", "XRP": "ripple", "ADA": "cardano",
+    "DOGE": "dogecoin", "LTC": "litecoin",
+}
+
+
+class RateSource:
+    # One upstream: fetch() returns {asset: rate} for the configured assets, quoted in `unit`
+    name = None
+    title = None
+    url = None
+    unit = None
+    number_format = "{:.2f}"
+
+    def __init__(self, assets, timeout: float = RATE_SOURCE_TIMEOUT):
+        self.assets = list(assets)
+        self.timeout = timeout
+
+    def params(self):
+        return None
+
+    def parse(self, payload) -> dict:
+        raise NotImplementedError
+
+    async def fetch(self) -> dict:
+        return self.parse(await get_json(self.url, self.params()))
+
+    def format(self, asset: str, rate: float) -> str:
+        return f"{ASSET_LABELS.get(asset, '•')} {asset}: {self.number_format.format(rate)} {self.unit}"
+
+
+class NBUSource(RateSource):
+    # https://bank.gov.ua/NBUStatService/v1/statdirectory/exchange?json
+    name = "nbu"
+    title = "💰 Курс валют:"
+    url = "https://bank.gov.ua/NBUStatService/v1/statdirectory/exchange?json"
+    unit = "₴"
+
+    def parse(self, payload) -> dict:
+        index = {item['cc']: item['rate'] for item in payload}
+        return {cc: index[cc] for cc in self.assets if cc in index}
+
+
+class CoinGeckoSource(RateSource):
+    # https://api.coingecko.com/api/v3/simple/price?ids=bitcoin,ethereum&vs_currencies=usd
+    name = "coingecko"
+    title = "💎 Крипта:"
+    url = "https://api.coingecko.com/api/v3/simple/price"
+    unit = "$"
+    number_format = "{:,.2f}"
+
+    def _coin_id(self, ticker: str) -> str:
+        return COINGECKO_IDS.get(ticker, ticker.lower())
+
+    def params(self):
+        return {
+            "ids": ",".join(self._coin_id(ticker) for ticker in self.assets),
+            "vs_currencies": "usd"
+        }
+
+    def parse(self, payload) -> dict:
+        return {
+            ticker: payload[self._coin_id(ticker)]['usd']
+            for ticker in self.assets
+            if 'usd' in payload.get(self._coin_id(ticker), {})
+        }
+
+
+SOURCES = [
+    NBUSource(RATE_FIAT_ASSETS),
+    CoinGeckoSource(RATE_CRYPTO_ASSETS),
+]
+
+async def _fetch_source(source: RateSource) -> dict:
+    return await rates_cache.get(source.name, lambda: asyncio.wait_for(source.fetch(), source.timeout))
+
+async def fetch_rates(sources=None) -> dict:
+    # {source name: {asset: rate}} for every source that answered in time; failed sources are left out
+    sources = SOURCES if sources is None else sources
+    results = await asyncio.gather(*(_fetch_source(source) for source in sources), return_exceptions=True)
+
+    rates = {}
+    for source, result in zip(sources, results):
+        if isinstance(result, Exception):
+            logger.warning("Rate source %s failed: %r", source.name, result)
+        else:
+            rates[source.name] = result
+    return rates
 
 async def get_exchange_rates() -> str:
     try:
-        async with httpx.AsyncClient() as client:
-            # 1. Fiat (NBU API for UAH)
-            # https://bank.gov.ua/NBUStatService/v1/statdirectory/exchange?json
-            fiat_url = "https://bank.gov.ua/NBUStatService/v1/statdirectory/exchange?json"
-            fiat_resp = await client.get(fiat_url)
-            fiat_data = fiat_resp.json()
-
-            usd_uah = next((item['rate'] for item in fiat_data if item['cc'] == 'USD'), 0.0)
-            eur_uah = next((item['rate'] for item in fiat_data if item['cc'] == 'EUR'), 0.0)
-
-            # 2. Crypto (CoinGecko API)
-            # https://api.coingecko.com/api/v3/simple/price?ids=bitcoin,ethereum&vs_currencies=usd
-            crypto_url = "https://api.coingecko.com/api/v3/simple/price"
-            crypto_params = {
-                "ids": "bitcoin,ethereum",
-                "vs_currencies": "usd"
-            }
-            crypto_resp = await client.get(crypto_url, params=crypto_params)
-            crypto_data = crypto_resp.json()
-
-            btc_usd = crypto_data.get('bitcoin', {}).get('usd', 0.0)
-            eth_usd = crypto_data.get('ethereum', {}).get('usd', 0.0)
-
-            return (
-                f"💰 Курс валют:\n"
-                f"🇺🇸 USD: {usd_uah:.2f} ₴\n"
-                f"🇪🇺 EUR: {eur_uah:.2f} ₴\n\n"
-                f"💎 Крипта:\n"
-                f"₿ BTC: {btc_usd:,.2f} $\n"
-                f"Ξ ETH: {eth_usd:,.2f} $"
-            )
-
+        rates = await fetch_rates()
     except Exception as e:
         return f"Помилка отримання курсів: {e}"
+
+    if not rates:
+        return "Помилка отримання курсів: жодне джерело не відповіло."
+
+    sections = []
+    for source in SOURCES:
+        if source.name not in rates:
+            sections.append(f"{source.title}\n⚠️ Дані тимчасово недоступні")
+            continue
+        lines = [source.format(asset, rate) for asset, rate in rates[source.name].items()]
+        sections.append("\n".join([source.title, *lines]))
+
+    return "\n\n".join(sections)
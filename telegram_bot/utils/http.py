@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import random
+import time
+import httpx
+from config import (
+    HTTP_TIMEOUT, HTTP_MAX_CONNECTIONS, HTTP_KEEPALIVE_EXPIRY, HTTP_HOST_TIMEOUTS, HTTP_RETRIES, HTTP_BACKOFF,
+    HTTP_BACKOFF_MAX, HTTP_HEDGE_AFTER, BREAKER_FAILURES, BREAKER_RESET,
+)
+from utils.metrics import HTTP_SECONDS, UPSTREAM_EVENTS, Gauge, timed
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401  (installed by httpx[http2])
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+# Worth another attempt: the upstream is overloaded or briefly down, not rejecting the request itself
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_client = None
+
+def get_client() -> httpx.AsyncClient:
+    # One pooled client for every upstream call, so keep-alive connections (and TLS sessions) are reused
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=HTTP2,
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+    return _client
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def _retryable(error: Exception) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRY_STATUSES
+    return isinstance(error, httpx.TransportError)  # Timeouts, refused and dropped connections
+
+
+class CircuitBreaker:
+    # closed: calls go through. After `failures` failed calls in a row it opens and callers fail fast for `reset`
+    # seconds; then it is half-open and lets one probe through, which closes it again or re-opens it
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES, reset: float = BREAKER_RESET):
+        self.name = name
+        self.failures = failures
+        self.reset = reset
+        self.state = "closed"
+        self._failed = 0
+        self._opened_at = 0.0
+
+    def allow(self) -> bool:
+        if self.state == "open" and time.monotonic() - self._opened_at >= self.reset:
+            self.state = "half_open"
+            return True
+        return self.state == "closed"
+
+    def success(self):
+        if self.state != "closed":
+            logger.info("%s is answering again, circuit closed.", self.name)
+        self.state = "closed"
+        self._failed = 0
+
+    def failure(self):
+        self._failed += 1
+        if self.state == "half_open" or (self.state == "closed" and self._failed >= self.failures):
+            logger.warning("%s failed %d calls in a row, not calling it for %.0f s.", self.name, self._failed, self.reset)
+            self.state = "open"
+            self._opened_at = time.monotonic()
+
+    def abandon(self):
+        # A probe cancelled by its caller proves nothing either way; the next call probes again
+        if self.state == "half_open":
+            self.state = "open"
+            self._opened_at = time.monotonic() - self.reset
+
+
+class Upstream:
+    # How one host is called: a timeout per attempt, retries with jittered exponential backoff, an optional
+    # hedged second request and a circuit breaker around the whole call
+    def __init__(self, host: str, timeout: float, retries: int = HTTP_RETRIES, hedge_after: float = HTTP_HEDGE_AFTER):
+        self.host = host
+        self.timeout = timeout
+        self.retries = retries
+        self.hedge_after = hedge_after
+        self.breaker = CircuitBreaker(host)
+
+    async def get_json(self, url: str, params: dict = None):
+        if not self.breaker.allow():
+            UPSTREAM_EVENTS.inc(self.host, "short_circuit")
+            raise CircuitOpenError(f"{self.host} is failing, not called for now")
+        try:
+            data = await self._attempts(url, params)
+        except asyncio.CancelledError:
+            self.breaker.abandon()
+            raise
+        except Exception as e:
+            if isinstance(e, httpx.HTTPStatusError) and not _retryable(e):
+                self.breaker.success()  # It answered; the request was wrong
+            else:
+                UPSTREAM_EVENTS.inc(self.host, "failure")
+                self.breaker.failure()
+            raise
+        self.breaker.success()
+        return data
+
+    async def _attempts(self, url: str, params: dict):
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._hedged(url, params)
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                if attempt == self.retries or not _retryable(e):
+                    raise
+                delay = random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF * 2 ** attempt))
+                UPSTREAM_EVENTS.inc(self.host, "retry")
+                logger.info("%s: %r, retrying in %.2f s.", self.host, e, delay)
+                await asyncio.sleep(delay)
+
+    async def _hedged(self, url: str, params: dict):
+        if not self.hedge_after:
+            return await self._request(url, params)
+
+        # Only for idempotent GETs: whichever copy answers first is used, the other is cancelled
+        tasks = [asyncio.ensure_future(self._request(url, params))]
+        try:
+            done, pending = await asyncio.wait(tasks, timeout=self.hedge_after)
+            if not done:
+                UPSTREAM_EVENTS.inc(self.host, "hedge")
+                tasks.append(asyncio.ensure_future(self._request(url, params)))
+                pending = set(tasks)
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            UPSTREAM_EVENTS.inc(self.host, "hedge_won")
+                        return task.result()
+                if not pending:
+                    raise task.exception()
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()  # Marks a losing copy's failure as seen, so asyncio does not log it
+
+    async def _request(self, url: str, params: dict):
+        with timed(HTTP_SECONDS, "http", self.host):
+            response = await get_client().get(url, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+
+
+_upstreams = {}  # host -> Upstream
+
+Gauge(
+    "bot_upstream_circuit_open", "1 while calls to an upstream host are short-circuited.",
+    lambda: {host: int(upstream.breaker.state != "closed") for host, upstream in _upstreams.items()}, "host"
+)
+
+def upstream(host: str) -> Upstream:
+    if host not in _upstreams:
+        _upstreams[host] = Upstream(host, HTTP_HOST_TIMEOUTS.get(host, HTTP_TIMEOUT))
+    return _upstreams[host]
+
+async def get_json(url: str, params: dict = None):
+    # Labelled and policed by upstream host: one series and one circuit per weather/rate source
+    return await upstream(url.split("/")[2]).get_json(url, params)
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -1,29 +1,43 @@
+from functools import lru_cache
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+from utils.categories import DEFAULT_CATEGORIES
+from utils.payloads import prepared_markup
 
+# Keyboards never change once built (aiogram types are frozen), so each one is built once, shared by every reply
+# and broadcast, and serialized once by utils.payloads.PreparedSession
+
+@lru_cache(maxsize=None)
 def main_menu():
     kb = [
         [KeyboardButton(text="Додати витрату 🛒")],
         [KeyboardButton(text="Показати статистику за тиждень")],
-        [KeyboardButton(text="Останні дані")]
+        [KeyboardButton(text="Звіт за місяць 📊"), KeyboardButton(text="Звіт за рік 📈")],
+        [KeyboardButton(text="Останні дані")],
+        [KeyboardButton(text="Моя локація 📍", request_location=True)]
     ]
-    return ReplyKeyboardMarkup(keyboard=kb, resize_keyboard=True)
+    return prepared_markup(ReplyKeyboardMarkup(keyboard=kb, resize_keyboard=True))
 
-def expense_categories():
-    kb = [
-        [KeyboardButton(text="Їжа"), KeyboardButton(text="Паливо")],
-        [KeyboardButton(text="Розваги"), KeyboardButton(text="Інше")]
-    ]
-    return ReplyKeyboardMarkup(keyboard=kb, resize_keyboard=True, one_time_keyboard=True)
+# One per distinct category set
+@lru_cache(maxsize=1024)
+def _categories_keyboard(categories: tuple):
+    buttons = [KeyboardButton(text=category) for category in categories]
+    kb = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+    return prepared_markup(ReplyKeyboardMarkup(keyboard=kb, resize_keyboard=True, one_time_keyboard=True))
+
+def expense_categories(categories=DEFAULT_CATEGORIES):
+    return _categories_keyboard(tuple(categories))
 
+@lru_cache(maxsize=None)
 def mood_keyboard():
     kb = [
         [InlineKeyboardButton(text="Норм 😊", callback_data="mood_1")],
         [InlineKeyboardButton(text="Не дуже 😞", callback_data="mood_0")]
     ]
-    return InlineKeyboardMarkup(inline_keyboard=kb)
+    return prepared_markup(InlineKeyboardMarkup(inline_keyboard=kb))
 
+@lru_cache(maxsize=None)
 def salary_keyboard():
     kb = [
         [InlineKeyboardButton(text="💰 Ввести зарплату", callback_data="add_salary")]
     ]
-    return InlineKeyboardMarkup(inline_keyboard=kb)
+    return prepared_markup(InlineKeyboardMarkup(inline_keyboard=kb))
@@ -0,0 +1,153 @@
+import inspect
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+# Latency buckets in seconds: sub-millisecond cache hits up to minute-long broadcasts
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+_families = {}  # name -> metric, in registration order
+
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        _families[name] = self
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self._values.items():
+            yield f"{self.name}{_labels(self.labels, labels)} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels=(), buckets=BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [count per bucket (last one is +Inf), sum]
+        _families[name] = self
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.labels, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.labels, labels)} {cumulative}"
+
+
+class Gauge:
+    # Read on every scrape; `read` returns a number, or a dict of {label value: number}
+    def __init__(self, name: str, help: str, read, label: str = None, kind: str = "gauge"):
+        self.name, self.help, self.read, self.label, self.kind = name, help, read, label, kind
+        _families[name] = self
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        value = self.read()
+        if isinstance(value, dict):
+            for key, number in value.items():
+                if isinstance(number, (int, float)):
+                    yield f'{self.name}{{{self.label}="{key}"}} {number}'
+        else:
+            yield f"{self.name} {value}"
+
+
+def expose(name: str, help: str, stats: dict):
+    # The ad-hoc stats dicts kept by the caches, the sender and the write-behind queue, one series per key
+    return Gauge(name, help, lambda: stats, label="stat", kind="untyped")
+
+
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Time spent in an update handler.", ("handler",))
+DB_SECONDS = Histogram("bot_db_seconds", "Time spent in a DatabaseManager call.", ("method",))
+HTTP_SECONDS = Histogram("bot_http_seconds", "Upstream HTTP request time.", ("host",))
+UPSTREAM_EVENTS = Counter(
+    "bot_upstream_events_total", "Upstream retries, hedged requests, failed calls and short circuits.", ("host", "event")
+)
+JOB_SECONDS = Histogram("bot_job_seconds", "Scheduled job run time.", ("job",))
+JOB_LAG_SECONDS = Histogram("bot_job_lag_seconds", "Delay between a job's scheduled and actual start.", ("job",))
+ERRORS = Counter("bot_errors_total", "Exceptions by component and operation.", ("component", "operation"))
+
+# Queue name -> callable returning its current depth; filled in by the modules that own the queues
+QUEUES = {}
+Gauge("bot_queue_depth", "Items waiting in an internal queue.", lambda: {name: read() for name, read in QUEUES.items()}, "queue")
+
+
+@contextmanager
+def timed(histogram: Histogram, component: str, operation: str):
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        # CancelledError is a BaseException: a cancelled call is not counted as an error
+        ERRORS.inc(component, operation)
+        raise
+    finally:
+        histogram.observe(time.perf_counter() - started, operation)
+
+
+def instrument(cls, histogram: Histogram, component: str):
+    # Times every public coroutine method of a class, labelled with the method name
+    for name, method in list(vars(cls).items()):
+        if name.startswith("_") or not inspect.iscoroutinefunction(method):
+            continue
+
+        def wrap(method, name=name):
+            @wraps(method)
+            async def wrapper(*args, **kwargs):
+                with timed(histogram, component, name):
+                    return await method(*args, **kwargs)
+            return wrapper
+
+        setattr(cls, name, wrap(method))
+    return cls
+
+
+def render() -> str:
+    lines = []
+    for family in _families.values():
+        lines.extend(family.render())
+    return "\n".join(lines) + "\n"
+
+
+async def handle_metrics(request):
+    from aiohttp import web
+
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_server(host: str, port: int):
+    # For processes that serve no HTTP of their own (polling, shard workers); webhook apps add the route instead
+    from aiohttp import web
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
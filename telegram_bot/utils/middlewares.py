@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.bases import UNHANDLED
+from config import UPDATE_CONCURRENCY, CHAT_INBOX_SIZE, CHAT_DEBOUNCE
+from utils.metrics import HANDLER_SECONDS, QUEUES, expose, timed
+
+logger = logging.getLogger(__name__)
+
+
+class HandlerTimer(BaseMiddleware):
+    # Inner middleware: runs only once a handler has matched, so the label is the handler's name
+    async def __call__(self, handler, event, data):
+        with timed(HANDLER_SECONDS, "handler", data["handler"].callback.__name__):
+            return await handler(event, data)
+
+
+class _Chat:
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.queued = 0  # Updates holding or waiting for the lock
+        self.pressed = {}  # message -> update id of the last button pressed on it
+        self.warned = False  # Told about dropped messages since the inbox last ran empty
+
+
+def _signature(update):
+    # What makes a repeat of this update: the same button on the same message, or the same command. Other text is
+    # never a repeat: "5" twice in a row can be two real expenses
+    if update.callback_query:
+        query = update.callback_query
+        return "button", query.message.message_id if query.message else query.inline_message_id, query.data
+    if update.message and update.message.text and update.message.text.startswith("/"):
+        return "command", update.message.text
+    return None
+
+
+class ChatInbox(BaseMiddleware):
+    # Outer update middleware, before the FSM one so a handler reads the state its chat's previous update left.
+    # A chat's updates run one after another in arrival order, UPDATE_CONCURRENCY updates at most at a time.
+    # Updates that would only repeat or be overridden do not reach a handler: the same button or command within
+    # `debounce` seconds of the last one, a button press still waiting while a later press on the same message
+    # arrived, and anything once `size` updates of the chat are already running or waiting
+    def __init__(self, concurrency: int = UPDATE_CONCURRENCY, size: int = CHAT_INBOX_SIZE,
+                 debounce: float = CHAT_DEBOUNCE):
+        self.size = size
+        self.debounce = debounce
+        self._slots = asyncio.Semaphore(concurrency)
+        self._chats = {}  # chat id -> _Chat, while it has updates queued
+        self._last = OrderedDict()  # chat id -> (signature, monotonic time) of its latest update, oldest first
+        self.stats = {"handled": 0, "waited": 0, "debounced": 0, "superseded": 0, "dropped": 0}
+        QUEUES["chat_inbox"] = lambda: sum(chat.queued - 1 for chat in self._chats.values())
+        expose("bot_chat_inbox", "Updates run, queued behind their chat, and skipped by the per-chat inbox.", self.stats)
+
+    async def __call__(self, handler, update, data):
+        chat = data.get("event_chat") or data.get("event_from_user")
+        if chat is None:
+            async with self._slots:
+                return await handler(update, data)
+        if self._repeated(chat.id, _signature(update)):
+            self.stats["debounced"] += 1
+            await self._skip(update)
+            return UNHANDLED
+
+        entry = self._chats.get(chat.id)
+        if entry is None:
+            entry = self._chats[chat.id] = _Chat()
+        if entry.queued >= self.size:
+            self.stats["dropped"] += 1
+            await self._skip(update, "⏳ Зачекай, ще обробляю попередні дії.")
+            if update.message and not entry.warned:
+                entry.warned = True
+                await update.message.answer("⏳ Надто швидко — частину повідомлень пропущено. Надішли ще раз за мить.")
+            return UNHANDLED
+
+        query = update.callback_query
+        message = query and (query.message.message_id if query.message else query.inline_message_id)
+        if query:
+            entry.pressed[message] = update.update_id
+        entry.queued += 1
+        if entry.lock.locked():
+            self.stats["waited"] += 1
+        try:
+            async with entry.lock:
+                if query and entry.pressed[message] != update.update_id:
+                    # Tapped again while this press waited: only the latest choice is handled
+                    self.stats["superseded"] += 1
+                    await self._skip(update)
+                    return UNHANDLED
+                async with self._slots:
+                    self.stats["handled"] += 1
+                    return await handler(update, data)
+        finally:
+            entry.queued -= 1
+            if query and entry.pressed.get(message) == update.update_id:
+                del entry.pressed[message]
+            if not entry.queued:
+                del self._chats[chat.id]
+
+    def _repeated(self, key: int, signature) -> bool:
+        now = time.monotonic()
+        # Oldest first, so only entries that are already past the window are looked at
+        while self._last and now - next(iter(self._last.values()))[1] >= self.debounce:
+            self._last.popitem(last=False)
+        previous = self._last.pop(key, None)
+        self._last[key] = (signature, now)
+        return signature is not None and previous is not None and previous[0] == signature
+
+    async def _skip(self, update, text: str = None):
+        # A button press that is not handled still has to be answered, or its button keeps spinning
+        if update.callback_query:
+            try:
+                await update.callback_query.answer(text)
+            except Exception as e:
+                logger.debug("Answering skipped callback %s failed: %s", update.callback_query.id, e)
+
+
+def setup_middlewares(dp):
+    # The dispatcher is created with disable_fsm=True: the FSM middleware goes after the inbox
+    dp.update.outer_middleware(ChatInbox())
+    dp.update.outer_middleware(dp.fsm)
+
+    # Inner middlewares on the dispatcher also wrap the handlers of every included router. Not on "update", whose
+    # handler only dispatches to the event observers (each update would be timed twice), nor on "error"
+    timer = HandlerTimer()
+    for name, observer in dp.observers.items():
+        if name not in ("update", "error"):
+            observer.middleware(timer)
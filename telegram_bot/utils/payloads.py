@@ -0,0 +1,91 @@
+import weakref
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.methods import SendMessage
+from aiohttp import FormData
+
+# id(markup) -> its reply_markup form value (None until the first send encodes it). An entry goes away with its
+# markup, so an id is never mistaken for a later object's
+_markups = {}
+
+
+def prepared_markup(markup):
+    # For keyboards that are built once and reused: PreparedSession encodes them on their first send only
+    if id(markup) not in _markups:
+        _markups[id(markup)] = None
+        weakref.finalize(markup, _markups.pop, id(markup), None)
+    return markup
+
+
+class PreparedSession(AiohttpSession):
+    # build_form_data that skips the per-call model_dump and JSON encoding of registered keyboards,
+    # and of everything but chat_id for a SharedMessage
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.shared = {}  # id(method) -> fields of its SharedMessage, while it is being sent
+        self.stats = {"prepared": 0, "shared": 0}
+
+    def _markup(self, bot, markup):
+        payload = _markups[id(markup)]
+        if payload is None:
+            # Same encoding as the stock path, just done once
+            payload = _markups[id(markup)] = self.prepare_value(markup, bot=bot, files={})
+        return payload
+
+    def fields(self, bot, method, exclude=()) -> list:
+        # (name, value) pairs as build_form_data would send them, or None if the method uploads a file
+        markup = getattr(method, "reply_markup", None)
+        payload = self._markup(bot, markup) if id(markup) in _markups else None
+        exclude = {*exclude, "reply_markup"} if payload else set(exclude)
+        files = {}
+        fields = []
+        for key, value in method.model_dump(warnings=False, exclude=exclude).items():
+            value = self.prepare_value(value, bot=bot, files=files)
+            if value:
+                fields.append((key, value))
+        if files:
+            return None
+        if payload:
+            fields.append(("reply_markup", payload))
+        return fields
+
+    def build_form_data(self, bot, method) -> FormData:
+        shared = self.shared.get(id(method))
+        if shared is not None:
+            self.stats["shared"] += 1
+            fields = [("chat_id", self.prepare_value(method.chat_id, bot=bot, files={})), *shared]
+        elif id(getattr(method, "reply_markup", None)) in _markups:
+            fields = self.fields(bot, method)
+            if fields is None:
+                return super().build_form_data(bot, method)
+            self.stats["prepared"] += 1
+        else:
+            return super().build_form_data(bot, method)
+
+        form = FormData(quote_fields=False)
+        for key, value in fields:
+            form.add_field(key, value)
+        return form
+
+
+class SharedMessage:
+    # One message for many chats (a broadcast, or everyone in one weather cell): validated once and
+    # serialized once on the first send, after which each recipient only adds its chat_id
+    def __init__(self, text: str, **kwargs):
+        self.method = SendMessage(chat_id=0, text=text, **kwargs)
+        self._fields = None
+
+    async def send(self, bot, chat_id: int):
+        method = self.method.model_copy(update={"chat_id": chat_id})
+        session = bot.session
+        if not isinstance(session, PreparedSession):
+            return await bot(method)
+
+        if self._fields is None:
+            self._fields = session.fields(bot, self.method, exclude={"chat_id"})
+        if self._fields is None:
+            return await bot(method)
+        session.shared[id(method)] = self._fields
+        try:
+            return await bot(method)
+        finally:
+            session.shared.pop(id(method), None)
@@ -0,0 +1,202 @@
+import math
+import time
+from bisect import bisect_left, bisect_right, insort
+import numpy as np
+from config import RATE_HISTORY_SIZE, RATE_ALERT_REARM
+from db.manager import db
+from utils.finance import SOURCES, fetch_rates
+
+# asset -> the source that quotes it
+ASSET_SOURCES = {asset: source for source in SOURCES for asset in source.assets}
+
+
+class RingBuffer:
+    # The last `capacity` quotes of one asset in two preallocated float arrays
+    def __init__(self, capacity: int):
+        self.times = np.zeros(capacity)
+        self.values = np.zeros(capacity)
+        self.size = 0
+        self._next = 0
+
+    def append(self, ts: float, value: float):
+        self.times[self._next] = ts
+        self.values[self._next] = value
+        self._next = (self._next + 1) % len(self.values)
+        self.size = min(self.size + 1, len(self.values))
+
+    @property
+    def last(self):
+        return self.values[self._next - 1] if self.size else None
+
+    def at(self, ts: float):
+        # The quote in effect at ts, or None if the buffer does not reach that far back
+        order = np.arange(self._next - self.size, self._next) % len(self.values)
+        index = np.searchsorted(self.times[order], ts, side="right") - 1
+        return self.values[order[index]] if index >= 0 else None
+
+
+class AlertIndex:
+    # Every alert is armed as a price bound: `upper` bounds fire once the price reaches them, `lower` ones once it
+    # falls to them. A tick only looks at the bounds the price moved past, via bisect on two sorted lists per asset.
+    # Bounds with notify=False are re-arm points: "above 45" that fired waits silently for the price to drop
+    # RATE_ALERT_REARM below 45 before it can fire again, so a quote wobbling around 45 sends one message.
+    def __init__(self):
+        self.alerts = {}  # id -> row dict
+        self.upper = {}  # asset -> sorted [(bound, id, notify)]
+        self.lower = {}
+        self._bounds = {}  # id -> [(side, entry)]
+
+    def _arm(self, alert: dict, price: float):
+        asset, kind, value = alert["asset"], alert["kind"], alert["value"]
+        if kind == "move":
+            reference = alert["reference"] = alert["reference"] or price
+            bounds = [("upper", reference * (1 + value / 100), True), ("lower", reference * (1 - value / 100), True)]
+        elif kind == "above":
+            bounds = [("upper", value, True)] if price < value else [("lower", value * (1 - RATE_ALERT_REARM), False)]
+        else:
+            bounds = [("lower", value, True)] if price > value else [("upper", value * (1 + RATE_ALERT_REARM), False)]
+
+        entries = []
+        for side, bound, notify in bounds:
+            entry = (bound, alert["id"], notify)
+            insort(getattr(self, side).setdefault(asset, []), entry)
+            entries.append((side, entry))
+        self._bounds[alert["id"]] = entries
+
+    def _disarm(self, alert_id: int):
+        asset = self.alerts[alert_id]["asset"]
+        for side, entry in self._bounds.pop(alert_id, ()):
+            bounds = getattr(self, side)[asset]
+            del bounds[bisect_left(bounds, entry)]
+
+    def add(self, alert: dict, price: float):
+        if alert["id"] in self.alerts:
+            self.remove(alert["id"])
+        self.alerts[alert["id"]] = alert
+        if price is not None:
+            self._arm(alert, price)
+
+    def remove(self, alert_id: int):
+        if alert_id in self.alerts:
+            self._disarm(alert_id)
+            del self.alerts[alert_id]
+
+    def update(self, asset: str, previous, price: float) -> list:
+        # Alerts that fire at this price; all of them are re-armed around it
+        if previous is None:
+            # First quote since start: arm whatever was waiting for one
+            for alert in self.alerts.values():
+                if alert["asset"] == asset and alert["id"] not in self._bounds:
+                    self._arm(alert, price)
+            return []
+
+        upper, lower = self.upper.get(asset, []), self.lower.get(asset, [])
+        crossed = upper[:bisect_right(upper, (price, float("inf"), True))]
+        crossed += lower[bisect_left(lower, (price, -1, False)):]
+        fired, handled = [], set()
+        for _, alert_id, notify in crossed:
+            if alert_id in handled:
+                continue
+            handled.add(alert_id)
+            alert = self.alerts[alert_id]
+            self._disarm(alert_id)
+            if notify:
+                fired.append((alert, previous))
+                if alert["kind"] == "move":
+                    alert["reference"] = price
+            self._arm(alert, price)
+        return fired
+
+
+class RateMonitor:
+    # Polls every source, keeps a ring buffer per asset, appends changed quotes to rate_quotes and evaluates
+    # the alert index on each tick. Runs in the scheduler's process; alerts created by other processes are
+    # picked up from rate_alerts by updated_at on the next tick
+    def __init__(self, capacity: int = RATE_HISTORY_SIZE):
+        self.capacity = capacity
+        self.buffers = {}
+        self.index = AlertIndex()
+        self._synced = 0.0
+        self._loaded = False
+
+    def buffer(self, asset: str) -> RingBuffer:
+        buffer = self.buffers.get(asset)
+        if buffer is None:
+            buffer = self.buffers[asset] = RingBuffer(self.capacity)
+        return buffer
+
+    async def _load(self):
+        for asset, ts, rate in await db.get_rate_quotes(self.capacity):
+            self.buffer(asset).append(ts, rate)
+        self._loaded = True
+
+    async def _sync_alerts(self):
+        started = time.time()
+        for alert in await db.get_changed_rate_alerts(self._synced):
+            known = self.index.alerts.get(alert["id"])
+            if known is not None and alert["active"] and all(known[key] == alert[key] for key in ("asset", "kind", "value")):
+                continue  # Seen in the overlap; re-adding it would forget where it was armed
+            if alert["active"]:
+                self.index.add(alert, self.buffer(alert["asset"]).last)
+            else:
+                self.index.remove(alert["id"])
+        # A little overlap, so a row committed while we were reading is not skipped
+        self._synced = started - 5
+
+    async def tick(self) -> list:
+        # Returns the alerts that fired as (alert, previous quote, quote)
+        if not self._loaded:
+            await self._load()
+        await self._sync_alerts()
+
+        now = time.time()
+        quotes, fired = [], []
+        for rates in (await fetch_rates()).values():
+            for asset, price in rates.items():
+                buffer = self.buffer(asset)
+                previous = buffer.last
+                if previous is not None and price == previous:
+                    continue
+                buffer.append(now, price)
+                quotes.append((asset, now, price))
+                fired += [(alert, before, price) for alert, before in self.index.update(asset, previous, price)]
+
+        if quotes:
+            await db.add_rate_quotes(quotes)
+        for alert, _, _ in fired:
+            if alert["kind"] == "move":
+                await db.set_rate_alert_reference(alert["id"], alert["reference"])
+        return fired
+
+
+def parse_alert(text: str):
+    # "USD > 42", "BTC < 60000", "ETH 5%" -> (asset, kind, value); ValueError otherwise
+    parts = text.replace(">", " > ").replace("<", " < ").split()
+    if len(parts) == 3 and parts[1] in "<>":
+        asset, kind, value = parts[0].upper(), "above" if parts[1] == ">" else "below", float(parts[2].replace(",", "."))
+    elif len(parts) == 2 and parts[1].endswith("%"):
+        asset, kind, value = parts[0].upper(), "move", float(parts[1].rstrip("%").replace(",", "."))
+    else:
+        raise ValueError(text)
+    # Not finite: "inf" would never fire, "nan" would break the bisect order of AlertIndex
+    if asset not in ASSET_SOURCES or not math.isfinite(value) or value <= 0 or (kind == "move" and value >= 100):
+        raise ValueError(text)
+    return asset, kind, value
+
+
+def describe(alert: dict) -> str:
+    source = ASSET_SOURCES.get(alert["asset"])
+    unit = source.unit if source else ""
+    if alert["kind"] == "move":
+        return f"{alert['asset']}: зміна на {alert['value']:g}%"
+    sign = ">" if alert["kind"] == "above" else "<"
+    return f"{alert['asset']} {sign} {alert['value']:g} {unit}"
+
+
+def format_change(asset: str, price: float, before) -> str:
+    # "🇺🇸 USD: 41.20 ₴ (+0.35%)"; without the percentage when there is nothing to compare with
+    line = ASSET_SOURCES[asset].format(asset, price)
+    return f"{line} ({(price / before - 1) * 100:+.2f}%)" if before else line
+
+
+monitor = RateMonitor()
@@ -0,0 +1,117 @@
+import asyncio
+import contextvars
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from config import (
+    TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST,
+    SEND_MAX_RETRIES, BROADCAST_QUEUE_LIMIT,
+)
+from utils.metrics import QUEUES, expose
+from utils.ratelimit import TokenBucket, KeyedTokenBuckets
+
+logger = logging.getLogger(__name__)
+
+# Lower value is served first
+INTERACTIVE = 0
+BROADCAST = 1
+
+_priority = contextvars.ContextVar("send_priority", default=INTERACTIVE)
+
+@contextmanager
+def send_priority(level: int):
+    # Everything sent inside the block (including tasks started from it) is queued at this level
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class MessageDropped(Exception):
+    pass
+
+
+class OutboundDispatcher(BaseRequestMiddleware):
+    # Session middleware: every Bot API call addressed to a chat waits for its per-chat token, then
+    # for a global token handed out in priority order, so replies overtake queued broadcasts
+    def __init__(self):
+        self.global_bucket = TokenBucket(TELEGRAM_GLOBAL_RATE)
+        self.chat_buckets = KeyedTokenBuckets(TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST)
+        self._queue = asyncio.PriorityQueue()
+        self._order = itertools.count()
+        self._granter = None
+        self.stats = {
+            "sent": 0,
+            "retried": 0,
+            "dropped": 0,
+            "queue_wait_ms_total": 0.0,
+            "send_ms_total": 0.0,
+            "send_ms_max": 0.0,
+        }
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    async def _grant_loop(self):
+        while True:
+            _, _, turn = await self._queue.get()
+            if turn.done():
+                # The caller gave up while waiting
+                continue
+            await self.global_bucket.acquire()
+            if not turn.done():
+                turn.set_result(None)
+
+    async def _wait_turn(self, level: int):
+        if self._granter is None or self._granter.done():
+            self._granter = asyncio.create_task(self._grant_loop())
+
+        turn = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((level, next(self._order), turn))
+        await turn
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            # getUpdates, answerCallbackQuery and friends are not rate limited per chat
+            return await make_request(bot, method)
+
+        level = _priority.get()
+        if level == BROADCAST and self.queue_depth >= BROADCAST_QUEUE_LIMIT:
+            self.stats["dropped"] += 1
+            raise MessageDropped(f"Send queue full ({self.queue_depth}), dropping broadcast to {chat_id}")
+
+        for attempt in range(SEND_MAX_RETRIES + 1):
+            queued = time.perf_counter()
+            await self.chat_buckets.acquire(chat_id)
+            await self._wait_turn(level)
+            started = time.perf_counter()
+
+            try:
+                result = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == SEND_MAX_RETRIES:
+                    self.stats["dropped"] += 1
+                    raise
+                self.stats["retried"] += 1
+                logger.warning("Flood control for chat %s, retrying in %s s.", chat_id, e.retry_after)
+                await asyncio.sleep(e.retry_after)
+                continue
+
+            elapsed = (time.perf_counter() - started) * 1000
+            stats = self.stats
+            stats["sent"] += 1
+            stats["queue_wait_ms_total"] += (started - queued) * 1000
+            stats["send_ms_total"] += elapsed
+            stats["send_ms_max"] = max(stats["send_ms_max"], elapsed)
+            return result
+
+
+outbound = OutboundDispatcher()
+QUEUES["outbound"] = lambda: outbound.queue_depth
+expose("bot_outbound", "Bot API sends, retries and drops.", outbound.stats)
@@ -0,0 +1,127 @@
+import asyncio
+import json
+import logging
+import os
+from utils.metrics import QUEUES
+from utils.updates import UpdateRunner, chat_key
+
+logger = logging.getLogger(__name__)
+
+# Ingress and shard workers talk over one Unix socket per shard, one JSON document per line:
+# the ingress writes raw updates, the worker answers each handled update with an empty line.
+
+
+class ShardBusy(Exception):
+    pass
+
+
+def shard_for(update: dict, shards: int) -> int:
+    # Every update of a chat lands on the same shard, which keeps its FSM steps in order
+    key = chat_key(update)
+    return key % shards if isinstance(key, int) else 0
+
+
+def socket_path(directory: str, index: int) -> str:
+    return os.path.join(directory, f"shard-{index}.sock")
+
+
+async def serve_shard(path: str, runner: UpdateRunner):
+    # Worker side: feed every update from the ingress to the runner and report when it is done
+    async def connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        def done(task):
+            if not writer.is_closing():
+                writer.write(b"\n")
+
+        try:
+            async for line in reader:
+                runner.submit(json.loads(line)).add_done_callback(done)
+        except (asyncio.CancelledError, ConnectionError):
+            # The worker is shutting down or the ingress went away; accepted updates still finish
+            pass
+        writer.close()
+
+    if os.path.exists(path):
+        os.unlink(path)
+    return await asyncio.start_unix_server(connection, path, limit=2 ** 20)
+
+
+class ShardLink:
+    # Ingress side of one shard's socket; `pending` counts updates sent but not yet handled
+    def __init__(self, path: str, max_pending: int):
+        self.path = path
+        self.max_pending = max_pending
+        self.pending = 0
+        self._room = asyncio.Event()
+        self._room.set()
+        self._up = asyncio.Event()  # Connected; cleared while the shard is down or restarting
+        self._reader = self._writer = None
+        self._acks = None
+
+    async def connect(self, timeout: float = 30):
+        # Also reconnects, once the supervisor has restarted the shard behind this socket
+        if self._writer:
+            self._writer.close()
+        deadline = asyncio.get_running_loop().time() + timeout
+        while True:
+            try:
+                self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                # The worker is still starting up
+                if asyncio.get_running_loop().time() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+        self._acks = asyncio.create_task(self._read_acks())
+        self._up.set()
+
+    async def _read_acks(self):
+        try:
+            async for _ in self._reader:
+                self.pending -= 1
+                if self.pending < self.max_pending:
+                    self._room.set()
+        except ConnectionError:
+            pass
+        # Whatever the shard had not handled yet is gone with it; senders wait for the reconnect
+        logger.error("Shard %s closed its socket, %d updates in flight lost.", self.path, self.pending)
+        self._up.clear()
+        self.pending = 0
+        self._room.set()
+
+    async def send(self, update: dict, wait: bool = True):
+        while not self._up.is_set() or self.pending >= self.max_pending:
+            if not wait:
+                raise ShardBusy(self.path)
+            await (self._room.wait() if self._up.is_set() else self._up.wait())
+        self.pending += 1
+        if self.pending >= self.max_pending:
+            self._room.clear()
+        self._writer.write(json.dumps(update, ensure_ascii=False).encode() + b"\n")
+        await self._writer.drain()
+
+    async def close(self):
+        if self._writer:
+            self._writer.close()
+        if self._acks:
+            self._acks.cancel()
+
+
+class ShardRouter:
+    def __init__(self, directory: str, shards: int, max_pending: int):
+        self.links = [ShardLink(socket_path(directory, i), max_pending) for i in range(shards)]
+        for i, link in enumerate(self.links):
+            QUEUES[f"shard_{i}"] = lambda link=link: link.pending
+
+    @property
+    def pending(self) -> int:
+        return sum(link.pending for link in self.links)
+
+    async def connect(self):
+        await asyncio.gather(*(link.connect() for link in self.links))
+
+    async def route(self, update: dict, wait: bool = True):
+        await self.links[shard_for(update, len(self.links))].send(update, wait)
+
+    async def close(self):
+        for link in self.links:
+            await link.close()
@@ -0,0 +1,77 @@
+# Report texts as format strings built once at import, shared by the handlers and the jobs that send them;
+# rendering is one format_map per block and one join, instead of growing the message piece by piece
+
+WEEKLY_STATS = (
+    "📊 **Тижневий звіт** (останні 7 днів):\n\n"
+    "💸 Витрачено: {expenses:.2f} €\n"
+    "💰 Зарплата: {salary:.2f} €\n"
+    "📉 Залишок: {balance:.2f} €\n"
+    "😊 Середній настрій: {mood}%\n"
+    "🚗 Пробіг: {mileage:.1f} км"
+)
+WEEKLY_STATS_CATEGORIES = "\n\n🛒 **По категоріях:**\n"
+WEEKLY_STATS_CATEGORY = "— {0}: {1:.2f} €\n"
+
+WEEKLY_REPORT = (
+    "Тижневий звіт:\n"
+    "— Витрачено: {expenses} €\n"
+    "— Зарплата: {salary} €\n"
+    "— Залишок: {balance} €\n"
+    "— Середній настрій: {mood}%\n"
+    "— Пробіг за тиждень: {mileage} км"
+)
+WEEKLY_REPORT_CATEGORIES = "\n\nПо категоріях:\n"
+WEEKLY_REPORT_CATEGORY = "— {0}: {1:.2f} €"
+
+LAST_DATA = "📋 **Останні записи:**\n\n"
+LAST_DATA_MOOD = "Настрій ({0}): {1}\n"
+LAST_DATA_MILEAGE = "Пробіг ({0}): {1} км\n"
+LAST_DATA_EXPENSES = "\n🛒 **Останні витрати:**\n"
+LAST_DATA_EXPENSE = "— {0}: {1} ({2}€)\n"
+
+
+# Characters that open an entity in legacy Markdown; user text such as category names is escaped before it goes
+# into a Markdown reply, or one "my_food" makes Telegram reject the whole message
+_MARKDOWN = str.maketrans({c: "\\" + c for c in "_*`["})
+
+
+def escape(text: str) -> str:
+    return text.translate(_MARKDOWN)
+
+def _values(stats: dict) -> dict:
+    return {
+        **stats,
+        "balance": stats["salary"] - stats["expenses"],
+        "mood": int(stats["avg_mood"] * 100) if stats["avg_mood"] is not None else 0,
+    }
+
+def weekly_stats(stats: dict, categories) -> str:
+    # The "Показати статистику за тиждень" reply (Markdown)
+    parts = [WEEKLY_STATS.format_map(_values(stats))]
+    if categories:
+        parts.append(WEEKLY_STATS_CATEGORIES)
+        parts.extend(WEEKLY_STATS_CATEGORY.format(escape(category), total) for category, total in categories)
+    return "".join(parts)
+
+def weekly_report(stats: dict, categories) -> str:
+    # The Sunday broadcast (plain text)
+    text = WEEKLY_REPORT.format_map(_values(stats))
+    if categories:
+        text += WEEKLY_REPORT_CATEGORIES + "\n".join(
+            WEEKLY_REPORT_CATEGORY.format(category, total) for category, total in categories
+        )
+    return text
+
+def last_data(data: dict) -> str:
+    # The "Останні дані" reply (Markdown)
+    parts = [LAST_DATA]
+    if data["mood"]:
+        parts.append(LAST_DATA_MOOD.format(data["mood"][0], "😊" if data["mood"][1] == 1 else "😞"))
+    if data["mileage"]:
+        parts.append(LAST_DATA_MILEAGE.format(*data["mileage"]))
+    if data["expenses"]:
+        parts.append(LAST_DATA_EXPENSES)
+        parts.extend(
+            LAST_DATA_EXPENSE.format(date, escape(category), amount) for date, category, amount in data["expenses"]
+        )
+    return "".join(parts)
@@ -0,0 +1,233 @@
+import asyncio
+import codecs
+import csv
+import datetime as dt
+import math
+from itertools import islice
+from config import TRANSFER_CHUNK_SIZE
+from db.manager import db
+from utils.categories import FALLBACK_CATEGORY
+
+# One flat record layout for every table, used by both export and import
+COLUMNS = ("type", "date", "category", "value")
+
+# record type -> (table, export query); each query walks the table's (user_id, date) index
+EXPORTS = {
+    "expense": ("expenses", "SELECT 'expense', e.date, c.name, e.amount FROM expenses e JOIN categories c ON c.id = e.category_id "
+                            "WHERE e.user_id = ? ORDER BY e.date, e.id"),
+    "salary": ("salary", "SELECT 'salary', date, NULL, amount FROM salary WHERE user_id = ? ORDER BY date, id"),
+    "mood": ("mood", "SELECT 'mood', date, NULL, value FROM mood WHERE user_id = ? ORDER BY date"),
+    "mileage": ("mileage", "SELECT 'mileage', date, NULL, value FROM mileage WHERE user_id = ? ORDER BY date"),
+}
+
+FORMATS = ("csv", "parquet")
+
+# Column names of bank statements, matched as substrings of the lower-cased header
+DATE_COLUMNS = ("date", "дата")
+AMOUNT_COLUMNS = ("amount", "сума")
+DESCRIPTION_COLUMNS = ("description", "details", "деталі", "опис", "merchant", "payee", "category", "категорія")
+
+DATE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y", "%d/%m/%Y", "%Y/%m/%d")
+MOOD_VALUES = (0, 1)  # As the mood buttons record it; mood.value has the same CHECK
+
+
+class TransferError(ValueError):
+    pass
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise TransferError("Для Parquet потрібен pyarrow (pip install pyarrow). CSV працює і без нього.")
+    return pyarrow
+
+
+def format_for(path: str, fmt: str = None) -> str:
+    fmt = fmt or ("parquet" if path.lower().endswith(".parquet") else "csv")
+    if fmt not in FORMATS:
+        raise TransferError(f"Невідомий формат: {fmt}. Підтримуються: {', '.join(FORMATS)}.")
+    return fmt
+
+
+# Export
+
+async def export_chunks(user_id: int, types=None):
+    for record_type in types or EXPORTS:
+        _, sql = EXPORTS[record_type]
+        async for rows in db.stream(sql, (user_id,)):
+            yield rows
+
+
+async def _write_csv(chunks, path: str) -> int:
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        async for rows in chunks:
+            # File I/O off the event loop, one chunk at a time
+            await asyncio.to_thread(writer.writerows, rows)
+            count += len(rows)
+    return count
+
+
+async def _write_parquet(chunks, path: str) -> int:
+    pa = _pyarrow()
+    schema = pa.schema([("type", pa.string()), ("date", pa.string()), ("category", pa.string()), ("value", pa.float64())])
+    count = 0
+    with pa.parquet.ParquetWriter(path, schema) as writer:
+        async for rows in chunks:
+            # Every chunk becomes one row group
+            columns = [list(column) for column in zip(*rows)]
+            columns[3] = [float(value) if value is not None else None for value in columns[3]]
+            await asyncio.to_thread(writer.write_table, pa.Table.from_arrays(columns, schema=schema))
+            count += len(rows)
+    return count
+
+
+async def export_file(user_id: int, path: str, fmt: str = None, types=None) -> int:
+    fmt = format_for(path, fmt)
+    chunks = export_chunks(user_id, types)
+    if fmt == "parquet":
+        return await _write_parquet(chunks, path)
+    return await _write_csv(chunks, path)
+
+
+# Import
+
+def parse_date(value: str) -> str:
+    # Accepts ISO dates and the usual statement formats, with or without a time part
+    value = value.strip().split(" ")[0].split("T")[0]
+    if len(value) == 10 and value[4] == "-":
+        return dt.date.fromisoformat(value).isoformat()  # Rejects 2024-13-99
+    for fmt in DATE_FORMATS:
+        try:
+            return dt.datetime.strptime(value, fmt).date().isoformat()
+        except ValueError:
+            continue
+    raise ValueError(f"bad date {value!r}")
+
+
+def parse_amount(value) -> float:
+    if isinstance(value, (int, float)):
+        value = float(value)
+    else:
+        # "1 234,56" with plain or non-breaking spaces as thousands separators
+        value = float(value.replace(" ", "").replace("\u00a0", "").replace(",", "."))
+    if not math.isfinite(value):  # "nan" and "inf" parse as floats too
+        raise ValueError(f"bad amount {value!r}")
+    return value
+
+
+def _find(header, names):
+    for column in header:
+        if any(name in column.lower() for name in names):
+            return column
+    return None
+
+
+def record_parser(header, user_id: int):
+    # (parse, own layout). Rows in our own export layout are taken as they are, and their categories may be
+    # created; anything else is read as a bank statement, where outgoing (negative) amounts become expenses,
+    # incoming ones are skipped and a description that is not one of the user's categories counts as FALLBACK_CATEGORY
+    header = [column for column in header if column]
+    if {"type", "date", "value"} <= set(header):
+        def parse(row):
+            record_type, date, value = row["type"], parse_date(row["date"]), parse_amount(row["value"])
+            if value < 0:
+                # amount/value >= 0 is a CHECK on every table: one such row would fail its whole chunk
+                raise ValueError(f"negative value {value!r}")
+            if record_type == "expense":
+                return "expenses", (user_id, date, row.get("category") or FALLBACK_CATEGORY, value)
+            if record_type == "salary":
+                return "salary", (user_id, date, value)
+            if record_type == "mood":
+                if value not in MOOD_VALUES:
+                    raise ValueError(f"bad mood {value!r}")
+                return "mood", (user_id, date, int(value))
+            if record_type == "mileage":
+                return "mileage", (user_id, date, value)
+            raise ValueError(f"unknown type {record_type!r}")
+        return parse, True
+
+    date_column, amount_column = _find(header, DATE_COLUMNS), _find(header, AMOUNT_COLUMNS)
+    description_column = _find(header, DESCRIPTION_COLUMNS)
+    if not date_column or not amount_column:
+        raise TransferError("Не знайшов колонок з датою та сумою. Потрібні type,date,category,value або виписка банку.")
+
+    def parse(row):
+        amount = parse_amount(row[amount_column])
+        if amount >= 0:
+            return None
+        category = (row.get(description_column) or "").strip() if description_column else ""
+        return "expenses", (user_id, parse_date(row[date_column]), category or FALLBACK_CATEGORY, -amount)
+    return parse, False
+
+
+def _csv_encoding(path: str) -> str:
+    # UTF-8 (with or without a BOM) if the whole file decodes as such, otherwise cp1251, which many Ukrainian
+    # banks still export. Checked up front, so a bad byte deep in the file cannot stop an import halfway
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with open(path, "rb") as f:
+        try:
+            for block in iter(lambda: f.read(1 << 16), b""):
+                decoder.decode(block)
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            return "cp1251"
+    return "utf-8-sig"
+
+
+def _csv_rows(path: str):
+    # cp1251 leaves a few bytes undefined: those become U+FFFD instead of failing the import
+    with open(path, newline="", encoding=_csv_encoding(path), errors="replace") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.DictReader(f, dialect=dialect)
+        yield reader.fieldnames or []
+        yield from reader
+
+
+def _parquet_rows(path: str):
+    pa = _pyarrow()
+    parquet = pa.parquet.ParquetFile(path)
+    yield parquet.schema_arrow.names
+    for batch in parquet.iter_batches(batch_size=TRANSFER_CHUNK_SIZE):
+        yield from batch.to_pylist()
+
+
+def _records(rows, parse, stats: dict):
+    for row in rows:
+        try:
+            record = parse(row)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            stats["invalid"] += 1
+            continue
+        if record is None:
+            stats["skipped"] += 1
+        else:
+            yield record
+
+
+async def import_file(user_id: int, path: str, fmt: str = None) -> dict:
+    # Generator pipeline: file rows -> parsed records -> chunks, each chunk committed in one transaction
+    rows = _parquet_rows(path) if format_for(path, fmt) == "parquet" else _csv_rows(path)
+    stats = {"imported": 0, "skipped": 0, "invalid": 0}
+    # The header is read (and a parquet file opened) off the event loop, like the rows after it
+    parse, own_layout = await asyncio.to_thread(lambda: record_parser(next(rows), user_id))
+    records = _records(rows, parse, stats)
+
+    while True:
+        chunk = await asyncio.to_thread(lambda: list(islice(records, TRANSFER_CHUNK_SIZE)))
+        if not chunk:
+            break
+        by_table = {}
+        for table, params in chunk:
+            by_table.setdefault(table, []).append(params)
+        stats["imported"] += await db.bulk_insert(by_table, create_categories=own_layout)
+    return stats
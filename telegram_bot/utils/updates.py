@@ -0,0 +1,57 @@
+import asyncio
+import logging
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from utils.metrics import QUEUES, expose
+
+logger = logging.getLogger(__name__)
+
+
+def chat_key(update: dict):
+    # The chat (or, failing that, the user) an update belongs to, read from the raw payload
+    for event in update.values():
+        if isinstance(event, dict):
+            chat = event.get("chat") or (event.get("message") or {}).get("chat")
+            if chat:
+                return chat["id"]
+            if "from" in event:
+                return event["from"]["id"]
+    return None
+
+
+class UpdateRunner:
+    # Feeds raw updates to the dispatcher in background tasks, started in arrival order. The dispatcher's
+    # ChatInbox (utils/middlewares.py) runs a chat's updates one after another and limits how many run at once
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, **data):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.data = data
+        self._tasks = set()
+        self.stats = {"handled": 0, "failed": 0}
+        QUEUES["updates"] = lambda: self.pending
+        expose("bot_updates", "Updates handled in the background.", self.stats)
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    def submit(self, update: dict) -> asyncio.Task:
+        task = asyncio.create_task(self._run(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run(self, update: dict):
+        try:
+            result = await self.dispatcher.feed_raw_update(self.bot, update, **self.data)
+            if isinstance(result, TelegramMethod):
+                await self.dispatcher.silent_call_request(self.bot, result)
+            self.stats["handled"] += 1
+        except Exception:
+            # Whoever delivered the update already has its acknowledgement, so a failure can only be logged
+            self.stats["failed"] += 1
+            logger.exception("Update %s failed.", update.get("update_id"))
+
+    async def drain(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -1,101 +1,120 @@
-import httpx
-from config import LATITUDE, LONGITUDE
-
-async def get_weather() -> str:
-    url = "https://api.open-meteo.com/v1/forecast"
-    params = {
-        "latitude": LATITUDE,
-        "longitude": LONGITUDE,
-        "current": "temperature_2m,weather_code,wind_speed_10m",
-        "timezone": "auto"
+import asyncio
+import logging
+from config import (
+    LATITUDE, LONGITUDE, WEATHER_CACHE_TTL, FORECAST_CACHE_TTL, CACHE_STALE_TTL,
+    WEATHER_GRID_STEP, WEATHER_BATCH_SIZE,
+)
+from utils.cache import TTLCache
+from utils.http import get_json
+
+logger = logging.getLogger(__name__)
+
+URL = "https://api.open-meteo.com/v1/forecast"
+
+# Both caches are keyed by grid cell, so nearby users share one upstream result
+weather_cache = TTLCache("weather", WEATHER_CACHE_TTL, CACHE_STALE_TTL)
+forecast_cache = TTLCache("forecast", FORECAST_CACHE_TTL, CACHE_STALE_TTL)
+
+CURRENT_PARAMS = {
+    "current": "temperature_2m,weather_code,wind_speed_10m",
+    "timezone": "auto"
+}
+
+FORECAST_PARAMS = {
+    "daily": "weather_code,temperature_2m_max,temperature_2m_min",
+    "timezone": "auto",
+    "forecast_days": 2
+}
+
+def grid_cell(latitude: float = LATITUDE, longitude: float = LONGITUDE):
+    # Snap to the centre of a WEATHER_GRID_STEP-degree cell (0.1° is roughly 11 km)
+    return (
+        round(round(latitude / WEATHER_GRID_STEP) * WEATHER_GRID_STEP, 4),
+        round(round(longitude / WEATHER_GRID_STEP) * WEATHER_GRID_STEP, 4),
+    )
+
+def _coordinates(cells) -> dict:
+    return {
+        "latitude": ",".join(str(lat) for lat, _ in cells),
+        "longitude": ",".join(str(lon) for _, lon in cells),
     }
 
+async def _fetch_one(cell, params: dict):
+    return await get_json(URL, {**_coordinates([cell]), **params})
+
+async def _prefetch(cells, cache: TTLCache, params: dict):
+    missing = [cell for cell in set(cells) if not cache.fresh(cell)]
+
+    async def fetch_batch(batch):
+        try:
+            data = await get_json(URL, {**_coordinates(batch), **params})
+        except Exception as e:
+            # Cells from a failed batch fall back to their own request (or stale value) on lookup
+            logger.warning("Weather batch of %d locations failed: %s", len(batch), e)
+            return
+        # Open-Meteo answers a list for several coordinates and a single object for one
+        for cell, location in zip(batch, data if isinstance(data, list) else [data]):
+            cache.put(cell, location)
+
+    batches = [missing[i:i + WEATHER_BATCH_SIZE] for i in range(0, len(missing), WEATHER_BATCH_SIZE)]
+    await asyncio.gather(*(fetch_batch(batch) for batch in batches))
+
+async def prefetch_weather(cells):
+    await _prefetch(cells, weather_cache, CURRENT_PARAMS)
+
+async def prefetch_forecast(cells):
+    await _prefetch(cells, forecast_cache, FORECAST_PARAMS)
+
+def describe_weather(code: int):
+    # WMO Weather interpretation codes (simplified)
+    # https://open-meteo.com/en/docs
+    if code == 0:
+        return "Sunny", "☀️" # Clear sky
+    elif code in [1, 2, 3]:
+        return "Cloudy", "☁️"
+    elif code in [45, 48]:
+        return "Foggy", "🌫️"
+    elif code in [51, 53, 55, 61, 63, 65, 80, 81, 82]:
+        return "Rain", "🌧️"
+    elif code in [71, 73, 75, 77, 85, 86]:
+        return "Snow", "❄️"
+    elif code in [95, 96, 99]:
+        return "Storm", "⛈️" # Thunderstorm
+    else:
+        return "Normal", "🌡"
+
+async def get_weather(cell=None) -> str:
+    cell = cell or grid_cell()
+
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-
-            current = data.get("current", {})
-            temp = current.get("temperature_2m", "N/A")
-            wind = current.get("wind_speed_10m", "N/A")
-            code = current.get("weather_code", 0)
-
-            # WMO Weather interpretation codes (simplified)
-            # https://open-meteo.com/en/docs
-            if code == 0:
-                emoji = "☀️" # Clear sky
-                desc = "Sunny"
-            elif code in [1, 2, 3]:
-                emoji = "☁️" # Cloudy
-                desc = "Cloudy"
-            elif code in [45, 48]:
-                emoji = "🌫️" # Fog
-                desc = "Foggy"
-            elif code in [51, 53, 55, 61, 63, 65, 80, 81, 82]:
-                emoji = "🌧️" # Rain
-                desc = "Rain"
-            elif code in [71, 73, 75, 77, 85, 86]:
-                emoji = "❄️" # Snow
-                desc = "Snow"
-            elif code in [95, 96, 99]:
-                emoji = "⛈️" # Thunderstorm
-                desc = "Storm"
-            else:
-                emoji = "🌡"
-                desc = "Normal"
-
-            return f"Погода сьогодні: {desc} {emoji}, 🌡 {temp}°C, 💨 {wind} км/год"
+        data = await weather_cache.get(cell, lambda: _fetch_one(cell, CURRENT_PARAMS))
+
+        current = data.get("current", {})
+        temp = current.get("temperature_2m", "N/A")
+        wind = current.get("wind_speed_10m", "N/A")
+        desc, emoji = describe_weather(current.get("weather_code", 0))
+
+        return f"Погода сьогодні: {desc} {emoji}, 🌡 {temp}°C, 💨 {wind} км/год"
 
     except Exception as e:
-        return f"Не вдалося отримати погоду: {e}"
-
-async def get_weather_forecast() -> str:
-    url = "https://api.open-meteo.com/v1/forecast"
-    params = {
-        "latitude": LATITUDE,
-        "longitude": LONGITUDE,
-        "daily": "weather_code,temperature_2m_max,temperature_2m_min",
-        "timezone": "auto",
-        "forecast_days": 2
-    }
+        logger.warning("Weather for %s unavailable: %r", cell, e)
+        return "Не вдалося отримати погоду, спробуй трохи пізніше."
+
+async def get_weather_forecast(cell=None) -> str:
+    cell = cell or grid_cell()
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-
-            daily = data.get("daily", {})
-            # Index 1 is tomorrow (0 is today)
-            code = daily.get("weather_code", [0, 0])[1]
-            temp_max = daily.get("temperature_2m_max", [0, 0])[1]
-            temp_min = daily.get("temperature_2m_min", [0, 0])[1]
-
-            # WMO Weather interpretation codes (simplified)
-            if code == 0:
-                emoji = "☀️"
-                desc = "Sunny"
-            elif code in [1, 2, 3]:
-                emoji = "☁️"
-                desc = "Cloudy"
-            elif code in [45, 48]:
-                emoji = "🌫️"
-                desc = "Foggy"
-            elif code in [51, 53, 55, 61, 63, 65, 80, 81, 82]:
-                emoji = "🌧️"
-                desc = "Rain"
-            elif code in [71, 73, 75, 77, 85, 86]:
-                emoji = "❄️"
-                desc = "Snow"
-            elif code in [95, 96, 99]:
-                emoji = "⛈️"
-                desc = "Storm"
-            else:
-                emoji = "🌡"
-                desc = "Normal"
-
-            return f"Прогноз на завтра: {desc} {emoji}, 🌡 {temp_min}°C ... {temp_max}°C"
+        data = await forecast_cache.get(cell, lambda: _fetch_one(cell, FORECAST_PARAMS))
+
+        daily = data.get("daily", {})
+        # Index 1 is tomorrow (0 is today)
+        code = daily.get("weather_code", [0, 0])[1]
+        temp_max = daily.get("temperature_2m_max", [0, 0])[1]
+        temp_min = daily.get("temperature_2m_min", [0, 0])[1]
+        desc, emoji = describe_weather(code)
+
+        return f"Прогноз на завтра: {desc} {emoji}, 🌡 {temp_min}°C ... {temp_max}°C"
 
     except Exception as e:
-        return f"Не вдалося отримати прогноз: {e}"
+        logger.warning("Forecast for %s unavailable: %r", cell, e)
+        return "Не вдалося отримати прогноз, спробуй трохи пізніше."
@@ -0,0 +1,70 @@
+import secrets
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from config import WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_MAX_PENDING
+from utils.metrics import expose, handle_metrics
+from utils.shards import ShardBusy
+from utils.updates import UpdateRunner
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    # Acknowledges every update at once and hands it to an UpdateRunner; past `max_pending`
+    # Telegram is asked to retry later
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, max_pending: int = WEBHOOK_MAX_PENDING, **kwargs):
+        super().__init__(dispatcher, bot, handle_in_background=True, secret_token=WEBHOOK_SECRET, **kwargs)
+        self.max_pending = max_pending
+        self.runner = UpdateRunner(dispatcher, bot, **kwargs)
+        self.stats = {"accepted": 0, "rejected": 0}
+
+    @property
+    def pending(self) -> int:
+        return self.runner.pending
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request):
+        if self.pending >= self.max_pending:
+            self.stats["rejected"] += 1
+            return web.Response(status=503, headers={"Retry-After": "1"})
+        self.stats["accepted"] += 1
+        self.runner.submit(await request.json(loads=bot.session.json_loads))
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def close(self):
+        # Let accepted updates finish before the session closes
+        await self.runner.drain()
+        await super().close()
+
+
+def create_app(dp: Dispatcher, bot: Bot, **kwargs) -> web.Application:
+    app = web.Application()
+    handler = BoundedRequestHandler(dp, bot, **kwargs)
+    handler.register(app, path=WEBHOOK_PATH)
+    app["webhook_handler"] = handler
+    expose("bot_webhook", "Webhook requests accepted and turned away.", handler.stats)
+    app.router.add_get("/metrics", handle_metrics)
+    # Lets the proxy (and the load test) tell a live worker from a dead one
+    app.router.add_get("/healthz", lambda request: web.json_response(
+        {"pending": handler.pending, **handler.stats, **handler.runner.stats}
+    ))
+    return app
+
+
+def create_ingress_app(router) -> web.Application:
+    # BOT_MODE=sharded: acknowledge and forward to the chat's shard, or ask Telegram to retry if it is full
+    async def receive(request: web.Request):
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if WEBHOOK_SECRET and not secrets.compare_digest(token, WEBHOOK_SECRET):
+            return web.Response(body="Unauthorized", status=401)
+        try:
+            await router.route(await request.json(), wait=False)
+        except ShardBusy:
+            return web.Response(status=503, headers={"Retry-After": "1"})
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, receive)
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/healthz", lambda request: web.json_response(
+        {"pending": router.pending, "shards": [link.pending for link in router.links]}
+    ))
+    return app